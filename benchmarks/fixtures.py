@@ -0,0 +1,72 @@
+"""
+Deterministic fixtures for the benchmark suite.
+Builds synthetic model responses and concept histories from a fixed seed.
+"""
+
+import random
+from typing import List
+
+
+WORDS = [
+    "adaptive", "agentic", "alignment", "attention", "autonomous", "bayesian", "causal",
+    "cognitive", "compression", "contrastive", "diffusion", "distillation", "edge",
+    "embedding", "federated", "generative", "graph", "hierarchical", "interpretable",
+    "latent", "memory", "multimodal", "neural", "neuromorphic", "optimization",
+    "probabilistic", "quantum", "reasoning", "reinforcement", "retrieval", "robust",
+    "sparse", "symbolic", "synthetic", "temporal", "transformer", "uncertainty",
+]
+
+
+def concept_titles(count: int, seed: int = 42) -> List[str]:
+    """
+    Generate plausible concept titles
+
+    Args:
+        count: Number of titles
+        seed: Random seed
+
+    Returns:
+        List of titles
+    """
+    rng = random.Random(seed)
+    return [
+        " ".join(word.capitalize() for word in rng.sample(WORDS, rng.randint(2, 5))) + f" {i}"
+        for i in range(count)
+    ]
+
+
+def model_response(concepts: int, seed: int = 7) -> str:
+    """
+    Generate a response shaped like the completion API output
+
+    Args:
+        concepts: Number of concept sections
+        seed: Random seed
+
+    Returns:
+        Markdown-like response text
+    """
+    rng = random.Random(seed)
+
+    def sentence() -> str:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+        if rng.random() < 0.5:
+            i = rng.randrange(len(words))
+            words[i] = f"**{words[i]}**"
+        return " ".join(words).capitalize() + "."
+
+    parts = [f"Here are {concepts} new AI concepts for today.", ""]
+    for number, title in enumerate(concept_titles(concepts, seed), start=1):
+        parts.append(f"## {number}. {title}")
+        parts.append("")
+        parts.append(f"**Definition:** {sentence()} {sentence()}")
+        parts.append("")
+        parts.append("### Key Points")
+        parts.extend(f"- {sentence()}" for _ in range(3))
+        parts.append("")
+        parts.append("**Practical Applications**")
+        parts.extend(f"- {sentence()}" for _ in range(2))
+        parts.append("")
+        parts.append(f"**Example:** {sentence()}")
+        parts.append("")
+    return "\n".join(parts)
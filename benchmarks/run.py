@@ -0,0 +1,314 @@
+"""
+Microbenchmark suite for the pipeline's hot functions.
+
+Runs offline against deterministic fixtures and compares medians with the
+recorded baselines in baselines.json.
+
+Usage:
+    python benchmarks/run.py                    # run and check against baselines
+    python benchmarks/run.py --full             # include 10^6-entry storage runs
+    python benchmarks/run.py --update-baseline  # record new baselines
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Add src directory to path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, '..', 'src'))
+sys.path.insert(0, ROOT)
+
+from ai_generator import AIConceptGenerator  # noqa: E402
+from email_sender import PreparedBody  # noqa: E402
+from email_template import EmailTemplate  # noqa: E402
+from metrics import metrics  # noqa: E402
+from search import ConceptIndex  # noqa: E402
+from storage import ConceptStorage  # noqa: E402
+from fixtures import concept_titles, model_response  # noqa: E402
+
+
+BASELINE_FILE = os.path.join(ROOT, 'baselines.json')
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+FULL_SIZES = DEFAULT_SIZES + (10 ** 6,)
+DEFAULT_THRESHOLD = 1.5
+
+# A case is a name plus a factory returning (timed callable, cleanup callable)
+Case = Tuple[str, Callable[[], Tuple[Callable[[], object], Callable[[], None]]]]
+
+
+def _no_cleanup():
+    pass
+
+
+def _parsing_cases(response_concepts: int) -> List[Case]:
+    response = model_response(response_concepts)
+
+    def format_content():
+        return lambda: EmailTemplate._format_content(response), _no_cleanup
+
+    def extract_titles():
+        return lambda: AIConceptGenerator.extract_concept_titles(response, limit=10 ** 9), _no_cleanup
+
+    def create_html_email():
+        return lambda: EmailTemplate.create_html_email(response, date="January 01, 2026"), _no_cleanup
+
+    def mime_serialization():
+        html = EmailTemplate.create_html_email(response, date="January 01, 2026")
+        return (lambda: PreparedBody.from_html(html).message_bytes("from@example.com", "to@example.com",
+                                                                   "Subject"),
+                _no_cleanup)
+
+    def prepared_message():
+        # Per-recipient cost once the issue body is encoded
+        body = PreparedBody.from_template(EmailTemplate.compiled_issue(response, date="January 01, 2026"))
+        slots = EmailTemplate.recipient_slots("Ada Lovelace")
+        return (lambda: body.message_bytes("from@example.com", "to@example.com", "Subject", **slots),
+                _no_cleanup)
+
+    return [
+        (f"format_content[{response_concepts}]", format_content),
+        (f"extract_concept_titles[{response_concepts}]", extract_titles),
+        (f"create_html_email[{response_concepts}]", create_html_email),
+        (f"mime_serialization[{response_concepts}]", mime_serialization),
+        (f"prepared_message[{response_concepts}]", prepared_message),
+    ]
+
+
+def _storage_cases(sizes: Sequence[int], backends: Sequence[str]) -> List[Case]:
+    cases: List[Case] = []
+    new_concepts = concept_titles(5, seed=99)
+
+    for backend in backends:
+        for size in sizes:
+            def prepared(size=size, backend=backend):
+                directory = tempfile.mkdtemp(prefix='bench-storage-')
+                storage = ConceptStorage(os.path.join(directory, 'concepts.json'), backend=backend)
+                storage.save_concepts(concept_titles(size))
+
+                def cleanup():
+                    storage.close()
+                    shutil.rmtree(directory, ignore_errors=True)
+
+                return storage, cleanup
+
+            def add_concepts(size=size, prepared=prepared):
+                storage, cleanup = prepared()
+                return lambda: storage.add_concepts(new_concepts, max_stored=size), cleanup
+
+            def get_recent(prepared=prepared):
+                storage, cleanup = prepared()
+                return lambda: storage.get_recent_concepts(count=50), cleanup
+
+            cases.append((f"storage.{backend}.add_concepts[{size}]", add_concepts))
+            cases.append((f"storage.{backend}.get_recent_concepts[{size}]", get_recent))
+    return cases
+
+
+def _search_cases(issues: int) -> List[Case]:
+    def prepared():
+        directory = tempfile.mkdtemp(prefix='bench-search-')
+        index = ConceptIndex(os.path.join(directory, 'search.db'))
+        for day in range(issues):
+            index.add_issue(f"day-{day:05d}", model_response(5, seed=day))
+
+        def cleanup():
+            index.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        return index, cleanup
+
+    def search():
+        index, cleanup = prepared()
+        return lambda: index.search("sparse retrieval transformer", limit=10), cleanup
+
+    def add_issue():
+        index, cleanup = prepared()
+        response = model_response(5, seed=issues)
+        # The same issue again under a new date each call, so every call indexes 5 concepts
+        days = iter(range(issues, 10 ** 9))
+        return lambda: index.add_issue(f"day-{next(days):05d}", response), cleanup
+
+    return [
+        (f"search.query[{issues}]", search),
+        (f"search.add_issue[{issues}]", add_issue),
+    ]
+
+
+def build_cases(sizes: Sequence[int] = DEFAULT_SIZES, response_concepts: int = 200,
+                backends: Sequence[str] = ('json', 'sqlite'), search_issues: int = 1825) -> List[Case]:
+    """
+    Build every benchmark case
+
+    Args:
+        sizes: History sizes for the storage benchmarks
+        response_concepts: Concept sections in the synthetic response
+        backends: Storage backends to benchmark
+        search_issues: Indexed issues for the search benchmarks (1825 = 5 years)
+
+    Returns:
+        List of (name, factory) cases
+    """
+    return (_parsing_cases(response_concepts) + _storage_cases(sizes, backends)
+            + _search_cases(search_issues))
+
+
+def measure(func: Callable[[], object], repeat: int = 5, min_time: float = 0.05) -> Dict[str, float]:
+    """
+    Time a callable, looping enough times per sample to exceed min_time
+
+    Args:
+        func: Callable to time
+        repeat: Number of samples
+        min_time: Minimum duration of one sample in seconds
+
+    Returns:
+        Dict with per-call 'median', 'min' and 'loops'
+    """
+    func()  # Warm-up
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 10 ** 6:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) / loops)
+
+    return {'median': statistics.median(samples), 'min': min(samples), 'loops': loops}
+
+
+def run_suite(cases: Sequence[Case], name_filter: Optional[str] = None, repeat: int = 5,
+              min_time: float = 0.05) -> Dict[str, Dict[str, float]]:
+    """
+    Run benchmark cases
+
+    Args:
+        cases: Cases from build_cases()
+        name_filter: Only run cases whose name contains this substring
+        repeat: Samples per case
+        min_time: Minimum duration of one sample in seconds
+
+    Returns:
+        Mapping of case name to timing statistics
+    """
+    results = {}
+    for name, factory in cases:
+        if name_filter and name_filter not in name:
+            continue
+        func, cleanup = factory()
+        try:
+            results[name] = measure(func, repeat=repeat, min_time=min_time)
+        finally:
+            cleanup()
+            # Spans recorded by instrumented code would otherwise pile up across loops
+            metrics.reset()
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baselines: Dict[str, float],
+            threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, float, float]]:
+    """
+    Find cases slower than their baseline by more than threshold
+
+    Args:
+        results: Output of run_suite()
+        baselines: Mapping of case name to baseline median seconds
+        threshold: Allowed slowdown factor
+
+    Returns:
+        (name, baseline, current) for every regression
+    """
+    regressions = []
+    for name, stats in results.items():
+        baseline = baselines.get(name)
+        if baseline and stats['median'] > baseline * threshold:
+            regressions.append((name, baseline, stats['median']))
+    return regressions
+
+
+def load_baselines(path: str = BASELINE_FILE) -> Dict[str, float]:
+    """Load recorded baseline medians"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('medians', {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_baselines(results: Dict[str, Dict[str, float]], path: str = BASELINE_FILE):
+    """Merge new medians into the baseline file"""
+    medians = load_baselines(path)
+    medians.update({name: round(stats['median'], 9) for name, stats in results.items()})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'python': sys.version.split()[0], 'medians': dict(sorted(medians.items()))},
+                  f, indent=2)
+        f.write('\n')
+
+
+def _format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('µs', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="AI Insight Daily microbenchmarks")
+    parser.add_argument('--full', action='store_true', help="include 10^6-entry storage runs")
+    parser.add_argument('--filter', help="only run benchmarks whose name contains this text")
+    parser.add_argument('--repeat', type=int, default=5, help="samples per benchmark")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown factor versus baseline")
+    parser.add_argument('--update-baseline', action='store_true', help="record results as baselines")
+    parser.add_argument('--json', help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    cases = build_cases(FULL_SIZES if args.full else DEFAULT_SIZES)
+    results = run_suite(cases, args.filter, repeat=args.repeat)
+    baselines = load_baselines()
+
+    print(f"{'benchmark':<48} {'median':>11} {'baseline':>11}  ratio")
+    for name, stats in results.items():
+        baseline = baselines.get(name)
+        ratio = f"{stats['median'] / baseline:5.2f}x" if baseline else "    -"
+        baseline_text = _format_seconds(baseline) if baseline else "          -"
+        print(f"{name:<48} {_format_seconds(stats['median'])} {baseline_text}  {ratio}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        save_baselines(results)
+        print(f"\n✅ Baselines updated in {BASELINE_FILE}")
+        return 0
+
+    regressions = compare(results, baselines, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold}x:")
+        for name, baseline, current in regressions:
+            print(f"   {name}: {_format_seconds(baseline)} -> {_format_seconds(current)}")
+        return 1
+
+    print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
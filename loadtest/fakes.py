@@ -0,0 +1,356 @@
+"""
+Local stand-ins for the completion API and the SMTP server.
+Both listen on 127.0.0.1 on an ephemeral port and inject latency and
+faults at configurable rates from a seeded random generator.
+"""
+
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from benchmarks.fixtures import concept_titles, model_response
+
+_COUNT_RE = re.compile(r"^(?:Generate|List) (\d+) ")
+_TOPIC_RE = re.compile(r"^Explain this concept in artificial intelligence: (.+)$", re.M)
+
+
+@dataclass
+class ApiFaults:
+    """Behaviour of the fake completion endpoint"""
+
+    latency: float = 0.05  # Mean seconds before a response starts
+    jitter: float = 0.5  # Latency varies by +/- this fraction
+    rate_429: float = 0.0  # Share of requests answered 429 with Retry-After
+    rate_5xx: float = 0.0  # Share of requests answered 503
+    rate_truncated: float = 0.0  # Share of responses cut off mid-body
+    retry_after: float = 1.0  # Retry-After seconds sent with 429s
+    chunk_delay: float = 0.002  # Seconds between streamed events
+    token_rate: float = 0.0  # Decoded tokens per second (0: responses are instant)
+
+
+@dataclass
+class SmtpFaults:
+    """Behaviour of the fake SMTP server"""
+
+    latency: float = 0.01  # Mean seconds to accept a message after DATA
+    jitter: float = 0.5  # Latency varies by +/- this fraction
+    rate_421: float = 0.0  # Share of messages answered 421, closing the connection
+    rate_deferral: float = 0.0  # Share of RCPT commands answered 451 (try again later)
+    rate_disconnect: float = 0.0  # Share of messages whose connection drops during DATA
+
+
+class _Dice:
+    """Thread-safe seeded random decisions"""
+
+    def __init__(self, seed: int):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+    def delay(self, mean: float, jitter: float) -> float:
+        if mean <= 0:
+            return 0.0
+        with self._lock:
+            return max(0.0, mean * (1 + self._rng.uniform(-jitter, jitter)))
+
+    def seed(self) -> int:
+        with self._lock:
+            return self._rng.randrange(10 ** 9)
+
+
+class _FakeServer:
+    """Start/stop plumbing shared by the fakes"""
+
+    server = None
+
+    def start(self):
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake: FakeCompletionAPI = self.server.fake
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        faults = fake.faults
+        fake.count('requests')
+        time.sleep(fake.dice.delay(faults.latency, faults.jitter))
+
+        if fake.dice.roll(faults.rate_429):
+            fake.count('429')
+            self._send_json(429, {'error': 'rate limited'}, {'Retry-After': f"{faults.retry_after:g}"})
+            return
+        if fake.dice.roll(faults.rate_5xx):
+            fake.count('503')
+            self._send_json(503, {'error': 'overloaded'})
+            return
+
+        content = fake.answer(payload)
+        truncated = fake.dice.roll(faults.rate_truncated)
+        if truncated:
+            fake.count('truncated')
+        usage = {'prompt_tokens': 500, 'completion_tokens': len(content) // 4,
+                 'total_tokens': 500 + len(content) // 4}
+
+        if payload.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            pieces = [content[i:i + 200] for i in range(0, len(content), 200)]
+            piece_delay = faults.chunk_delay + fake.decode_time(content) / len(pieces)
+            for n, piece in enumerate(pieces):
+                if truncated and n == len(pieces) // 2:
+                    return
+                event = {'choices': [{'delta': {'content': piece}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(piece_delay)
+            self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+            self.wfile.write(b"data: [DONE]\n\n")
+            fake.count('ok')
+            return
+
+        body = json.dumps({'choices': [{'message': {'content': content}}], 'usage': usage}).encode('utf-8')
+        time.sleep(fake.decode_time(content))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if truncated:
+            # Promise the full length, send half, hang up
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+        fake.count('ok')
+
+
+class FakeCompletionAPI(_FakeServer):
+    """Chat-completions endpoint answering with synthetic concept lists"""
+
+    def __init__(self, faults: ApiFaults = None, concepts: int = 10, seed: int = 0):
+        """
+        Initialize fake API
+
+        Args:
+            faults: Latency and fault rates
+            concepts: Concept sections in each response
+            seed: Random seed
+        """
+        self.faults = faults or ApiFaults()
+        self.concepts = concepts
+        self.dice = _Dice(seed)
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _CompletionHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def answer(self, payload: dict) -> str:
+        """Response text sized like the request: a name list, one concept or a full issue"""
+        prompt = ((payload.get('messages') or [{}])[0]).get('content', '')
+        seed = self.dice.seed()
+        match = _COUNT_RE.match(prompt)
+        count = int(match.group(1)) if match else self.concepts
+        if 'names only' in prompt:
+            return '\n'.join(f"{n}. {title}" for n, title in enumerate(concept_titles(count, seed), start=1))
+        topic = _TOPIC_RE.search(prompt)
+        if topic:
+            body = model_response(1, seed=seed).split('\n', 4)[4]
+            return f"## 1. {topic.group(1)}\n\n{body}"
+        return model_response(count, seed=seed)
+
+    def decode_time(self, content: str) -> float:
+        """Seconds a model decoding at token_rate would spend on content"""
+        rate = self.faults.token_rate
+        return len(content) / 4 / rate if rate > 0 else 0.0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/chat/completions"
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, text: str):
+        self.wfile.write(text.encode('ascii') + b"\r\n")
+
+    def readline(self) -> str:
+        line = self.rfile.readline(65537)
+        if not line:
+            raise ConnectionError("client hung up")
+        return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+    def handle(self):
+        fake: FakeSMTPServer = self.server.fake
+        fake.count('connections')
+        self.reply("220 fake.smtp ESMTP ready")
+        recipients: List[str] = []
+        try:
+            while True:
+                command = self.readline()
+                verb = command[:4].upper()
+                if verb == 'EHLO':
+                    self.reply("250-fake.smtp\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 52428800")
+                elif verb == 'HELO':
+                    self.reply("250 fake.smtp")
+                elif verb == 'AUTH':
+                    self._auth(command.split())
+                elif verb == 'MAIL':
+                    recipients = []
+                    self.reply("250 2.1.0 OK")
+                elif verb == 'RCPT':
+                    if fake.dice.roll(fake.faults.rate_deferral):
+                        fake.count('deferred')
+                        self.reply("451 4.7.1 Try again later")
+                    else:
+                        recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                        self.reply("250 2.1.5 OK")
+                elif verb == 'DATA':
+                    if not recipients:
+                        self.reply("503 5.5.1 RCPT first")
+                        continue
+                    if not self._data(fake, recipients):
+                        return
+                    recipients = []
+                elif verb == 'RSET':
+                    recipients = []
+                    self.reply("250 2.0.0 OK")
+                elif verb == 'NOOP':
+                    self.reply("250 2.0.0 OK")
+                elif verb == 'QUIT':
+                    self.reply("221 2.0.0 Bye")
+                    return
+                else:
+                    self.reply("502 5.5.2 Command not recognized")
+        except (ConnectionError, OSError):
+            return
+
+    def _auth(self, parts: List[str]):
+        mechanism = parts[1].upper() if len(parts) > 1 else ''
+        if mechanism == 'PLAIN' and len(parts) < 3:
+            self.reply("334 ")
+            self.readline()
+        elif mechanism == 'LOGIN':
+            if len(parts) < 3:
+                self.reply("334 VXNlcm5hbWU6")
+                self.readline()
+            self.reply("334 UGFzc3dvcmQ6")
+            self.readline()
+        elif mechanism != 'PLAIN':
+            self.reply("504 5.5.4 Unrecognized authentication type")
+            return
+        self.reply("235 2.7.0 Authentication successful")
+
+    def _data(self, fake: 'FakeSMTPServer', recipients: List[str]) -> bool:
+        """Receive a message; returns False when the connection was dropped"""
+        self.reply("354 End data with <CR><LF>.<CR><LF>")
+        size = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                raise ConnectionError("client hung up during DATA")
+            if line in (b".\r\n", b".\n"):
+                break
+            size += len(line)
+
+        if fake.dice.roll(fake.faults.rate_disconnect):
+            fake.count('disconnects')
+            return False
+        time.sleep(fake.dice.delay(fake.faults.latency, fake.faults.jitter))
+        if fake.dice.roll(fake.faults.rate_421):
+            fake.count('421')
+            self.reply("421 4.3.2 Service shutting down")
+            return False
+        fake.accept(recipients, size)
+        self.reply("250 2.0.0 OK queued")
+        return True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSMTPServer(_FakeServer):
+    """Plain-text SMTP sink that counts accepted messages per recipient"""
+
+    def __init__(self, faults: SmtpFaults = None, seed: int = 0):
+        """
+        Initialize fake SMTP server
+
+        Args:
+            faults: Latency and fault rates
+            seed: Random seed
+        """
+        self.faults = faults or SmtpFaults()
+        self.dice = _Dice(seed)
+        self.stats = Counter()
+        self.delivered = Counter()
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self.server = _ThreadingTCPServer(('127.0.0.1', 0), _SMTPHandler)
+        self.server.fake = self
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def accept(self, recipients: List[str], size: int):
+        """Record an accepted message"""
+        with self._lock:
+            self.stats['messages'] += 1
+            self.bytes_received += size
+            for recipient in recipients:
+                self.delivered[recipient] += 1
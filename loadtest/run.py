@@ -0,0 +1,273 @@
+"""
+End-to-end load test for the delivery pipeline.
+
+Starts a local fake of the completion API and a local SMTP sink, points the
+configuration at them, and runs the pipeline (by default the subscriber
+fan-out) until every recipient has their issue or --max-runs is reached.
+Reports throughput, tail latency and how the pipeline recovered from the
+injected faults.
+
+Usage:
+    python loadtest/run.py --recipients 1000
+    python loadtest/run.py --recipients 300 --api-429 0.2 --api-5xx 0.1 --api-truncated 0.05 \\
+        --smtp-deferral 0.05 --smtp-421 0.02 --smtp-disconnect 0.02
+    python loadtest/run.py --pipeline main --stream   # the single-recipient pipeline, streaming
+    python loadtest/run.py --api-token-rate 100 --parallel   # per-concept generation vs. --no-parallel
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from typing import Dict, List, Optional, Sequence
+
+# Add src directory and the repository root to path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, '..', 'src'))
+sys.path.insert(0, os.path.join(ROOT, '..'))
+
+import config as config_module  # noqa: E402
+import main as pipeline  # noqa: E402
+from metrics import metrics  # noqa: E402
+from subscribers import Subscriber, SubscriberRegistry  # noqa: E402
+from loadtest.fakes import ApiFaults, FakeCompletionAPI, FakeSMTPServer, SmtpFaults  # noqa: E402
+
+
+INTERESTS = ('general', 'computer vision', 'robotics', 'natural language processing',
+             'mlops', 'ai safety')
+
+
+def make_subscribers(count: int, segments: int = 1) -> List[Subscriber]:
+    """
+    Build always-due subscribers spread over segments
+
+    Args:
+        count: Number of subscribers
+        segments: Number of interest segments (at most len(INTERESTS))
+
+    Returns:
+        Subscribers user00000@example.com, user00001@example.com, ...
+    """
+    segments = max(1, min(segments, len(INTERESTS)))
+    return [Subscriber(f"user{i:05d}@example.com", f"User {i}", interest=INTERESTS[i % segments],
+                       send_hour=0)
+            for i in range(count)]
+
+
+@contextmanager
+def configured(**overrides):
+    """Temporarily override configuration attributes"""
+    config = config_module.config
+    saved = {name: getattr(config, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    try:
+        yield config
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+
+
+def percentiles(values: Sequence[float], points: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+    """
+    Nearest-rank percentiles
+
+    Args:
+        values: Samples
+        points: Percentiles to report
+
+    Returns:
+        Mapping like {'p50': ..., 'p95': ..., 'p99': ..., 'max': ...} (empty without samples)
+    """
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {f"p{p}": ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))]
+              for p in points}
+    result['max'] = ordered[-1]
+    return result
+
+
+def run_load_test(recipients: int = 100, segments: int = 2, pipeline_name: str = 'fanout',
+                  api_faults: Optional[ApiFaults] = None, smtp_faults: Optional[SmtpFaults] = None,
+                  max_runs: int = 5, rerun_delay: float = 0.5, stream: bool = False,
+                  parallel: bool = False, pool_size: int = 4, send_rate: float = 0.0, seed: int = 0,
+                  verbose: bool = False) -> dict:
+    """
+    Run the pipeline against the fakes until every recipient is served
+
+    Args:
+        recipients: Number of subscribers (fan-out only)
+        segments: Interest segments the subscribers are spread over
+        pipeline_name: 'fanout' (run_fanout) or 'main' (single recipient)
+        api_faults: Fake completion API behaviour
+        smtp_faults: Fake SMTP server behaviour
+        max_runs: Pipeline runs allowed for recovering from faults
+        rerun_delay: Seconds between runs (also the circuit breaker reset timeout)
+        stream: Use streaming generation
+        parallel: Generate each concept in its own concurrent request
+        pool_size: SMTP connections
+        send_rate: Global messages per second (<= 0 for unlimited)
+        seed: Random seed of both fakes
+        verbose: Show the pipeline's own output
+
+    Returns:
+        Report dict with per-run numbers, latency percentiles and recovery outcome
+    """
+    subscribers = make_subscribers(recipients, segments) if pipeline_name == 'fanout' else []
+    expected = {s.email for s in subscribers} or {"user00000@example.com"}
+    runs = []
+    smtp_latencies: List[float] = []
+    api_latencies: List[float] = []
+
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as directory, \
+            FakeCompletionAPI(api_faults, seed=seed) as api, \
+            FakeSMTPServer(smtp_faults, seed=seed) as smtp:
+        path = lambda name: os.path.join(directory, name)  # noqa: E731
+        with configured(
+            perplexity_api_key='loadtest', app_password='loadtest',
+            from_email='loadtest@example.com', to_email='user00000@example.com',
+            api_base_url=api.url, api_requests_per_second=0.0, api_retry_delay=0.05,
+            api_max_retry_delay=2.0, api_circuit_reset_timeout=rerun_delay,
+            stream_generation=stream, parallel_generation=parallel, backlog_enabled=False,
+            smtp_server='127.0.0.1', smtp_port=smtp.port, smtp_use_ssl=False,
+            smtp_pool_size=pool_size, send_rate_per_second=send_rate,
+            provider_rate_limits={}, default_provider_rate=0.0,
+            storage_file=path('sent_concepts.json'), segment_storage_dir=path('segments'),
+            subscribers_file=path('subscribers.json'), checkpoint_dir=path('checkpoints'),
+            archive_dir=path('archive'), search_index_file=path('search.db'),
+            backlog_file=path('backlog.db'), metrics_jsonl_file=path('metrics.jsonl'),
+            metrics_prometheus_file=path('metrics.prom'),
+        ):
+            if subscribers:
+                SubscriberRegistry(path('subscribers.json')).save(subscribers)
+            entry = pipeline.run_fanout if pipeline_name == 'fanout' else pipeline.main
+
+            for number in range(1, max_runs + 1):
+                accepted_before = smtp.stats['messages']
+                start = time.perf_counter()
+                if verbose:
+                    exit_code = entry()
+                else:
+                    with redirect_stdout(io.StringIO()):
+                        exit_code = entry()
+                elapsed = time.perf_counter() - start
+
+                generate_spans = metrics.spans('fanout.generate') or metrics.spans('stage.generate')
+                send_spans = metrics.spans('fanout.send') or metrics.spans('stage.send')
+                send_seconds = sum(s['duration_ms'] for s in send_spans) / 1000
+                accepted = smtp.stats['messages'] - accepted_before
+                smtp_latencies += [s['duration_ms'] for s in metrics.spans('smtp.send')]
+                api_latencies += [s['duration_ms'] for s in
+                                  metrics.spans('api.attempt') + metrics.spans('http.stream')]
+                runs.append({
+                    'run': number,
+                    'exit_code': exit_code,
+                    'seconds': round(elapsed, 3),
+                    'generate_seconds': round(max([s['duration_ms'] for s in generate_spans], default=0) / 1000, 3),
+                    'accepted': accepted,
+                    'send_seconds': round(send_seconds, 3),
+                    'messages_per_second': round(accepted / send_seconds, 1) if send_seconds else 0.0,
+                    'api_failures': {dict(labels).get('kind'): int(value)
+                                     for (name, labels), value in metrics.counters.items()
+                                     if name == 'api_failures'},
+                })
+                if exit_code == 0 or expected <= set(smtp.delivered):
+                    break
+                time.sleep(rerun_delay)
+
+        delivered = set(smtp.delivered) & expected
+        total_accepted = sum(run['accepted'] for run in runs)
+        total_send_seconds = sum(run['send_seconds'] for run in runs)
+        return {
+            'pipeline': pipeline_name,
+            'recipients': len(expected),
+            'runs': runs,
+            'delivered': len(delivered),
+            'missing': sorted(expected - delivered),
+            'duplicates': sum(count - 1 for count in smtp.delivered.values() if count > 1),
+            'recovered': delivered == expected,
+            'runs_needed': len(runs) if delivered == expected else None,
+            'messages_per_second': round(total_accepted / total_send_seconds, 1) if total_send_seconds else 0.0,
+            'smtp_send_ms': percentiles(smtp_latencies),
+            'api_attempt_ms': percentiles(api_latencies),
+            'api_faults_injected': dict(api.stats),
+            'smtp_faults_injected': dict(smtp.stats),
+            'bytes_received': smtp.bytes_received,
+        }
+
+
+def _print_report(report: dict):
+    print(f"{'run':>3} {'exit':>4} {'seconds':>8} {'generate':>8} {'accepted':>8} {'msg/s':>8}  api failures")
+    for run in report['runs']:
+        failures = ', '.join(f"{kind}={count}" for kind, count in sorted(run['api_failures'].items()))
+        print(f"{run['run']:>3} {run['exit_code']:>4} {run['seconds']:>8.2f} {run['generate_seconds']:>8.2f} "
+              f"{run['accepted']:>8} {run['messages_per_second']:>8.1f}  {failures or '-'}")
+
+    def latency(stats):
+        return '  '.join(f"{name} {value:.1f}" for name, value in stats.items()) or '-'
+
+    print(f"\nthroughput     {report['messages_per_second']:.1f} messages/s while sending")
+    print(f"smtp.send ms   {latency(report['smtp_send_ms'])}")
+    print(f"api ms         {latency(report['api_attempt_ms'])}")
+    print(f"api faults     {report['api_faults_injected']}")
+    print(f"smtp faults    {report['smtp_faults_injected']}")
+    print(f"delivered      {report['delivered']}/{report['recipients']}, "
+          f"{report['duplicates']} duplicates")
+    if report['recovered']:
+        print(f"\n✅ Every recipient served after {report['runs_needed']} run(s)")
+    else:
+        print(f"\n❌ {len(report['missing'])} recipients never received their issue")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="AI Insight Daily end-to-end load test")
+    parser.add_argument('--pipeline', choices=('fanout', 'main'), default='fanout')
+    parser.add_argument('--recipients', type=int, default=100)
+    parser.add_argument('--segments', type=int, default=2)
+    parser.add_argument('--max-runs', type=int, default=5, help="runs allowed to recover from faults")
+    parser.add_argument('--rerun-delay', type=float, default=0.5)
+    parser.add_argument('--stream', action='store_true', help="use streaming generation")
+    parser.add_argument('--parallel', action='store_true', help="one concurrent request per concept")
+    parser.add_argument('--pool-size', type=int, default=4, help="SMTP connections")
+    parser.add_argument('--send-rate', type=float, default=0.0, help="messages/s (0: unlimited)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--api-latency', type=float, default=0.05)
+    parser.add_argument('--api-429', type=float, default=0.0)
+    parser.add_argument('--api-5xx', type=float, default=0.0)
+    parser.add_argument('--api-truncated', type=float, default=0.0)
+    parser.add_argument('--api-token-rate', type=float, default=0.0,
+                        help="simulated decoding speed in tokens/s (0: instant)")
+    parser.add_argument('--smtp-latency', type=float, default=0.01)
+    parser.add_argument('--smtp-421', type=float, default=0.0)
+    parser.add_argument('--smtp-deferral', type=float, default=0.0)
+    parser.add_argument('--smtp-disconnect', type=float, default=0.0)
+    parser.add_argument('--verbose', action='store_true', help="show pipeline output")
+    parser.add_argument('--json', help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(
+        recipients=args.recipients, segments=args.segments, pipeline_name=args.pipeline,
+        api_faults=ApiFaults(latency=args.api_latency, rate_429=args.api_429,
+                             rate_5xx=args.api_5xx, rate_truncated=args.api_truncated,
+                             retry_after=0.2, token_rate=args.api_token_rate),
+        smtp_faults=SmtpFaults(latency=args.smtp_latency, rate_421=args.smtp_421,
+                               rate_deferral=args.smtp_deferral,
+                               rate_disconnect=args.smtp_disconnect),
+        max_runs=args.max_runs, rerun_delay=args.rerun_delay, stream=args.stream, parallel=args.parallel,
+        pool_size=args.pool_size, send_rate=args.send_rate, seed=args.seed, verbose=args.verbose
+    )
+    _print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['recovered'] and not report['duplicates'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,16 +3,24 @@ AI Insight Daily - A daily AI concepts learning email system.
 
 This package provides automated daily emails with 5 new AI concepts,
 avoiding duplicates and presenting information in beautiful HTML format.
+
+Public names are imported on first access, so importing the package (or
+a light module such as storage) does not load requests, smtplib or numpy.
 """
 
+import importlib
+
 __version__ = "1.0.0"
 __author__ = "Moussaab Boutelis"
 
-from .config import config
-from .storage import ConceptStorage
-from .ai_generator import AIConceptGenerator
-from .email_template import EmailTemplate
-from .email_sender import EmailSender
+# Public name -> submodule defining it
+_LAZY_IMPORTS = {
+    'config': 'config',
+    'ConceptStorage': 'storage',
+    'AIConceptGenerator': 'ai_generator',
+    'EmailTemplate': 'email_template',
+    'EmailSender': 'email_sender',
+}
 
 __all__ = [
     'config',
@@ -21,3 +29,16 @@ __all__ = [
     'EmailTemplate',
     'EmailSender'
 ]
+
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # Cache so later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -3,19 +3,94 @@ AI Generator module for creating daily AI concepts.
 Handles communication with Perplexity API.
 """
 
+import asyncio
+import json
 import re
+import threading
 import time
+import weakref
 import requests
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException, Timeout
 
+try:
+    from .document import SECTION_LABELS, Concept, IncrementalParser, clean_heading_text, parse_markdown
+    from .history import CompactHistory, HistoryCompactor, estimate_tokens
+    from .metrics import metrics
+    from .providers import Provider, ProviderRouter, start_request_clock
+    from .ratelimit import (AdaptiveTokenBucket, ApiGuard, CircuitBreaker, backoff_delay,
+                            parse_retry_after, shared_api_guard)
+except ImportError:
+    from document import SECTION_LABELS, Concept, IncrementalParser, clean_heading_text, parse_markdown
+    from history import CompactHistory, HistoryCompactor, estimate_tokens
+    from metrics import metrics
+    from providers import Provider, ProviderRouter, start_request_clock
+    from ratelimit import (AdaptiveTokenBucket, ApiGuard, CircuitBreaker, backoff_delay,
+                           parse_retry_after, shared_api_guard)
+
+
+_HEADING_NUMBER_RE = re.compile(r"^(\s*(?:#+\s*)?(?:\*\*)?)\d+")
+_TOPIC_LINE_RE = re.compile(r"^\s*(?:(?:[-*•]|\d+[.)])\s+|#+\s*)(.+)$")
+_TOPIC_DESCRIPTION_RE = re.compile(r"\s+[-–—]\s+|:\s")
+
+# Tokens asked for per topic name when picking topics, and per expanded concept
+TOPIC_TOKENS = 30
+CONCEPT_TOKENS = 600
+
+# Interest values that mean "no particular focus"
+GENERAL_INTERESTS = frozenset({'general', 'all', 'ai'})
+
+LANGUAGE_NAMES = {
+    'ar': 'Arabic',
+    'de': 'German',
+    'es': 'Spanish',
+    'fr': 'French',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+}
+
+# Responses worth retrying: timeouts, conflicts, throttling and server errors
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+class APIError(Exception):
+    """Non-200 response from the completion API"""
+
+    def __init__(self, status_code: int, body: str, retry_after: Optional[float] = None):
+        super().__init__(f"API Error ({status_code}): {body}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        """Whether a later attempt may succeed"""
+        return self.status_code in RETRYABLE_STATUS_CODES
+
+
+def _sum_usage(usages: Sequence[Optional[dict]]) -> Optional[dict]:
+    """Add up the token counts of several usage blocks (None if none was reported)"""
+    total = {}
+    for usage in usages:
+        for kind, value in (usage or {}).items():
+            if isinstance(value, (int, float)):
+                total[kind] = total.get(kind, 0) + value
+    return total or None
+
 
 class AIConceptGenerator:
     """Class to generate AI concepts using Perplexity API"""
     
     def __init__(self, api_key: str, api_url: str, model: str,
                  max_tokens: int = 2000, temperature: float = 0.7,
-                 max_retries: int = 3, retry_delay: float = 5.0):
+                 max_retries: int = 3, retry_delay: float = 5.0,
+                 max_concurrency: int = 4, timeout: float = 60.0,
+                 history_token_budget: int = 400, interest: Optional[str] = None,
+                 language: Optional[str] = None, max_retry_delay: float = 60.0,
+                 guard: Optional[ApiGuard] = None,
+                 session: Optional[requests.Session] = None,
+                 router: Optional[ProviderRouter] = None):
         """
         Initialize AI generator
         
@@ -25,6 +100,22 @@ class AIConceptGenerator:
             model: Model name to use
             max_tokens: Maximum tokens for response
             temperature: Temperature for generation
+            max_retries: Attempts per request on network errors
+            retry_delay: Base delay between retries in seconds
+            max_concurrency: Maximum number of requests in flight at once
+            timeout: Request timeout in seconds
+            history_token_budget: Token budget for previously covered topics in prompts
+            interest: Optional focus area within AI for a subscriber segment
+            language: Optional language code or name the content is written in
+            max_retry_delay: Cap on the exponential backoff between retries in seconds
+            guard: Rate limiter and circuit breaker, usually shared between generators
+                via ratelimit.shared_api_guard(); defaults to an unlimited private one
+            session: Keep-alive session owned by the caller (see new_session()), e.g.
+                one a daemon keeps warm between runs; close() leaves it open
+            router: Routes requests between several providers by live latency and
+                error rate and hedges slow ones; the provider matching api_url and
+                api_key uses this generator's session and guard, the others get
+                their own session and a process-wide guard per provider
         """
         self.api_key = api_key
         self.api_url = api_url
@@ -33,24 +124,58 @@ class AIConceptGenerator:
         self.temperature = temperature
         self.max_retries = max(1, max_retries)
         self.retry_delay = max(0.0, retry_delay)
+        self.max_retry_delay = max(self.retry_delay, max_retry_delay)
+        self.guard = guard or ApiGuard(AdaptiveTokenBucket(0), CircuitBreaker())
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self._shared_session = session
+        self._session: Optional[requests.Session] = session
+        self._session_lock = threading.Lock()
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.router = router
+        self._provider_sessions: Dict[str, requests.Session] = {}
+        self._provider_guards: Dict[str, ApiGuard] = {}
+        self.history_compactor = HistoryCompactor(token_budget=history_token_budget)
+        self.interest = interest
+        self.language = language
+        self.last_history: Optional[CompactHistory] = None
+        self.last_prompt_tokens = 0
+        self.last_stream_text = ""
+        self.last_usage: Optional[dict] = None
     
-    def _create_prompt(self, previous_concepts: List[str]) -> str:
+    def _audience_instructions(self) -> str:
+        """Extra prompt lines for a segment's focus area and language (empty by default)"""
+        lines = []
+        if self.interest and self.interest.lower() not in GENERAL_INTERESTS:
+            lines.append(f"Focus every concept on this area of AI: {self.interest}.")
+        if self.language and self.language.lower() not in ('en', 'english'):
+            language = LANGUAGE_NAMES.get(self.language.lower(), self.language)
+            lines.append(f"Write the entire response in {language}, keeping the same structure.")
+        return "\n\n" + "\n".join(lines) if lines else ""
+    
+    def _create_prompt(self, previous_concepts: List[str], count: int = 5,
+                       focus: Optional[str] = None) -> str:
         """
         Create prompt for generating new concepts
         
         Args:
             previous_concepts: List of previously covered topics
+            count: Number of concepts to ask for
+            focus: Optional sub-area to draw this batch from, so concurrent
+                requests do not all produce the same concepts
             
         Returns:
             Formatted prompt string
         """
-        previous_topics_text = ", ".join(previous_concepts) if previous_concepts else "none"
+        with metrics.span('generate.prompt', history=len(previous_concepts)):
+            self.last_history = self.history_compactor.compact(previous_concepts)
+        previous_topics_text = self.last_history.text
         
-        prompt = f"""Generate 5 new and important concepts in artificial intelligence that have NOT been covered before.
+        prompt = f"""Generate {count} new and important concepts in artificial intelligence that have NOT been covered before.
 
 Previously covered topics to AVOID: {previous_topics_text}
 
-For each of the 5 NEW concepts, provide:
+For each of the {count} NEW concepts, provide:
 1. Concept name (as a clear heading)
 2. Clear definition
 3. Key points (2-3 bullet points)
@@ -59,31 +184,99 @@ For each of the 5 NEW concepts, provide:
 
 Format each concept clearly with proper headings and structure.
 Make the content educational, engaging, and suitable for daily learning.
-Ensure all 5 concepts are DIFFERENT from the previously covered topics."""
+Ensure all {count} concepts are DIFFERENT from the previously covered topics.{self._audience_instructions()}"""
+        if focus:
+            prompt += f"\n\nDraw this batch of concepts from: {focus}."
         
+        self.last_prompt_tokens = estimate_tokens(prompt)
         return prompt
     
-    def generate_concepts(self, previous_concepts: List[str]) -> str:
+    @staticmethod
+    def new_session(api_key: str, max_concurrency: int = 4) -> requests.Session:
         """
-        Generate 5 new AI concepts avoiding duplicates
+        Create a keep-alive session for the completion API
         
         Args:
-            previous_concepts: List of previously covered topics
+            api_key: API key sent with every request
+            max_concurrency: Connections kept in the pool
             
         Returns:
-            Generated concepts text
-            
-        Raises:
-            Exception: If API call fails
+            Session with the authorization headers set
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_concurrency))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
-        }
-        
-        prompt = self._create_prompt(previous_concepts)
+        })
+        return session
+    
+    @property
+    def session(self) -> requests.Session:
+        """Keep-alive HTTP session shared by every request from this generator"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self.new_session(self.api_key, self.max_concurrency)
+        return self._session
+    
+    def _own_api(self, provider: Optional[Provider]) -> bool:
+        """Whether a routed provider is this generator's own API"""
+        return provider is None or (provider.api_url, provider.api_key) == (self.api_url, self.api_key)
+    
+    def provider_session(self, provider: Optional[Provider]) -> requests.Session:
+        """Keep-alive session for a routed provider (this generator's own for its API)"""
+        if self._own_api(provider):
+            return self.session
+        session = self._provider_sessions.get(provider.name)
+        if session is None:
+            with self._session_lock:
+                session = self._provider_sessions.get(provider.name)
+                if session is None:
+                    session = self._provider_sessions[provider.name] = self.new_session(
+                        provider.api_key, self.max_concurrency)
+        return session
+    
+    def provider_guard(self, provider: Optional[Provider]) -> ApiGuard:
+        """
+        Rate limiter and circuit breaker of a routed provider
         
-        payload = {
+        This generator's own API uses its guard; every other provider gets
+        a process-wide one with the same circuit settings and no rate limit
+        until it throttles.
+        """
+        if self._own_api(provider):
+            return self.guard
+        guard = self._provider_guards.get(provider.name)
+        if guard is None:
+            guard = self._provider_guards[provider.name] = shared_api_guard(
+                provider.api_url,
+                failure_threshold=self.guard.breaker.failure_threshold,
+                reset_timeout=self.guard.breaker.reset_timeout
+            )
+        return guard
+    
+    def close(self):
+        """Close the pooled HTTP session (a caller-owned session stays open)"""
+        with self._session_lock:
+            session, self._session = self._session, self._shared_session
+            provider_sessions, self._provider_sessions = self._provider_sessions, {}
+        if session is not None and session is not self._shared_session:
+            session.close()
+        for provider_session in provider_sessions.values():
+            provider_session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _build_payload(self, prompt: str, max_tokens: Optional[int] = None) -> dict:
+        """Build the chat-completions request body for a prompt"""
+        return {
             "model": self.model,
             "messages": [
                 {
@@ -91,98 +284,769 @@ Ensure all 5 concepts are DIFFERENT from the previously covered topics."""
                     "content": prompt
                 }
             ],
-            "max_tokens": self.max_tokens,
+            "max_tokens": max_tokens or self.max_tokens,
             "temperature": self.temperature
         }
+    
+    def _request_once(self, payload: dict) -> Tuple[str, Optional[dict]]:
+        """
+        Perform a single API request and return the generated content and token usage
         
-        last_error = None
-        for attempt in range(1, self.max_retries + 1):
-            try:
-                response = requests.post(
-                    self.api_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=60
-                )
+        With a router the request goes to the best-ranked provider and may be
+        hedged with a second one; the first answer wins. Each of them passes
+        its own provider's guard.
+        
+        Raises:
+            RequestException: On network errors (retryable)
+            APIError: On non-200 responses
+            APIError: Also on empty or malformed 200 responses (not retried)
+            CircuitOpenError: With a router, if no provider's circuit let the request through
+        """
+        if self.router is None:
+            return self._request_provider(None, payload)
+        return self.router.call(lambda provider: self._guarded_request(provider, payload),
+                                request_class=payload.get('max_tokens'))
+    
+    def _guarded_request(self, provider: Provider, payload: dict) -> Tuple[str, Optional[dict]]:
+        """_request_provider() behind the provider's rate limiter and circuit breaker"""
+        guard = self.provider_guard(provider)
+        guard.breaker.before_call()
+        guard.bucket.acquire()
+        start_request_clock()
+        try:
+            result = self._request_provider(provider, payload)
+        except Exception as error:
+            self._settle_failure(guard, error)
+            raise
+        guard.breaker.record_success()
+        guard.bucket.record_success()
+        return result
+    
+    def _request_provider(self, provider: Optional[Provider], payload: dict) -> Tuple[str, Optional[dict]]:
+        """
+        Send a request to one provider (None: this generator's API)
+        
+        Returns:
+            Generated content and the reported token usage
+        """
+        api_url, model = (self.api_url, self.model) if provider is None else (provider.api_url, provider.model)
+        labels = {'model': model} if provider is None else {'model': model, 'provider': provider.name}
+        with metrics.span('http.request', **labels) as span:
+            response = self.provider_session(provider).post(
+                api_url,
+                json=payload if model == payload.get('model') else dict(payload, model=model),
+                timeout=self.timeout
+            )
+            span['status_code'] = response.status_code
 
-                if response.status_code == 200:
-                    result = response.json()
-                    content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+        if response.status_code == 200:
+            try:
+                result = response.json()
+                usage = result.get("usage")
+                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+            except (ValueError, AttributeError, IndexError, TypeError) as e:
+                raise APIError(response.status_code, f"Malformed response: {e}")
+            metrics.record_usage(usage, model)
 
-                    if not content:
-                        raise Exception("No content generated from API")
+            if not content:
+                raise APIError(response.status_code, "No content generated from API")
 
-                    return content
-                else:
-                    raise Exception(f"API Error ({response.status_code}): {response.text}")
+            return content, usage
+        else:
+            raise self._api_error(response)
+    
+    @staticmethod
+    def _api_error(response) -> APIError:
+        """Build an APIError from a non-200 response"""
+        return APIError(response.status_code, response.text,
+                        parse_retry_after(response.headers.get("Retry-After")))
+    
+    def throttle_state(self) -> dict:
+        """
+        State of the rate limiter and circuit breaker guarding the API
+        
+        Returns:
+            Dict with 'rate', 'tokens', 'paused_for', 'throttled' and 'circuit'
+        """
+        return self.guard.state()
+    
+    def _before_attempt(self):
+        """
+        Wait for the rate limiter before an attempt (with a router, each
+        provider request waits for its own provider's guard instead)
+        
+        Raises:
+            CircuitOpenError: If the circuit breaker is open
+        """
+        if self.router is None:
+            self.guard.breaker.before_call()
+            self.guard.bucket.acquire()
+    
+    async def _abefore_attempt(self):
+        """Async variant of _before_attempt() that waits without blocking the loop"""
+        if self.router is not None:
+            return
+        self.guard.breaker.before_call()
+        while True:
+            wait = self.guard.bucket.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+    
+    def _record_success(self):
+        if self.router is None:
+            self.guard.breaker.record_success()
+            self.guard.bucket.record_success()
+    
+    @staticmethod
+    def _settle_failure(guard: ApiGuard, error: Exception):
+        """Feed a failed request to a guard's rate limiter and circuit breaker"""
+        if isinstance(error, APIError) and (error.status_code == 429 or not error.retryable):
+            # The provider answered, so it is up: only slow down (or give up)
+            guard.breaker.record_success()
+            if error.status_code == 429:
+                guard.bucket.throttle(error.retry_after)
+        else:
+            guard.breaker.record_failure()
+    
+    def _record_failure(self, error: Exception) -> Optional[float]:
+        """
+        Feed a failed attempt to the rate limiter and circuit breaker
+        
+        Args:
+            error: Network error or APIError
+            
+        Returns:
+            Seconds the server asked to wait, if any
+            
+        Raises:
+            APIError: If the error is not retryable
+        """
+        metrics.incr('api_failures', kind=str(error.status_code) if isinstance(error, APIError) else 'network')
+        if self.router is None:
+            self._settle_failure(self.guard, error)
+        if isinstance(error, APIError):
+            if error.status_code != 429 and not error.retryable:
+                raise error
+            return error.retry_after
+        return None
+    
+    def _record_unexpected_failure(self):
+        """Count an attempt that failed outside the API's error model, settling a half-open probe"""
+        metrics.incr('api_failures', kind='unexpected')
+        if self.router is None:
+            self.guard.breaker.record_failure()
+    
+    def _retry_wait(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Backoff before the attempt after a failed one"""
+        return backoff_delay(attempt, self.retry_delay, self.max_retry_delay, retry_after)
+    
+    def complete(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        """
+        Send a prompt to the API, retrying network errors, throttling and server errors
+        
+        Retries back off exponentially with jitter and honour Retry-After.
+        
+        Args:
+            prompt: Prompt text
+            max_tokens: Optional override of the response token limit
+            
+        Returns:
+            Generated text
+            
+        Raises:
+            CircuitOpenError: If the circuit breaker is open
+            APIError: On a non-retryable API error
+            Exception: If API call fails
+        """
+        payload = self._build_payload(prompt, max_tokens)
+        
+        last_error = None
+        for attempt in range(1, self.max_retries + 1):
+            self._before_attempt()
+            try:
+                with metrics.span('api.attempt', attempt=attempt):
+                    content, usage = self._request_once(payload)
+            except (Timeout, RequestException, APIError) as error:
+                last_error = error
+                retry_after = self._record_failure(error)
+                if attempt < self.max_retries:
+                    wait_time = self._retry_wait(attempt, retry_after)
+                    print(f"⚠️ API request failed (attempt {attempt}/{self.max_retries}): {error}. Retrying in {wait_time:.1f} seconds...")
+                    time.sleep(wait_time)
+                continue
+            except Exception:
+                self._record_unexpected_failure()
+                raise
+            self._record_success()
+            self.last_usage = usage
+            return content
 
-            except (Timeout, RequestException) as error:
+        raise Exception(f"Perplexity API request failed after {self.max_retries} attempts: {last_error}")
+    
+    def _stream_once(self, payload: dict, idle_timeout: float) -> Iterator[str]:
+        """
+        Perform a single streaming request and yield content deltas
+        
+        With a router the stream goes to the best-ranked provider; streams
+        are not hedged and only feed the provider's error rate.
+        
+        Raises:
+            RequestException: On network errors, including idle gaps longer than idle_timeout
+            Exception: On API errors
+        """
+        if self.router is None:
+            yield from self._stream_provider(None, payload, idle_timeout)
+            return
+        provider = self.router.ranked()[0]
+        guard = self.provider_guard(provider)
+        guard.breaker.before_call()
+        guard.bucket.acquire()
+        answered = False
+        try:
+            for chunk in self._stream_provider(provider, payload, idle_timeout):
+                if not answered:
+                    # As in stream_complete(), the first chunk settles the guard
+                    answered = True
+                    guard.breaker.record_success()
+                    guard.bucket.record_success()
+                yield chunk
+        except Exception as error:
+            self.router.record(provider, None, ok=False)
+            self._settle_failure(guard, error)
+            raise
+        self.router.record(provider, None)
+        if not answered:
+            guard.breaker.record_success()
+            guard.bucket.record_success()
+    
+    def _stream_provider(self, provider: Optional[Provider], payload: dict,
+                         idle_timeout: float) -> Iterator[str]:
+        """Stream from one provider (None: this generator's API)"""
+        api_url, model = (self.api_url, self.model) if provider is None else (provider.api_url, provider.model)
+        # requests applies the read timeout to each socket read, i.e. to idle gaps
+        with self.provider_session(provider).post(
+            api_url,
+            json=dict(payload, model=model, stream=True),
+            timeout=(min(10.0, self.timeout), idle_timeout),
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise self._api_error(response)
+            
+            response.encoding = response.encoding or 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    return
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    continue
+                if event.get("usage"):
+                    self.last_usage = event["usage"]
+                choice = (event.get("choices") or [{}])[0]
+                delta = choice.get("delta") or choice.get("message") or {}
+                content = delta.get("content")
+                if content:
+                    yield content
+    
+    def stream_complete(self, prompt: str, max_tokens: Optional[int] = None,
+                        idle_timeout: float = 20.0) -> Iterator[str]:
+        """
+        Stream a completion as server-sent events
+        
+        Network errors are retried only until the first chunk arrives; a stream
+        that stalls for longer than idle_timeout after that raises.
+        
+        Args:
+            prompt: Prompt text
+            max_tokens: Optional override of the response token limit
+            idle_timeout: Maximum gap in seconds between received bytes
+            
+        Yields:
+            Content deltas as they arrive
+            
+        Raises:
+            Exception: If the stream cannot be completed
+        """
+        payload = self._build_payload(prompt, max_tokens)
+        
+        last_error = None
+        for attempt in range(1, self.max_retries + 1):
+            received = 0
+            self._before_attempt()
+            start = time.perf_counter()
+            first_chunk_ms = None
+            self.last_usage = None
+            try:
+                for chunk in self._stream_once(payload, idle_timeout):
+                    if not received:
+                        first_chunk_ms = round((time.perf_counter() - start) * 1000, 3)
+                        self._record_success()
+                    received += 1
+                    yield chunk
+                metrics.record_span('http.stream', time.perf_counter() - start, attempt=attempt,
+                                    chunks=received, first_chunk_ms=first_chunk_ms)
+                metrics.record_usage(self.last_usage, self.model)
+                return
+            except (Timeout, RequestException, APIError) as error:
+                metrics.record_span('http.stream', time.perf_counter() - start, status='error',
+                                    error=str(error)[:300], attempt=attempt, chunks=received)
+                if received:
+                    if self.router is None:
+                        self.guard.breaker.record_failure()
+                    raise Exception(f"Perplexity API stream interrupted: {error}")
                 last_error = error
+                retry_after = self._record_failure(error)
                 if attempt < self.max_retries:
-                    wait_time = self.retry_delay * attempt
-                    print(f"⚠️ API request failed (attempt {attempt}/{self.max_retries}): {error}. Retrying in {wait_time} seconds...")
+                    wait_time = self._retry_wait(attempt, retry_after)
+                    print(f"⚠️ API stream failed (attempt {attempt}/{self.max_retries}): {error}. Retrying in {wait_time:.1f} seconds...")
                     time.sleep(wait_time)
+            except Exception:
+                if not received:
+                    self._record_unexpected_failure()
+                raise
+
+        raise Exception(f"Perplexity API request failed after {self.max_retries} attempts: {last_error}")
+    
+    def stream_concepts(self, previous_concepts: List[str], count: int = 5,
+                        idle_timeout: float = 20.0) -> Iterator[Concept]:
+        """
+        Generate concepts in streaming mode, yielding each one as soon as it is complete
+        
+        The full response text is available as last_stream_text once the
+        iterator is exhausted.
+        
+        Args:
+            previous_concepts: List of previously covered topics
+            count: Number of concepts to ask for
+            idle_timeout: Maximum gap in seconds between received bytes
+            
+        Yields:
+            Parsed concepts, in order
+        """
+        parser = IncrementalParser()
+        chunks: List[str] = []
+        self.last_stream_text = ""
+        for chunk in self.stream_complete(self._create_prompt(previous_concepts, count),
+                                          idle_timeout=idle_timeout):
+            chunks.append(chunk)
+            yield from parser.feed(chunk)
+        self.last_stream_text = "".join(chunks)
+        if not self.last_stream_text:
+            raise Exception("No content generated from API")
+        yield from parser.close()
+    
+    def _semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limiter bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+    
+    async def acomplete(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        """
+        Async variant of complete(); blocking I/O runs in a worker thread and
+        retries back off without blocking the event loop
+        
+        Unlike complete() it leaves last_usage alone, since concurrent calls
+        would overwrite each other's; acomplete_many() reports their total.
+        
+        Args:
+            prompt: Prompt text
+            max_tokens: Optional override of the response token limit
+            
+        Returns:
+            Generated text
+        """
+        return (await self._acomplete(prompt, max_tokens))[0]
+    
+    async def _acomplete(self, prompt: str, max_tokens: Optional[int] = None) -> Tuple[str, Optional[dict]]:
+        """acomplete() returning the token usage with the text"""
+        payload = self._build_payload(prompt, max_tokens)
+        loop = asyncio.get_running_loop()
+        
+        last_error = None
+        for attempt in range(1, self.max_retries + 1):
+            async with self._semaphore():
+                await self._abefore_attempt()
+                start = time.perf_counter()
+                try:
+                    content, usage = await loop.run_in_executor(None, self._request_once, payload)
+                except (Timeout, RequestException, APIError) as error:
+                    metrics.record_span('api.attempt', time.perf_counter() - start, status='error',
+                                        error=str(error)[:300], attempt=attempt)
+                    last_error = error
+                    retry_after = self._record_failure(error)
+                except Exception:
+                    self._record_unexpected_failure()
+                    raise
                 else:
-                    break
+                    metrics.record_span('api.attempt', time.perf_counter() - start, attempt=attempt)
+                    self._record_success()
+                    return content, usage
+            # Back off outside the semaphore so waiting retries do not hold a slot
+            if attempt < self.max_retries:
+                wait_time = self._retry_wait(attempt, retry_after)
+                print(f"⚠️ API request failed (attempt {attempt}/{self.max_retries}): {last_error}. Retrying in {wait_time:.1f} seconds...")
+                await asyncio.sleep(wait_time)
 
         raise Exception(f"Perplexity API request failed after {self.max_retries} attempts: {last_error}")
     
+    def generate_concepts(self, previous_concepts: List[str], count: int = 5) -> str:
+        """
+        Generate new AI concepts avoiding duplicates
+        
+        Args:
+            previous_concepts: List of previously covered topics
+            count: Number of concepts to ask for
+            
+        Returns:
+            Generated concepts text
+            
+        Raises:
+            Exception: If API call fails
+        """
+        return self.complete(self._create_prompt(previous_concepts, count))
+    
+    async def agenerate_concepts(self, previous_concepts: List[str], count: int = 5) -> str:
+        """
+        Async variant of generate_concepts()
+        
+        Args:
+            previous_concepts: List of previously covered topics
+            count: Number of concepts to ask for
+            
+        Returns:
+            Generated concepts text
+        """
+        return await self.acomplete(self._create_prompt(previous_concepts, count))
+    
+    def _create_replacement_prompt(self, rejected: List[str], avoid: List[str]) -> str:
+        """
+        Create prompt asking for replacements of specific rejected concepts
+        
+        Args:
+            rejected: Titles that were rejected as near-duplicates
+            avoid: Other topics the replacements must not repeat
+            
+        Returns:
+            Formatted prompt string
+        """
+        count = len(rejected)
+        rejected_text = ", ".join(rejected)
+        avoid_text = self.history_compactor.compact(avoid).text
+        
+        return f"""Generate {count} new and important concepts in artificial intelligence to replace these rejected ones: {rejected_text}
+
+Topics to AVOID (already covered or already in this issue): {avoid_text}
+
+For each of the {count} NEW concepts, provide:
+1. Concept name (as a clear heading)
+2. Clear definition
+3. Key points (2-3 bullet points)
+4. Practical applications
+5. A relevant example
+
+Format each concept clearly with proper headings and structure.
+Ensure all {count} concepts are clearly DIFFERENT from every topic listed above.{self._audience_instructions()}"""
+    
+    def regenerate_concepts(self, rejected: List[str], avoid: List[str]) -> str:
+        """
+        Generate replacements for just the rejected concepts of an issue
+        
+        Args:
+            rejected: Titles that were rejected as near-duplicates
+            avoid: Other topics the replacements must not repeat
+            
+        Returns:
+            Generated content with one section per replacement
+        """
+        max_tokens = max(400, self.max_tokens * len(rejected) // 5)
+        return self.complete(self._create_replacement_prompt(rejected, avoid),
+                             max_tokens=min(max_tokens, self.max_tokens))
+    
+    async def acomplete_many(self, prompts: Sequence[str],
+                             max_tokens: Optional[int] = None) -> List[str]:
+        """
+        Run several prompts concurrently, at most max_concurrency in flight
+        
+        Afterwards last_usage and last_prompt_tokens are the totals of the
+        whole batch; the requests themselves never write shared state.
+        
+        Args:
+            prompts: Prompt texts
+            max_tokens: Optional override of the response token limit
+            
+        Returns:
+            Generated texts, in prompt order
+        """
+        results = await asyncio.gather(
+            *(self._acomplete(prompt, max_tokens) for prompt in prompts)
+        )
+        self.last_usage = _sum_usage([usage for _, usage in results])
+        self.last_prompt_tokens = sum(estimate_tokens(prompt) for prompt in prompts)
+        return [content for content, _ in results]
+    
+    def complete_many(self, prompts: Sequence[str], max_tokens: Optional[int] = None) -> List[str]:
+        """
+        Synchronous facade over acomplete_many()
+        
+        Called from code already running an event loop, the batch runs on a
+        private loop in a worker thread instead of failing in asyncio.run().
+        
+        Args:
+            prompts: Prompt texts
+            max_tokens: Optional override of the response token limit
+            
+        Returns:
+            Generated texts, in prompt order
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.acomplete_many(prompts, max_tokens))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.acomplete_many(prompts, max_tokens)).result()
+    
+    def generate_many(self, histories: Sequence[List[str]]) -> List[str]:
+        """
+        Generate one issue per history (e.g. per segment or language) concurrently
+        
+        Args:
+            histories: Previously covered topics for each generation
+            
+        Returns:
+            Generated concepts texts, in input order
+        """
+        return self.complete_many([self._create_prompt(history) for history in histories])
+    
+    def generate_batch(self, previous_concepts: List[str], request_count: int,
+                       concepts_per_request: int = 10,
+                       focuses: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        Generate many concepts at once with a few concurrent requests
+        
+        Args:
+            previous_concepts: List of previously covered topics
+            request_count: Number of concurrent requests
+            concepts_per_request: Concepts asked for in each request
+            focuses: Sub-areas assigned to the requests in rotation
+            
+        Returns:
+            Generated concepts texts, one per request
+        """
+        focuses = list(focuses or [None])
+        prompts = [
+            self._create_prompt(previous_concepts, concepts_per_request, focuses[i % len(focuses)])
+            for i in range(request_count)
+        ]
+        # Roughly 400 tokens per concept, never less than the configured limit
+        return self.complete_many(prompts, max(self.max_tokens, 400 * concepts_per_request))
+    
+    def _create_topics_prompt(self, previous_concepts: List[str], count: int) -> str:
+        """
+        Create prompt asking only for the names of new concepts
+        
+        Args:
+            previous_concepts: List of previously covered topics
+            count: Number of names to ask for
+            
+        Returns:
+            Formatted prompt string
+        """
+        with metrics.span('generate.prompt', history=len(previous_concepts)):
+            self.last_history = self.history_compactor.compact(previous_concepts)
+        prompt = f"""List {count} new and important concepts in artificial intelligence that have NOT been covered before.
+
+Previously covered topics to AVOID: {self.last_history.text}
+
+Reply with the names only, one per line, numbered 1 to {count}, without descriptions.
+Ensure all {count} concepts are distinct from each other and from the topics above.{self._audience_instructions()}"""
+        self.last_prompt_tokens = estimate_tokens(prompt)
+        return prompt
+    
+    def _create_concept_prompt(self, topic: str, others: Sequence[str]) -> str:
+        """
+        Create prompt for writing up a single chosen concept
+        
+        Args:
+            topic: Concept name
+            others: The issue's other concepts, which must not be repeated
+            
+        Returns:
+            Formatted prompt string
+        """
+        others_text = "; ".join(others) or "none"
+        return f"""Explain this concept in artificial intelligence: {topic}
+
+Start with the heading "## 1. {topic}", then provide:
+1. Clear definition
+2. Key points (2-3 bullet points)
+3. Practical applications
+4. A relevant example
+
+Write about this concept only; these are covered separately: {others_text}
+Make the content educational, engaging, and suitable for daily learning.{self._audience_instructions()}"""
+    
+    @staticmethod
+    def parse_topics(content: str) -> List[str]:
+        """
+        Read concept names from a numbered or bulleted list
+        
+        Args:
+            content: Response to a topics prompt
+            
+        Returns:
+            Distinct names in order; descriptions after a dash or colon are dropped
+        """
+        topics = []
+        seen = set()
+        for line in content.split('\n'):
+            match = _TOPIC_LINE_RE.match(line)
+            if not match:
+                continue
+            name = _TOPIC_DESCRIPTION_RE.split(match.group(1).replace('**', ''), maxsplit=1)[0]
+            name = clean_heading_text(name).strip(' .')
+            # Acronyms such as RLHF are fine here, unlike in concept headings
+            if (2 < len(name) < 100 and len(name.split()) <= 12
+                    and name.lower() not in SECTION_LABELS and name.lower() not in seen):
+                seen.add(name.lower())
+                topics.append(name)
+        return topics
+    
+    def pick_topics(self, previous_concepts: List[str], count: int = 5) -> List[str]:
+        """
+        Ask for concept names only, in one short completion
+        
+        Args:
+            previous_concepts: List of previously covered topics
+            count: Number of names to ask for
+            
+        Returns:
+            Distinct concept names (possibly fewer than count)
+        """
+        return self.parse_topics(self.complete(self._create_topics_prompt(previous_concepts, count),
+                                               max_tokens=TOPIC_TOKENS * count + 50))
+    
+    @classmethod
+    def _concept_section(cls, topic: str, content: str) -> str:
+        """The first concept section of a single-concept response, headed by topic if it has none"""
+        sections = cls.split_concept_sections(content)[1]
+        if sections:
+            return sections[0][1].strip()
+        return f"## 1. {topic}\n\n{content.strip()}"
+    
+    def expand_topics(self, topics: Sequence[str], max_tokens: int = CONCEPT_TOKENS) -> str:
+        """
+        Write up each topic in its own concurrent request
+        
+        Args:
+            topics: Chosen concept names
+            max_tokens: Response token limit of each request
+            
+        Returns:
+            Concepts text with one section per topic, in topic order
+        """
+        prompts = [self._create_concept_prompt(topic, [t for t in topics if t != topic])
+                   for topic in topics]
+        texts = self.complete_many(prompts, max_tokens)
+        return self.join_concept_sections(
+            [self._concept_section(topic, text) for topic, text in zip(topics, texts)]
+        )
+    
+    def generate_concepts_parallel(self, previous_concepts: List[str], count: int = 5,
+                                   candidates: Optional[int] = None,
+                                   choose: Optional[Callable[[List[str], int], List[str]]] = None,
+                                   concept_max_tokens: int = CONCEPT_TOKENS) -> str:
+        """
+        Generate concepts with one short call picking topics and one concurrent call per concept
+        
+        Wall-clock time is then about one short completion plus the decoding of
+        a single concept, instead of the decoding of the whole issue. Falls back
+        to generate_concepts() if too few topics come back or a concept fails.
+        
+        Args:
+            previous_concepts: List of previously covered topics
+            count: Number of concepts in the result
+            candidates: Topic names to ask for before choosing (defaults to count)
+            choose: Narrows (topics, count) down to the topics to expand, e.g. by
+                dropping near-duplicates; topics beyond count are ignored
+            concept_max_tokens: Response token limit of each concept request
+            
+        Returns:
+            Generated concepts text
+        """
+        candidates = max(count, candidates or count)
+        try:
+            with metrics.span('generate.topics', candidates=candidates):
+                topics = self.pick_topics(previous_concepts, candidates)
+            topics_usage, topics_prompt_tokens = self.last_usage, self.last_prompt_tokens
+            if choose is not None:
+                topics = choose(topics, count)
+            topics = topics[:count]
+            if len(topics) < count:
+                raise ValueError(f"only {len(topics)} usable topics")
+            with metrics.span('generate.expand', concepts=count):
+                text = self.expand_topics(topics, concept_max_tokens)
+            # Report the issue as a whole: the topics call plus every concept call
+            self.last_usage = _sum_usage([topics_usage, self.last_usage])
+            self.last_prompt_tokens += topics_prompt_tokens
+            return text
+        except Exception as e:
+            metrics.incr('parallel_generation_fallbacks')
+            print(f"⚠️ Parallel generation failed ({e}); falling back to a single request")
+        return self.generate_concepts(previous_concepts, count=candidates)
+    
     @staticmethod
-    def extract_concept_titles(content: str) -> List[str]:
+    def extract_concept_titles(content: str, limit: int = 5) -> List[str]:
         """
         Extract concept titles from generated content
         
         Args:
             content: Generated content text
+            limit: Maximum number of titles to return
             
         Returns:
             List of extracted concept titles
         """
-        lines = content.split('\n')
-        concepts = []
-        
-        banned_titles = {
-            "definition",
-            "definitions",
-            "key points",
-            "key point",
-            "key takeaways",
-            "practical applications",
-            "practical application",
-            "applications",
-            "example",
-            "examples",
-            "use cases",
-            "overview",
-            "summary",
-            "conclusion",
-            "insights",
-        }
-
-        for line in lines:
-            line = line.strip()
-            # Look for headings (lines starting with # or ** or numbered)
-            if line and (line.startswith('#') or line.startswith('**') or 
-                        (len(line.split()) <= 8 and line[0].isdigit())):
-                # Clean the title
-                clean_title = (line.replace('#', '')
-                                  .replace('*', '')
-                                  .replace(':', '')
-                                  .strip())
-                clean_title = re.sub(r'^\d+[\).\s-]*', '', clean_title).strip()
-                
-                # Filter reasonable titles
-                if 5 < len(clean_title) < 100 and not clean_title.startswith('-'):
-                    if clean_title.lower() in banned_titles:
-                        continue
-                    concepts.append(clean_title)
-        
-        # Return first 5 unique concepts
-        unique_concepts = []
-        for concept in concepts:
-            if concept not in unique_concepts:
-                unique_concepts.append(concept)
-            if len(unique_concepts) == 5:
-                break
-        
-        return unique_concepts
+        return parse_markdown(content).titles(limit)
+    
+    @staticmethod
+    def split_concept_sections(content: str) -> Tuple[str, List[Tuple[str, str]]]:
+        """
+        Split generated content into one block of text per concept
+        
+        Section labels such as "**Example**" stay inside their concept.
+        
+        Args:
+            content: Generated content text
+            
+        Returns:
+            Tuple of (preamble before the first concept, [(title, section text), ...])
+        """
+        doc = parse_markdown(content)
+        return ('\n'.join(doc.preamble_lines).strip(),
+                [(concept.title, concept.source) for concept in doc.concepts])
+    
+    @staticmethod
+    def join_concept_sections(sections: Sequence[str], preamble: str = "") -> str:
+        """
+        Reassemble concept sections into one response, renumbering headings
+        
+        Args:
+            sections: Section texts as returned by split_concept_sections()
+            preamble: Optional text placed before the first concept
+            
+        Returns:
+            Combined content whose numbered headings run 1..len(sections)
+        """
+        parts = [preamble] if preamble else []
+        for number, section in enumerate(sections, start=1):
+            parts.append(_HEADING_NUMBER_RE.sub(lambda m: f"{m.group(1)}{number}", section, count=1))
+        return '\n\n'.join(parts)
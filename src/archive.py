@@ -0,0 +1,235 @@
+"""
+Archive module for keeping every sent issue in full.
+Issues are appended to compressed segment files with a small offset index
+per segment, so any past issue or concept loads with one seek and one
+decompress, and a daily append only touches the newest segment.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+try:
+    from .document import parse_markdown
+except ImportError:
+    from document import parse_markdown
+
+
+# Record header: compressed length and CRC-32 of the compressed bytes
+_HEADER = struct.Struct('<II')
+_SEGMENT_PATTERN = "issues-{:06d}"
+
+
+@dataclass
+class ArchiveEntry:
+    """Index entry locating one archived issue"""
+
+    id: int
+    date: str
+    segment: str
+    content_hash: str
+    file: str
+    offset: int
+    length: int
+    titles: List[str] = field(default_factory=list)
+
+
+class IssueArchive:
+    """Append-only store of complete issues: response text, concepts and HTML"""
+
+    def __init__(self, directory: str, max_segment_bytes: int = 1024 * 1024,
+                 compression_level: int = 9):
+        """
+        Initialize archive
+
+        Args:
+            directory: Directory holding the .seg and .idx files
+            max_segment_bytes: Size after which a new segment file is started
+            compression_level: zlib level for new records
+        """
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._entries: List[ArchiveEntry] = []
+        self._by_issue: Dict[tuple, ArchiveEntry] = {}
+        self._by_title: Dict[str, ArchiveEntry] = {}
+        self._segment_ends: Dict[str, int] = {}
+        self._load_index()
+
+    def _segment_path(self, name: str, extension: str) -> str:
+        return os.path.join(self.directory, name + extension)
+
+    def _segment_names(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-4] for name in names if name.endswith('.idx'))
+
+    def _load_index(self):
+        """Read every segment index (small JSON lines files) into memory"""
+        for name in self._segment_names():
+            with open(self._segment_path(name, '.idx'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    # A line without its newline was cut short by a crash; the
+                    # next append truncates it together with its record
+                    if not line.endswith('\n'):
+                        break
+                    self._index(ArchiveEntry(**json.loads(line)))
+
+    def _index(self, entry: ArchiveEntry):
+        self._entries.append(entry)
+        self._by_issue[(entry.segment, entry.date)] = entry
+        for title in entry.titles:
+            self._by_title[title.lower()] = entry
+        self._segment_ends[entry.file] = max(self._segment_ends.get(entry.file, 0),
+                                             entry.offset + entry.length)
+
+    def _newest_segment(self, record_size: int) -> str:
+        """Name of the segment the next record goes to"""
+        names = self._segment_names()
+        if not names:
+            return _SEGMENT_PATTERN.format(1)
+        newest = names[-1]
+        end = self._segment_ends.get(newest, 0)
+        if end and end + record_size > self.max_segment_bytes:
+            return _SEGMENT_PATTERN.format(int(newest.rsplit('-', 1)[1]) + 1)
+        return newest
+
+    def append(self, date: str, concepts_text: str, html: str = "",
+               segment: str = 'general-en', subject: str = "") -> ArchiveEntry:
+        """
+        Archive one issue
+
+        Args:
+            date: Issue date as YYYY-MM-DD
+            concepts_text: Generated response text
+            html: Rendered HTML email
+            segment: Subscriber segment slug
+            subject: Email subject line
+
+        Returns:
+            The new index entry, or the existing one if this exact issue
+            was archived before
+        """
+        content_hash = hashlib.sha256(concepts_text.encode('utf-8')).hexdigest()
+        doc = parse_markdown(concepts_text)
+        record = {
+            'date': date,
+            'segment': segment,
+            'subject': subject,
+            'response': concepts_text,
+            'concepts': [{'title': c.title, 'markdown': c.source} for c in doc.concepts],
+            'html': html,
+        }
+        payload = zlib.compress(json.dumps(record, ensure_ascii=False).encode('utf-8'),
+                                self.compression_level)
+
+        with self._lock:
+            existing = self._by_issue.get((segment, date))
+            if existing is not None and existing.content_hash == content_hash:
+                return existing
+
+            name = self._newest_segment(_HEADER.size + len(payload))
+            os.makedirs(self.directory, exist_ok=True)
+            offset = self._segment_ends.get(name, 0)
+            seg_path = self._segment_path(name, '.seg')
+            with open(seg_path, 'ab') as f:
+                # Drop bytes left behind by a crash after the last indexed record
+                f.truncate(offset)
+                f.write(_HEADER.pack(len(payload), zlib.crc32(payload)))
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+            entry = ArchiveEntry(
+                id=len(self._entries) + 1, date=date, segment=segment,
+                content_hash=content_hash, file=name, offset=offset,
+                length=_HEADER.size + len(payload), titles=doc.titles()
+            )
+            idx_path = self._segment_path(name, '.idx')
+            with open(idx_path, 'a+', encoding='utf-8') as f:
+                f.seek(0)
+                complete = f.read().rpartition('\n')[0]
+                f.seek(0)
+                f.truncate(len(complete.encode('utf-8')) + (1 if complete else 0))
+                f.seek(0, os.SEEK_END)
+                f.write(json.dumps(asdict(entry), ensure_ascii=False) + '\n')
+            self._index(entry)
+            return entry
+
+    def read(self, entry: ArchiveEntry) -> dict:
+        """
+        Load one record with a single seek and decompress
+
+        Args:
+            entry: Index entry from entries()
+
+        Returns:
+            Record with 'response', 'concepts', 'html' and metadata
+
+        Raises:
+            ValueError: If the record fails its checksum
+        """
+        with open(self._segment_path(entry.file, '.seg'), 'rb') as f:
+            f.seek(entry.offset)
+            data = f.read(entry.length)
+        length, crc = _HEADER.unpack_from(data)
+        payload = data[_HEADER.size:_HEADER.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            raise ValueError(f"Corrupt archive record {entry.id} in {entry.file}.seg")
+        return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+    def entries(self, segment: Optional[str] = None) -> List[ArchiveEntry]:
+        """
+        List archived issues, oldest first
+
+        Args:
+            segment: Only issues of this segment slug
+
+        Returns:
+            Index entries (no segment data is read)
+        """
+        return [e for e in self._entries if segment is None or e.segment == segment]
+
+    def get_issue(self, date: str, segment: str = 'general-en') -> Optional[dict]:
+        """
+        Load a past issue
+
+        Args:
+            date: Issue date as YYYY-MM-DD
+            segment: Subscriber segment slug
+
+        Returns:
+            Record with 'response', 'concepts', 'html' and metadata, or None
+        """
+        entry = self._by_issue.get((segment, date))
+        return self.read(entry) if entry else None
+
+    def find_concept(self, title: str) -> Optional[dict]:
+        """
+        Load the latest archived write-up of a concept
+
+        Args:
+            title: Concept title (case-insensitive)
+
+        Returns:
+            Dict with 'title', 'markdown', 'date' and 'segment', or None
+        """
+        entry = self._by_title.get(title.strip().lower())
+        if entry is None:
+            return None
+        record = self.read(entry)
+        for concept in record['concepts']:
+            if concept['title'].lower() == title.strip().lower():
+                return dict(concept, date=record['date'], segment=record['segment'])
+        return None
+
+    def __len__(self) -> int:
+        return len(self._entries)
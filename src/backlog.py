@@ -0,0 +1,280 @@
+"""
+Backlog module for prefetching issues ahead of their send date.
+Generates several days of issues in a few batched requests, de-duplicates
+them against history and keeps them in a local SQLite queue.
+"""
+
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Sequence
+
+try:
+    from .ai_generator import AIConceptGenerator
+    from .dedup import NearDuplicateIndex
+    from .metrics import metrics
+except ImportError:
+    from ai_generator import AIConceptGenerator
+    from dedup import NearDuplicateIndex
+    from metrics import metrics
+
+
+# Sub-areas assigned to concurrent batch requests in rotation
+BACKLOG_FOCUSES = (
+    "foundations and learning theory",
+    "model architectures",
+    "training, optimization and data",
+    "evaluation, interpretability and safety",
+    "deployment, systems and efficiency",
+    "applications across industries",
+)
+
+
+@dataclass
+class BacklogEntry:
+    """One queued issue"""
+
+    id: int
+    segment: str
+    concepts_text: str
+    titles: List[str] = field(default_factory=list)
+    created_at: float = 0.0
+
+
+class IssueBacklog:
+    """FIFO queue of ready-to-send issues per segment, stored in SQLite"""
+
+    def __init__(self, db_file: str):
+        """
+        Initialize backlog
+
+        Args:
+            db_file: Path to the SQLite database
+        """
+        self.db_file = db_file
+        directory = os.path.dirname(db_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS issues (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                segment TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                concepts_text TEXT NOT NULL,
+                titles TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (segment, content_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_issues_segment ON issues(segment, id);
+        """)
+
+    def push(self, segment: str, issues: Sequence[str]) -> int:
+        """
+        Append issues to a segment's queue
+
+        Args:
+            segment: Segment identifier, e.g. Segment.slug
+            issues: Concepts texts, oldest first
+
+        Returns:
+            Number of issues added (identical issues are stored once)
+        """
+        now = time.time()
+        rows = [
+            (segment, hashlib.sha256(text.encode('utf-8')).hexdigest(), text,
+             json.dumps(AIConceptGenerator.extract_concept_titles(text, limit=None)), now)
+            for text in issues
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO issues (segment, content_hash, concepts_text, titles, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def peek(self, segment: str, sent_titles: Iterable[str] = ()) -> Optional[BacklogEntry]:
+        """
+        Get the oldest issue of a segment without removing it
+
+        Issues whose titles were all sent already (e.g. by a run that stopped
+        before removing them) are dropped on the way.
+
+        Args:
+            segment: Segment identifier
+            sent_titles: Titles already in the segment's history
+
+        Returns:
+            The next issue to send, or None if the queue is empty
+        """
+        sent = set(sent_titles)
+        while True:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT id, segment, concepts_text, titles, created_at FROM issues "
+                    "WHERE segment = ? ORDER BY id LIMIT 1",
+                    (segment,)
+                ).fetchone()
+            if row is None:
+                return None
+            entry = BacklogEntry(row[0], row[1], row[2], json.loads(row[3]), row[4])
+            if not entry.titles or not sent.issuperset(entry.titles):
+                return entry
+            self.remove(entry.id)
+
+    def remove(self, entry_id: int):
+        """
+        Remove an issue, normally after it was sent
+
+        Args:
+            entry_id: BacklogEntry.id
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM issues WHERE id = ?", (entry_id,))
+
+    def size(self, segment: str) -> int:
+        """Number of queued issues of a segment"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM issues WHERE segment = ?",
+                                      (segment,)).fetchone()[0]
+
+    def titles(self, segment: str) -> List[str]:
+        """All concept titles queued for a segment, oldest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT titles FROM issues WHERE segment = ? ORDER BY id",
+                                      (segment,)).fetchall()
+        return [title for row in rows for title in json.loads(row[0])]
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+def build_issues(texts: Iterable[str], known_titles: Iterable[str], concepts_per_issue: int = 5,
+                 duplicate_threshold: float = 0.5) -> List[str]:
+    """
+    Turn batch responses into issues of unique concepts
+
+    Args:
+        texts: Generated responses
+        known_titles: Titles already sent or queued
+        concepts_per_issue: Concepts in each issue
+        duplicate_threshold: Shingle Jaccard similarity counted as a repeat
+
+    Returns:
+        Complete issues; leftover concepts that do not fill one are dropped
+    """
+    index = NearDuplicateIndex.from_titles(known_titles, threshold=duplicate_threshold)
+    sections = []
+    for text in texts:
+        for title, section in AIConceptGenerator.split_concept_sections(text)[1]:
+            if index.is_duplicate(title):
+                continue
+            index.add(title)
+            sections.append(section)
+
+    return [
+        AIConceptGenerator.join_concept_sections(sections[start:start + concepts_per_issue])
+        for start in range(0, len(sections) - concepts_per_issue + 1, concepts_per_issue)
+    ]
+
+
+class BacklogFiller:
+    """Tops a segment's backlog up with batched generation"""
+
+    def __init__(self, generator_factory: Callable[[], AIConceptGenerator], backlog: IssueBacklog,
+                 concepts_per_issue: int = 5, concepts_per_request: int = 10,
+                 duplicate_threshold: float = 0.5, overgeneration: float = 1.3):
+        """
+        Initialize filler
+
+        Args:
+            generator_factory: Returns a fresh generator (one per fill, closed afterwards)
+            backlog: Queue to fill
+            concepts_per_issue: Concepts in each issue
+            concepts_per_request: Concepts asked for in each API request
+            duplicate_threshold: Shingle Jaccard similarity counted as a repeat
+            overgeneration: Extra concepts requested to make up for rejected duplicates
+        """
+        self.generator_factory = generator_factory
+        self.backlog = backlog
+        self.concepts_per_issue = concepts_per_issue
+        self.concepts_per_request = concepts_per_request
+        self.duplicate_threshold = duplicate_threshold
+        self.overgeneration = overgeneration
+
+    def fill(self, segment: str, history: List[str], target: int) -> int:
+        """
+        Generate issues until the segment has target queued (one batch at most)
+
+        Args:
+            segment: Segment identifier
+            history: Titles already sent to the segment
+            target: Desired queue length
+
+        Returns:
+            Number of issues added
+        """
+        needed = target - self.backlog.size(segment)
+        if needed <= 0:
+            return 0
+
+        queued = self.backlog.titles(segment)
+        request_count = math.ceil(needed * self.concepts_per_issue * self.overgeneration
+                                  / self.concepts_per_request)
+        with metrics.span('backlog.fill', segment=segment, requests=request_count) as attrs:
+            with self.generator_factory() as generator:
+                texts = generator.generate_batch(history + queued, request_count,
+                                                 self.concepts_per_request, BACKLOG_FOCUSES)
+            issues = build_issues(texts, history + queued, self.concepts_per_issue,
+                                  self.duplicate_threshold)
+            attrs['added'] = self.backlog.push(segment, issues[:needed])
+        return attrs['added']
+
+    def fill_in_background(self, segment: str, history: List[str], target: int,
+                           close_when_done: bool = False) -> threading.Thread:
+        """
+        Start fill() in a thread; join it before the process exits
+
+        Args:
+            segment: Segment identifier
+            history: Titles already sent to the segment
+            target: Desired queue length
+            close_when_done: Close the backlog when the thread finishes
+
+        Returns:
+            The started thread
+        """
+        history = list(history)
+
+        def run():
+            try:
+                added = self.fill(segment, history, target)
+                print(f"   ↻ Backlog refilled with {added} {segment} issues")
+            except Exception as e:
+                print(f"⚠️ Backlog refill for {segment} failed: {e}")
+            finally:
+                if close_when_done:
+                    self.backlog.close()
+
+        thread = threading.Thread(target=run, name=f"backlog-refill-{segment}", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,175 @@
+"""
+Checkpoint module for resumable daily runs.
+Persists each stage's output under a key derived from its inputs, and keeps
+per-issue markers so a resumed run never sends the same issue twice.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Any, List, Optional
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+_MISSING = object()
+
+
+def checkpoint_key(*parts: Any) -> str:
+    """
+    Derive a content-addressed key from stage inputs
+
+    Args:
+        *parts: JSON-serializable inputs (strings, numbers, lists, dicts)
+
+    Returns:
+        Hex SHA-256 digest of the canonical JSON encoding of the inputs
+    """
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class CheckpointStore:
+    """Directory of stage outputs and send markers, one JSON file per entry"""
+
+    SENT_STAGE = 'sent'
+
+    def __init__(self, directory: str):
+        """
+        Initialize checkpoint store
+
+        Args:
+            directory: Root directory; stages are kept in subdirectories
+        """
+        self.directory = directory
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.directory, stage, f"{key}.json")
+
+    def _write(self, path: str, payload: dict):
+        # Write to a temporary file and rename so a crash never leaves a partial checkpoint
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read(self, path: str) -> Optional[dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return payload if isinstance(payload, dict) else None
+
+    def load(self, stage: str, key: str, default: Any = None) -> Any:
+        """
+        Load a stage output
+
+        Args:
+            stage: Stage name, e.g. 'generate'
+            key: Key from checkpoint_key()
+            default: Value returned when there is no checkpoint
+
+        Returns:
+            The saved value, or default
+        """
+        payload = self._read(self._path(stage, key))
+        found = payload is not None and 'value' in payload
+        metrics.incr('checkpoint_lookups', stage=stage, result='hit' if found else 'miss')
+        return payload['value'] if found else default
+
+    def save(self, stage: str, key: str, value: Any):
+        """
+        Save a stage output
+
+        Args:
+            stage: Stage name
+            key: Key from checkpoint_key()
+            value: JSON-serializable output
+        """
+        self._write(self._path(stage, key),
+                    {'stage': stage, 'key': key, 'created_at': time.time(), 'value': value})
+
+    def get_or_compute(self, stage: str, key: str, compute):
+        """
+        Return a saved stage output, computing and saving it when missing
+
+        Args:
+            stage: Stage name
+            key: Key from checkpoint_key()
+            compute: Zero-argument callable producing the output
+
+        Returns:
+            Tuple of (value, resumed) where resumed is True for a checkpoint hit
+        """
+        value = self.load(stage, key, _MISSING)
+        if value is not _MISSING:
+            return value, True
+        value = compute()
+        self.save(stage, key, value)
+        return value, False
+
+    def sent_marker(self, issue_key: str) -> Optional[dict]:
+        """
+        Get the send marker of an issue
+
+        Args:
+            issue_key: Key identifying one issue to one recipient
+
+        Returns:
+            Marker dict (with 'sent_at' and 'stored') or None if never sent
+        """
+        return self._read(self._path(self.SENT_STAGE, issue_key))
+
+    def mark_sent(self, issue_key: str, content_key: str, titles: List[str], stored: bool = False,
+                  concepts_key: Optional[str] = None):
+        """
+        Record that an issue was accepted by the mail server
+
+        Args:
+            issue_key: Key identifying one issue to one recipient
+            content_key: Key of the HTML that was sent
+            titles: Concept titles of the issue, needed to finish the storage update
+            stored: Whether the concept history has been updated too
+            concepts_key: Key of the 'generate' checkpoint holding the issue text,
+                needed to archive it on a resumed run (kept by later updates)
+        """
+        marker = self.sent_marker(issue_key) or {'sent_at': time.time()}
+        marker.update({'issue_key': issue_key, 'content_key': content_key,
+                       'titles': list(titles), 'stored': stored})
+        if concepts_key is not None:
+            marker['concepts_key'] = concepts_key
+        self._write(self._path(self.SENT_STAGE, issue_key), marker)
+
+    def prune(self, max_age_days: float) -> int:
+        """
+        Delete checkpoints and markers older than max_age_days
+
+        Args:
+            max_age_days: Age limit in days
+
+        Returns:
+            Number of deleted files
+        """
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return 0
+        for stage in os.listdir(self.directory):
+            stage_dir = os.path.join(self.directory, stage)
+            if not os.path.isdir(stage_dir):
+                continue
+            for name in os.listdir(stage_dir):
+                path = os.path.join(stage_dir, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
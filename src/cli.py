@@ -0,0 +1,415 @@
+"""
+Command-line interface for AI Insight Daily.
+Each subcommand imports only the modules it needs, so light commands such as
+`history` and `render` start without loading requests, smtplib or numpy.
+
+Usage:
+    python src/cli.py run                          # the full daily pipeline
+    python src/cli.py run --profile                # ... with per-stage CPU and allocation profiles
+    python src/cli.py generate -o issue.md         # concepts text only
+    python src/cli.py render issue.md -o issue.html
+    python src/cli.py send issue.html
+    python src/cli.py history --limit 20
+    python src/cli.py archive --concept "Dropout"  # a past write-up, from the archive
+    python src/cli.py search "retrieval augmented generation"
+    python src/cli.py subscribers --add ada@example.com --timezone Europe/London
+    python src/cli.py fanout                       # every due subscriber, by segment
+    python src/cli.py daemon                       # stay running, send on DAEMON_SCHEDULE
+    python src/cli.py daemon --check               # health check for a running daemon
+    python src/cli.py backlog --fill               # prefetch a week of issues
+    python src/cli.py outbox --deliver --watch     # delivery worker for OUTBOX_MODE
+    python src/cli.py bench -- --filter storage    # arguments after -- go to the benchmarks
+"""
+
+import argparse
+import os
+import sys
+from typing import Optional, Sequence
+
+
+# Seconds allowed for importing this module and building the parser in a
+# fresh interpreter; enforced by the test suite
+IMPORT_TIME_BUDGET = 0.1
+
+# Modules that only the commands needing them may load
+HEAVY_MODULES = ('requests', 'smtplib', 'email.mime.text', 'numpy')
+
+
+def _read_text(path: str) -> str:
+    if path == '-':
+        return sys.stdin.read()
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _write_text(path: str, text: str):
+    if path == '-':
+        sys.stdout.write(text if text.endswith('\n') else text + '\n')
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    print(f"✅ Wrote {path}", file=sys.stderr)
+
+
+def cmd_run(args) -> int:
+    """Run the full pipeline"""
+    import main as pipeline
+    return pipeline.run_profiled(pipeline.main) if args.profile else pipeline.main()
+
+
+def cmd_fanout(args) -> int:
+    """Send today's issue to every due subscriber"""
+    import main as pipeline
+    return pipeline.run_profiled(pipeline.run_fanout) if args.profile else pipeline.run_fanout()
+
+
+def cmd_daemon(args) -> int:
+    """Run as a long-lived scheduler, or check on one"""
+    if args.check:
+        from config import config
+        from daemon import check_health
+
+        healthy, description = check_health(config.daemon_health_file, max_age=args.max_age)
+        print(f"{'✅' if healthy else '❌'} {description}")
+        return 0 if healthy else 1
+    import main as pipeline
+    return pipeline.run_daemon()
+
+
+def cmd_subscribers(args) -> int:
+    """List, add or remove subscribers"""
+    from config import config
+    from subscribers import Subscriber, SubscriberRegistry
+
+    registry = SubscriberRegistry(config.subscribers_file)
+    if args.add:
+        registry.add(Subscriber(args.add, name=args.name or "", interest=args.interest,
+                                language=args.language, timezone=args.timezone,
+                                send_hour=args.hour))
+        print(f"✅ Added {args.add}", file=sys.stderr)
+    elif args.remove:
+        if not registry.remove(args.remove):
+            print(f"❌ No subscriber {args.remove}", file=sys.stderr)
+            return 1
+        print(f"✅ Removed {args.remove}", file=sys.stderr)
+    else:
+        for segment, members in registry.by_segment(registry.load()).items():
+            print(f"[{segment.slug}]")
+            for s in members:
+                status = "" if s.active else " (inactive)"
+                print(f"  {s.email}  {s.timezone} {s.send_hour:02d}:00{status}")
+    return 0
+
+
+def cmd_backlog(args) -> int:
+    """Show or top up the prefetched issue backlog"""
+    from contextlib import redirect_stdout
+    from config import config
+    from backlog import IssueBacklog
+    from subscribers import Segment
+
+    segment = Segment(args.interest, args.language)
+    backlog = IssueBacklog(config.backlog_file)
+    try:
+        if args.fill:
+            import main as pipeline
+            config.validate(['PERPLEXITY_API_KEY'])
+            storage = pipeline.segment_storage(segment)
+            try:
+                history = storage.get_recent_concepts(count=config.dedup_history_window)
+            finally:
+                storage.close()
+            with redirect_stdout(sys.stderr):
+                added = pipeline.backlog_filler(segment, backlog).fill(
+                    segment.slug, history, args.target or config.backlog_target_issues)
+            print(f"✅ Added {added} issues", file=sys.stderr)
+        print(f"{segment.slug}: {backlog.size(segment.slug)} issues queued")
+    finally:
+        backlog.close()
+    return 0
+
+
+def cmd_outbox(args) -> int:
+    """Show, requeue or deliver the outbox"""
+    from config import config
+    from outbox import Outbox
+
+    outbox = Outbox(config.outbox_file)
+    exit_code = 0
+    try:
+        if args.retry_dead:
+            print(f"✅ Requeued {outbox.retry_dead()} dead letters", file=sys.stderr)
+        if args.deliver or args.watch:
+            import signal
+            import threading
+            import main as pipeline
+            config.validate(['FROM_EMAIL', 'APP_PASSWORD'])
+            with pipeline.make_email_sender() as email_sender:
+                worker = pipeline.make_delivery_worker(outbox, email_sender)
+                if args.watch:
+                    stop = threading.Event()
+                    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+                    try:
+                        worker.run_forever(stop, on_report=pipeline.print_delivery_report)
+                    except KeyboardInterrupt:
+                        pass
+                else:
+                    report = worker.drain()
+                    pipeline.print_delivery_report(report)
+                    exit_code = 1 if report.dead else 0
+            outbox.prune(config.checkpoint_retention_days)
+        print("  ".join(f"{state}: {count}" for state, count in outbox.counts().items()))
+        for to_email, attempts, error in outbox.dead_letters(args.limit):
+            print(f"  ❌ {to_email} after {attempts} attempts: {error}")
+    finally:
+        outbox.close()
+    return exit_code
+
+
+def cmd_generate(args) -> int:
+    """Generate an issue's concepts text without rendering or sending it"""
+    from contextlib import redirect_stdout
+    from config import config
+    from storage import ConceptStorage
+    import main as pipeline
+
+    config.validate(['PERPLEXITY_API_KEY'])
+    storage = ConceptStorage(config.storage_file, backend=config.storage_backend)
+    try:
+        previous_concepts = storage.get_recent_concepts(count=config.prompt_history_window)
+        history = storage.get_recent_concepts(count=config.dedup_history_window)
+    finally:
+        storage.close()
+
+    # Progress goes to stderr so the concepts text can be piped
+    with redirect_stdout(sys.stderr):
+        concepts_text = pipeline.generate_issue(previous_concepts, history, {})
+    _write_text(args.output, concepts_text)
+    return 0
+
+
+def cmd_render(args) -> int:
+    """Render concepts text as the HTML email"""
+    from config import config
+    from email_template import EmailTemplate
+
+    html_email = EmailTemplate.create_html_email(
+        _read_text(args.input),
+        date=args.date,
+        recipient_name=args.name or config.recipient_name
+    )
+    _write_text(args.output, html_email)
+    return 0
+
+
+def cmd_send(args) -> int:
+    """Send a rendered HTML email"""
+    from config import config
+    from email_sender import EmailSender
+
+    config.validate(['FROM_EMAIL', 'APP_PASSWORD'] + ([] if args.to else ['TO_EMAIL']))
+    to_email = args.to or config.to_email
+    email_sender = EmailSender(
+        smtp_server=config.smtp_server,
+        smtp_port=config.smtp_port,
+        from_email=config.from_email,
+        app_password=config.app_password,
+        use_ssl=config.smtp_use_ssl
+    )
+    with email_sender:
+        email_sender.send_html_email(
+            to_email=to_email,
+            subject=args.subject or config.email_subject,
+            html_content=_read_text(args.input)
+        )
+    print(f"✅ Email sent successfully to {to_email}", file=sys.stderr)
+    return 0
+
+
+def cmd_history(args) -> int:
+    """Show stored concept history"""
+    from config import config
+    from storage import ConceptStorage
+
+    storage = ConceptStorage(config.storage_file, backend=config.storage_backend)
+    try:
+        if args.count:
+            print(storage.count())
+            return 0
+        for title in storage.get_recent_concepts(count=args.limit):
+            print(title)
+    finally:
+        storage.close()
+    return 0
+
+
+def cmd_archive(args) -> int:
+    """List archived issues or print a past issue or concept"""
+    from config import config
+    from archive import IssueArchive
+
+    archive = IssueArchive(config.archive_dir)
+    segment = args.segment or 'general-en'
+    if args.concept:
+        concept = archive.find_concept(args.concept)
+        if concept is None:
+            print(f"❌ No archived concept {args.concept!r}", file=sys.stderr)
+            return 1
+        _write_text(args.output, concept['markdown'])
+    elif args.date:
+        issue = archive.get_issue(args.date, segment)
+        if issue is None:
+            print(f"❌ No archived {segment} issue for {args.date}", file=sys.stderr)
+            return 1
+        _write_text(args.output, issue['html'] if args.html and issue['html'] else issue['response'])
+    else:
+        for entry in archive.entries(args.segment):
+            print(f"{entry.date}  {entry.segment}  {', '.join(entry.titles)}")
+    return 0
+
+
+def cmd_search(args) -> int:
+    """Search past concepts"""
+    import time
+    from config import config
+    from archive import IssueArchive
+    from search import ConceptIndex
+
+    index = ConceptIndex(config.search_index_file)
+    try:
+        added = index.sync(IssueArchive(config.archive_dir))
+        if added:
+            print(f"Indexed {added} new concepts", file=sys.stderr)
+        start = time.perf_counter()
+        hits = index.search(args.query, limit=args.limit, segment=args.segment)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    finally:
+        index.close()
+
+    for hit in hits:
+        print(f"{hit.score:7.3f}  {hit.date}  {hit.title}  [{hit.segment}]")
+        if hit.snippet:
+            print(f"         {hit.snippet}")
+    print(f"{len(hits)} hits in {elapsed_ms:.1f} ms", file=sys.stderr)
+    return 0 if hits else 1
+
+
+def cmd_bench(args) -> int:
+    """Run the microbenchmark suite"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from benchmarks.run import main as bench_main
+
+    bench_args = args.bench_args[1:] if args.bench_args[:1] == ['--'] else args.bench_args
+    return bench_main(bench_args)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the argument parser
+
+    Returns:
+        Parser whose subcommands set a 'handler' default
+    """
+    parser = argparse.ArgumentParser(prog="ai-insight-daily", description="AI Insight Daily")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="generate, render, send and record today's issue")
+    run.add_argument('--profile', action='store_true',
+                     help="write per-stage CPU and allocation profiles to PROFILE_DIR")
+    run.set_defaults(handler=cmd_run)
+
+    fanout = commands.add_parser('fanout', help="send today's issue to every due subscriber")
+    fanout.add_argument('--profile', action='store_true',
+                        help="write per-stage CPU and allocation profiles to PROFILE_DIR")
+    fanout.set_defaults(handler=cmd_fanout)
+
+    daemon = commands.add_parser('daemon', help="stay running and send on the configured cron schedule")
+    daemon.add_argument('--check', action='store_true',
+                        help="exit 0 if a running daemon is alive and ready (for health checks)")
+    daemon.add_argument('--max-age', type=float, default=120.0,
+                        help="seconds after which the daemon's heartbeat counts as stale")
+    daemon.set_defaults(handler=cmd_daemon)
+
+    subscribers = commands.add_parser('subscribers', help="list, add or remove subscribers")
+    subscribers.add_argument('--add', metavar='EMAIL', help="add or update a subscriber")
+    subscribers.add_argument('--remove', metavar='EMAIL', help="remove a subscriber")
+    subscribers.add_argument('--name', help="full name used in the greeting")
+    subscribers.add_argument('--interest', default='general', help="interest area segment")
+    subscribers.add_argument('--language', default='en', help="content language segment")
+    subscribers.add_argument('--timezone', default='UTC', help="IANA timezone, e.g. Africa/Algiers")
+    subscribers.add_argument('--hour', type=int, default=8, help="local send hour (0-23)")
+    subscribers.set_defaults(handler=cmd_subscribers)
+
+    backlog = commands.add_parser('backlog', help="show or top up the prefetched issue backlog")
+    backlog.add_argument('--fill', action='store_true', help="generate issues up to the target")
+    backlog.add_argument('--target', type=int, help="queue length to fill to")
+    backlog.add_argument('--interest', default='general', help="interest area segment")
+    backlog.add_argument('--language', default='en', help="content language segment")
+    backlog.set_defaults(handler=cmd_backlog)
+
+    outbox = commands.add_parser('outbox', help="show, requeue or deliver queued emails")
+    outbox.add_argument('--deliver', action='store_true', help="deliver every message that is due")
+    outbox.add_argument('--watch', action='store_true', help="keep delivering as messages become due")
+    outbox.add_argument('--retry-dead', action='store_true', help="queue dead letters again")
+    outbox.add_argument('--limit', type=int, default=20, help="dead letters to list")
+    outbox.set_defaults(handler=cmd_outbox)
+
+    generate = commands.add_parser('generate', help="generate concepts text")
+    generate.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    generate.set_defaults(handler=cmd_generate)
+
+    render = commands.add_parser('render', help="render concepts text as HTML")
+    render.add_argument('input', nargs='?', default='-', help="concepts text file (default: stdin)")
+    render.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    render.add_argument('--date', help="date shown in the header (default: today)")
+    render.add_argument('--name', help="recipient name in the greeting")
+    render.set_defaults(handler=cmd_render)
+
+    send = commands.add_parser('send', help="send a rendered HTML email")
+    send.add_argument('input', nargs='?', default='-', help="HTML file (default: stdin)")
+    send.add_argument('--to', help="recipient (default: TO_EMAIL)")
+    send.add_argument('--subject', help="subject line")
+    send.set_defaults(handler=cmd_send)
+
+    history = commands.add_parser('history', help="show sent concept titles")
+    history.add_argument('--limit', type=int, default=20, help="number of recent titles")
+    history.add_argument('--count', action='store_true', help="only print the number of titles")
+    history.set_defaults(handler=cmd_history)
+
+    archive = commands.add_parser('archive', help="list or show archived issues")
+    archive.add_argument('--date', help="print the issue of this date (YYYY-MM-DD)")
+    archive.add_argument('--concept', help="print the latest write-up of a concept")
+    archive.add_argument('--segment', help="segment slug (default: general-en)")
+    archive.add_argument('--html', action='store_true', help="print the rendered HTML of --date")
+    archive.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    archive.set_defaults(handler=cmd_archive)
+
+    search = commands.add_parser('search', help="search past concepts")
+    search.add_argument('query', help="free-text query")
+    search.add_argument('--limit', type=int, default=10, help="maximum number of hits")
+    search.add_argument('--segment', help="only this segment slug")
+    search.set_defaults(handler=cmd_search)
+
+    bench = commands.add_parser('bench', help="run the microbenchmarks")
+    bench.add_argument('bench_args', nargs=argparse.REMAINDER, help="arguments for benchmarks/run.py")
+    bench.set_defaults(handler=cmd_bench)
+
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command-line entry point"""
+    from config import ConfigError
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except ConfigError as e:
+        print(f"❌ Configuration Error: {e}", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"❌ Error occurred: {str(e)}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,28 @@ Handles environment variables and project settings.
 """
 
 import os
+from typing import Iterable, Optional
+
+try:
+    from .providers import parse_providers
+    from .ratelimit import parse_rates
+except ImportError:
+    from providers import parse_providers
+    from ratelimit import parse_rates
+
+
+class ConfigError(ValueError):
+    """Raised when a required setting is missing or a setting cannot be parsed"""
+
+
+def _read_config(cls) -> 'Config':
+    """Build a Config from the environment, reporting unparsable values as ConfigError"""
+    try:
+        return cls()
+    except ConfigError:
+        raise
+    except ValueError as e:
+        raise ConfigError(f"Invalid setting: {e}") from e
 
 
 class Config:
@@ -14,41 +36,155 @@ class Config:
         self.perplexity_api_key = os.getenv('PERPLEXITY_API_KEY')
         self.from_email = os.getenv('FROM_EMAIL')
         self.to_email = os.getenv('TO_EMAIL')
+        self.recipient_name = os.getenv('RECIPIENT_NAME', 'Moussaab Boutelis')
         self.app_password = os.getenv('APP_PASSWORD')
         
         # API Configuration
         self.api_base_url = "https://api.perplexity.ai/chat/completions"
         self.model_name = "sonar"
-        self.max_tokens = 2000
+        self.max_tokens = 3000  # Room for the over-generated candidates
         self.temperature = 0.7
+        self.api_max_concurrency = int(os.getenv('API_MAX_CONCURRENCY', '5'))  # One per concept when parallel
+        self.api_requests_per_second = float(os.getenv('API_REQUESTS_PER_SECOND', '1'))  # Shared by all workers
+        self.api_burst = float(os.getenv('API_BURST', '5'))  # Requests sent at once before the rate applies
+        self.api_max_retries = 3  # Attempts per request
+        self.api_retry_delay = 5.0  # Base of the exponential backoff between attempts
+        self.api_max_retry_delay = 60.0  # Cap on exponential backoff (Retry-After may exceed it)
+        self.api_circuit_failure_threshold = 5  # Consecutive failures before failing fast
+        self.api_circuit_reset_timeout = 60.0  # Seconds before probing a failed API again
+        self.api_max_pause = 300.0  # Longer Retry-After pauses defer fan-out segments to the next run
+        self.api_providers = parse_providers(os.getenv('API_PROVIDERS', ''))  # Backups after Perplexity, in priority order
+        self.api_routing_alpha = 0.2  # Weight of the newest request in each provider's latency/error EWMA
+        self.api_hedge_quantile = 0.95  # Send a backup request once the primary is slower than this
+        self.api_hedge_min_samples = 10  # Latencies measured before hedging starts
+        self.api_hedge_min_delay = 1.0  # Never hedge sooner than this many seconds
+        self.stream_generation = os.getenv('STREAM_GENERATION', 'false').lower() == 'true'
+        self.stream_idle_timeout = 20.0  # Seconds without data before a stream is abandoned
+        self.parallel_generation = os.getenv('PARALLEL_GENERATION', 'false').lower() == 'true'  # One request per concept
+        self.concept_max_tokens = 600  # Response limit of each per-concept request
+        self.prompt_history_window = 500  # Past concepts considered when prompting
+        self.prompt_history_token_budget = 400  # Estimated tokens spent on that history
+        
+        # Concept Selection Configuration
+        self.concepts_per_issue = 5
+        self.candidate_concepts = int(os.getenv('CANDIDATE_CONCEPTS', '8'))  # Over-generate, then pick
+        self.selection_diversity = 0.5  # MMR weight of redundancy vs. novelty
+        self.duplicate_threshold = 0.5  # Shingle Jaccard similarity counted as a repeat
+        self.duplicate_regeneration_rounds = 2
+        self.dedup_history_window = int(os.getenv('DEDUP_HISTORY_WINDOW', '5000'))  # Newest titles checked for repeats; bounds per-run cost
+        
+        # Backlog Configuration (prefetched issues, see backlog.py)
+        self.backlog_enabled = os.getenv('BACKLOG_MODE', 'false').lower() == 'true'
+        self.backlog_file = os.getenv('BACKLOG_FILE', 'data/backlog.db')
+        self.backlog_target_issues = int(os.getenv('BACKLOG_TARGET_ISSUES', '7'))  # Queue length after a refill
+        self.backlog_low_watermark = 3  # Refill in the background below this many issues
+        self.backlog_concepts_per_request = 10  # Concepts per batched API request
         
         # Email Configuration
         self.smtp_server = 'smtp.gmail.com'
         self.smtp_port = 465
+        self.smtp_use_ssl = os.getenv('SMTP_USE_SSL', 'true').lower() == 'true'  # false: STARTTLS if offered
         self.email_subject = "🤖 AI Insight Daily: 5 Concepts, 5 Minutes"
+        self.email_template_file = os.getenv('EMAIL_TEMPLATE_FILE', '')  # Replaces the built-in HTML skeleton
+        self.smtp_pool_size = int(os.getenv('SMTP_POOL_SIZE', '4'))
+        self.smtp_max_messages_per_connection = int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', '100'))
+        
+        # Outbox Configuration (durable delivery queue, see outbox.py)
+        self.outbox_enabled = os.getenv('OUTBOX_MODE', 'false').lower() == 'true'
+        self.outbox_file = os.getenv('OUTBOX_FILE', 'data/outbox.db')
+        self.outbox_deliver_inline = os.getenv('OUTBOX_DELIVER_INLINE', 'true').lower() == 'true'  # false: leave it to `cli.py outbox --deliver --watch`
+        self.outbox_max_attempts = 8  # Temporary failures before a message is dead-lettered
+        self.outbox_retry_delay = 60.0  # Deferral after the first SMTP 4xx or network error
+        self.outbox_max_retry_delay = 3600.0  # Cap on the exponential deferral
+        self.outbox_batch_size = 50  # Messages a worker leases at once
+        self.outbox_lease_seconds = 300.0  # Unsettled leases expire and are delivered again
+        
+        # Subscriber Fan-Out Configuration
+        self.subscribers_file = os.getenv('SUBSCRIBERS_FILE', 'data/subscribers.json')
+        self.segment_storage_dir = 'data/segments'  # History of non-default segments
+        self.send_rate_per_second = float(os.getenv('SEND_RATE_PER_SECOND', '5'))  # All providers
+        self.provider_rate_limits = parse_rates(os.getenv('PROVIDER_RATE_LIMITS', 'gmail=2,microsoft=1,yahoo=1'))
+        self.default_provider_rate = 1.0  # Messages per second to any other domain
         
         # Storage Configuration
         self.storage_file = 'data/sent_concepts.json'
-        self.max_stored_concepts = 100  # Keep last 100 concepts
+        self.storage_backend = os.getenv('STORAGE_BACKEND', 'json')  # 'json' or 'sqlite'
+        # History kept: JSON rewrites the whole file per run, SQLite appends and reads an indexed tail
+        self.max_stored_concepts = int(os.getenv('MAX_STORED_CONCEPTS',
+                                                 '100000' if self.storage_backend == 'sqlite' else '1000'))
+        self.checkpoint_dir = os.getenv('CHECKPOINT_DIR', 'data/checkpoints')
+        self.checkpoint_retention_days = 7  # Resumable stage outputs and send markers
+        self.archive_dir = os.getenv('ARCHIVE_DIR', 'data/archive')  # Full issues, compressed
+        self.archive_segment_bytes = 1024 * 1024  # Start a new archive segment file after 1 MB
+        self.search_index_file = os.getenv('SEARCH_INDEX_FILE', 'data/search.db')  # Rebuilt from the archive
+        
+        # Daemon Configuration (long-running mode, see daemon.py)
+        self.daemon_schedule = os.getenv('DAEMON_SCHEDULE', '0 8 * * *')  # Cron expression
+        self.daemon_timezone = os.getenv('DAEMON_TIMEZONE', 'UTC')
+        self.daemon_pipeline = os.getenv('DAEMON_PIPELINE', 'main')  # 'main' or 'fanout'
+        self.daemon_jitter_seconds = float(os.getenv('DAEMON_JITTER_SECONDS', '0'))
+        self.daemon_catchup_hours = 12.0  # Runs missed while down are made up within this window
+        self.daemon_warmup_seconds = 30.0  # Connections are opened this long before a run
+        self.daemon_env_file = os.getenv('DAEMON_ENV_FILE', '.env')  # Re-read on change or SIGHUP
+        self.daemon_health_file = os.getenv('DAEMON_HEALTH_FILE', 'data/daemon-health.json')
+        
+        # Metrics Configuration
+        self.metrics_jsonl_file = os.getenv('METRICS_JSONL_FILE', 'data/metrics.jsonl')
+        self.metrics_prometheus_file = os.getenv('METRICS_PROMETHEUS_FILE', 'data/metrics.prom')
+        self.profile_dir = os.getenv('PROFILE_DIR', 'data/profiles')  # --profile output, one directory per run
+        self.profile_interval = 0.005  # Seconds between CPU stack samples
+        self.profile_top_allocations = 10  # Allocation sites reported per stage
+    
+    def reload(self, validate: bool = True) -> 'Config':
+        """
+        Re-read settings from the environment in place
+        
+        Modules hold on to this instance, so it is updated rather than replaced.
+        
+        Args:
+            validate: Keep the current settings if the new ones fail validate()
+            
+        Returns:
+            This instance
+        """
+        fresh = _read_config(type(self))
+        if validate:
+            fresh.validate()
+        self.__dict__.update(fresh.__dict__)
+        return self
     
-    def validate(self):
-        """Validate that all required environment variables are set"""
+    def validate(self, required: Optional[Iterable[str]] = None):
+        """
+        Validate that all required environment variables are set
+        
+        Args:
+            required: Names of the variables to check (defaults to all of them),
+                so subcommands that only generate or only send check what they use
+        
+        Raises:
+            ConfigError: If a required variable is not set
+        """
         required_vars = {
             'PERPLEXITY_API_KEY': self.perplexity_api_key,
             'FROM_EMAIL': self.from_email,
             'TO_EMAIL': self.to_email,
             'APP_PASSWORD': self.app_password
         }
+        names = list(required) if required is not None else list(required_vars)
         
-        missing_vars = [var for var, value in required_vars.items() if not value]
+        missing_vars = [var for var in names if not required_vars[var]]
         
         if missing_vars:
-            raise ValueError(
+            raise ConfigError(
                 f"Missing required environment variables: {', '.join(missing_vars)}"
             )
         
         return True
 
 
-# Create a global config instance
-config = Config()
+def __getattr__(name):
+    # The global config instance is created on first use rather than at import
+    if name == 'config':
+        instance = globals()['config'] = _read_config(Config)
+        return instance
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,566 @@
+"""
+Daemon module for running the pipeline as a long-lived process.
+Fires jobs on a cron schedule with jitter and catch-up after downtime, keeps
+HTTP and SMTP connections warm between runs, reloads settings without a
+restart and reports liveness and readiness through a health file.
+"""
+
+import json
+import os
+import random
+import signal
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+_ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+_MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+_WEEKDAY_NAMES = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+
+# A matching day always comes up within this many days (Feb 29 on a Monday, say)
+_SCAN_DAYS = 366 * 28
+
+
+def _parse_field(text: str, low: int, high: int, names: Optional[List[str]] = None) -> Tuple[int, ...]:
+    """Values matched by one cron field, e.g. '*/15', '1-5', 'mon,wed' or '9-17/2'"""
+    def number(token: str) -> int:
+        token = token.lower()
+        if names and token in names:
+            return names.index(token) + (1 if low == 1 else 0)
+        value = int(token)
+        if not low <= value <= high:
+            raise ValueError(f"{value} is outside {low}-{high}")
+        return value
+
+    values = set()
+    for part in text.split(','):
+        span, _, step = part.partition('/')
+        if span == '*':
+            start, end = low, high
+        elif '-' in span:
+            start, end = (number(token) for token in span.split('-', 1))
+        else:
+            start = number(span)
+            end = high if step else start
+        step_size = int(step) if step else 1
+        if step_size < 1 or start > end:
+            raise ValueError(f"Invalid cron field {text!r}")
+        values.update(range(start, end + 1, step_size))
+    return tuple(sorted(values))
+
+
+class CronSchedule:
+    """Five-field cron expression (minute hour day month weekday) in a timezone"""
+
+    def __init__(self, expression: str, timezone_name: str = 'UTC'):
+        """
+        Parse a schedule
+
+        Args:
+            expression: Cron expression such as '0 8 * * *' or '*/30 9-17 * * mon-fri',
+                or one of @hourly, @daily, @weekly, @monthly, @yearly
+            timezone_name: IANA timezone the expression is read in
+
+        Raises:
+            ValueError: If the expression or timezone is invalid
+        """
+        self.expression = expression
+        fields = _ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        try:
+            self.tz = ZoneInfo(timezone_name)
+            self.minutes = _parse_field(fields[0], 0, 59)
+            self.hours = _parse_field(fields[1], 0, 23)
+            self.days = _parse_field(fields[2], 1, 31)
+            self.months = _parse_field(fields[3], 1, 12, _MONTH_NAMES)
+            # 7 is Sunday as well as 0
+            self.weekdays = tuple(sorted({d % 7 for d in _parse_field(fields[4], 0, 7, _WEEKDAY_NAMES)}))
+        except (ValueError, KeyError) as e:
+            raise ValueError(f"Invalid cron expression {expression!r}: {e}") from None
+        # As in cron, a restricted day and weekday match when either does
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, day: date) -> bool:
+        if day.month not in self.months:
+            return False
+        by_day = day.day in self.days
+        by_weekday = day.isoweekday() % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return (self._any_day or by_day) and (self._any_weekday or by_weekday)
+        return by_day or by_weekday
+
+    def _times_on(self, day: date) -> List[datetime]:
+        return [datetime(day.year, day.month, day.day, hour, minute, tzinfo=self.tz)
+                for hour in self.hours for minute in self.minutes]
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        First fire time strictly after a moment
+
+        Args:
+            moment: Timezone-aware time
+
+        Returns:
+            Fire time in the schedule's timezone
+        """
+        day = moment.astimezone(self.tz).date()
+        for _ in range(_SCAN_DAYS):
+            if self._day_matches(day):
+                for candidate in self._times_on(day):
+                    if candidate > moment:
+                        return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression {self.expression!r} never fires")
+
+    def previous(self, moment: datetime) -> Optional[datetime]:
+        """
+        Latest fire time at or before a moment
+
+        Args:
+            moment: Timezone-aware time
+
+        Returns:
+            Fire time in the schedule's timezone, or None if there is none
+        """
+        day = moment.astimezone(self.tz).date()
+        for _ in range(_SCAN_DAYS):
+            if self._day_matches(day):
+                for candidate in reversed(self._times_on(day)):
+                    if candidate <= moment:
+                        return candidate
+            day -= timedelta(days=1)
+        return None
+
+
+class EnvFile:
+    """KEY=VALUE file applied on top of the process environment"""
+
+    def __init__(self, path: str):
+        """
+        Initialize env file
+
+        Args:
+            path: File with one KEY=VALUE per line ('#' comments and 'export ' allowed)
+        """
+        self.path = path
+        self._original: Dict[str, Optional[str]] = {}
+
+    def read(self) -> Dict[str, str]:
+        """Parse the file (empty if it does not exist)"""
+        values = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return values
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            key = key.strip()
+            if key.startswith('export '):
+                key = key[len('export '):].strip()
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            values[key] = value
+        return values
+
+    def apply(self) -> Dict[str, str]:
+        """
+        Set the file's variables, restoring ones that were removed from it
+
+        Returns:
+            The variables now applied
+        """
+        values = self.read()
+        for key in list(self._original):
+            if key not in values:
+                original = self._original.pop(key)
+                if original is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = original
+        for key, value in values.items():
+            self._original.setdefault(key, os.environ.get(key))
+            os.environ[key] = value
+        return values
+
+
+class WarmConnections:
+    """HTTP session and SMTP connections kept open across daemon runs"""
+
+    def __init__(self, session_factory: Callable, sender_factory: Callable):
+        """
+        Initialize connections (nothing is opened until first use)
+
+        Args:
+            session_factory: Returns a new requests.Session for the completion API
+            sender_factory: Returns a new email_sender.EmailSender
+        """
+        self.session_factory = session_factory
+        self.sender_factory = sender_factory
+        self._session = None
+        self._sender = None
+        self._lock = threading.Lock()
+
+    @property
+    def http_session(self):
+        """Keep-alive session shared by every generator of every run"""
+        with self._lock:
+            if self._session is None:
+                self._session = self.session_factory()
+            return self._session
+
+    @property
+    def email_sender(self):
+        """Sender whose SMTP pool stays open between runs"""
+        with self._lock:
+            if self._sender is None:
+                self._sender = self.sender_factory()
+            return self._sender
+
+    def warm(self, api_url: Optional[str] = None) -> Dict[str, str]:
+        """
+        Open (or check) connections ahead of a run; failures are reported, not raised
+
+        Args:
+            api_url: Completion endpoint to open a keep-alive connection to
+
+        Returns:
+            Outcome per connection kind, e.g. {'smtp': '4 connections', 'http': 'ok'}
+        """
+        outcome = {}
+        with metrics.span('daemon.warm'):
+            try:
+                outcome['smtp'] = f"{self.email_sender.warm()} connections"
+            except Exception as e:
+                outcome['smtp'] = f"failed: {e}"
+            if api_url:
+                try:
+                    # Any response leaves a pooled TLS connection behind
+                    self.http_session.head(api_url, timeout=10).close()
+                    outcome['http'] = 'ok'
+                except Exception as e:
+                    outcome['http'] = f"failed: {e}"
+        return outcome
+
+    def reset(self):
+        """Close everything, e.g. after credentials changed; reopened on next use"""
+        with self._lock:
+            session, self._session = self._session, None
+            sender, self._sender = self._sender, None
+        if session is not None:
+            session.close()
+        if sender is not None:
+            sender.close()
+
+    def close(self):
+        """Close all connections"""
+        self.reset()
+
+
+def _iso(moment: Optional[datetime]) -> Optional[str]:
+    return moment.isoformat() if moment else None
+
+
+def read_health(path: str) -> dict:
+    """
+    Load a daemon health file
+
+    Args:
+        path: Health file written by Daemon
+
+    Returns:
+        Health record (empty if missing or unreadable)
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def check_health(path: str, max_age: float = 120.0, now: Optional[float] = None) -> Tuple[bool, str]:
+    """
+    Decide whether a daemon is alive and ready, e.g. for a container health check
+
+    Args:
+        path: Health file written by Daemon
+        max_age: Seconds after which a heartbeat counts as stale
+        now: Current Unix time (defaults to now)
+
+    Returns:
+        (healthy, one-line description)
+    """
+    health = read_health(path)
+    if not health:
+        return False, f"no health file at {path}"
+    age = (now or time.time()) - health.get('heartbeat', 0)
+    if health.get('status') == 'stopped':
+        return False, "daemon stopped"
+    if age > max_age:
+        return False, f"heartbeat {age:.0f}s old (pid {health.get('pid')})"
+    if not health.get('ready'):
+        return False, f"not ready: {health.get('error') or health.get('status')}"
+    return True, f"{health.get('status')}, next run {health.get('next_run')}"
+
+
+class Daemon:
+    """Runs a job on a cron schedule until stopped"""
+
+    def __init__(self, job: Callable[[], int], schedule: CronSchedule, health_file: str,
+                 jitter: float = 0.0, catchup: timedelta = timedelta(hours=12),
+                 warmup: float = 60.0, warm: Optional[Callable[[], dict]] = None,
+                 reload: Optional[Callable[[], Optional[CronSchedule]]] = None,
+                 watched_files: Callable[[], Iterable[str]] = tuple,
+                 poll_interval: float = 30.0,
+                 clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+                 sleep: Optional[Callable[[float], None]] = None,
+                 rng: Optional[random.Random] = None):
+        """
+        Initialize daemon
+
+        Args:
+            job: Runs the pipeline once and returns its exit code
+            schedule: When to run
+            health_file: JSON file rewritten at least every poll_interval with the
+                status, readiness, heartbeat, next run and last run; its last run
+                is also where catch-up starts from after a restart
+            jitter: Up to this many seconds of random delay added to each run
+            catchup: A run missed within this long before startup is made up at once
+            warmup: Seconds before a run at which warm() is called
+            warm: Opens connections; returns a description of each
+            reload: Re-reads settings; may return a new schedule. Called on SIGHUP and
+                when a watched file changes. Raising keeps the current settings
+            watched_files: Returns the paths whose modification reloads settings
+            poll_interval: Longest sleep between checks (heartbeat period)
+            clock: Returns the current timezone-aware time
+            sleep: Sleeps for the given seconds (defaults to an interruptible wait)
+            rng: Random generator for the jitter
+        """
+        self.job = job
+        self.schedule = schedule
+        self.health_file = health_file
+        self.jitter = max(0.0, jitter)
+        self.catchup = catchup
+        self.warmup = max(0.0, warmup)
+        self.warm = warm
+        self.reload = reload
+        self.watched_files = watched_files
+        self.poll_interval = max(0.01, poll_interval)
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._wake = threading.Event()
+        self._health_lock = threading.Lock()
+        self._sleep = sleep or self._wait
+        self._stopping = False
+        self._reload_requested = False
+        self._mtimes = self._snapshot()
+
+        previous = read_health(health_file)
+        self.health = {
+            'pid': os.getpid(),
+            'status': 'starting',
+            'ready': False,
+            'started_at': _iso(clock()),
+            'heartbeat': time.time(),
+            'schedule': schedule.expression,
+            'timezone': str(schedule.tz),
+            'next_run': None,
+            'last_run': previous.get('last_run'),
+            'consecutive_failures': previous.get('consecutive_failures', 0),
+            'warm': {},
+            'error': None,
+        }
+
+    def _wait(self, seconds: float):
+        self._wake.wait(seconds)
+        self._wake.clear()
+
+    def stop(self, *_):
+        """Finish the current run, then exit run_forever() (also the SIGTERM/SIGINT handler)"""
+        self._stopping = True
+        self._wake.set()
+
+    def request_reload(self, *_):
+        """Reload settings at the next check (also the SIGHUP handler)"""
+        self._reload_requested = True
+        self._wake.set()
+
+    def install_signal_handlers(self):
+        """Stop on SIGTERM/SIGINT and reload on SIGHUP (main thread only)"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.request_reload)
+
+    def _snapshot(self) -> Dict[str, Optional[float]]:
+        mtimes = {}
+        for path in self.watched_files():
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def write_health(self, **changes):
+        """Update and atomically rewrite the health file"""
+        with self._health_lock:
+            self.health.update(changes, heartbeat=time.time())
+            directory = os.path.dirname(self.health_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_file = f"{self.health_file}.{os.getpid()}.tmp"
+            try:
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.health, f, indent=2)
+                os.replace(temp_file, self.health_file)
+            except OSError as e:
+                print(f"⚠️ Could not write the health file: {e}")
+
+    def _heartbeat(self, done: threading.Event):
+        """Refresh the health file every poll_interval until done is set"""
+        while not done.wait(self.poll_interval):
+            self.write_health()
+
+    def _check_reload(self) -> bool:
+        """Reload if requested or a watched file changed; True if the schedule changed"""
+        mtimes = self._snapshot()
+        if not self._reload_requested and mtimes == self._mtimes:
+            return False
+        self._reload_requested = False
+        self._mtimes = mtimes
+        if self.reload is None:
+            return False
+        try:
+            schedule = self.reload()
+        except Exception as e:
+            print(f"⚠️ Reload failed, keeping the current settings: {e}")
+            self.write_health(error=f"reload failed: {e}")
+            return False
+        print("↻ Settings reloaded")
+        self.write_health(error=None, reloaded_at=_iso(self.clock()))
+        if schedule is not None and (schedule.expression, str(schedule.tz)) != \
+                (self.schedule.expression, str(self.schedule.tz)):
+            self.schedule = schedule
+            self.write_health(schedule=schedule.expression, timezone=str(schedule.tz))
+            return True
+        return False
+
+    def missed_run(self, now: datetime) -> Optional[datetime]:
+        """
+        Scheduled time that passed while the daemon was down and should still run
+
+        Args:
+            now: Current time
+
+        Returns:
+            The latest missed fire time within the catch-up window, or None
+        """
+        scheduled = self.schedule.previous(now)
+        if scheduled is None or now - scheduled > self.catchup:
+            return None
+        last = (self.health.get('last_run') or {}).get('scheduled')
+        if last and datetime.fromisoformat(last) >= scheduled:
+            return None
+        return scheduled
+
+    def _wait_until(self, fire: datetime) -> bool:
+        """Sleep until fire, warming up and reloading on the way; False if stopped or rescheduled"""
+        warmed = self.warm is None
+        while not self._stopping:
+            if self._check_reload():
+                return False
+            now = self.clock()
+            if now >= fire:
+                return True
+            if not warmed and (fire - now).total_seconds() <= self.warmup:
+                self.write_health(status='warming')
+                self.write_health(status='idle', warm=self.warm())
+                warmed = True
+                continue
+            until = (fire - now).total_seconds()
+            if not warmed:
+                until -= self.warmup
+            self.write_health(status='idle')
+            self._sleep(min(self.poll_interval, max(until, 0.0)))
+        return False
+
+    def run_once(self, scheduled: datetime) -> int:
+        """
+        Run the job now and record the outcome
+
+        A heartbeat thread keeps the health file fresh while the job runs, so
+        a run slowed by retries or Retry-After pauses does not look dead.
+
+        Args:
+            scheduled: Fire time the run belongs to
+
+        Returns:
+            The job's exit code (1 if it raised)
+        """
+        started = self.clock()
+        self.write_health(status='running', current_run={'scheduled': _iso(scheduled),
+                                                         'started': _iso(started)})
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(done,),
+                                     name='daemon-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            exit_code = self.job()
+        except Exception as e:
+            print(f"❌ Scheduled run failed: {e}")
+            exit_code = 1
+        finally:
+            done.set()
+            heartbeat.join()
+        finished = self.clock()
+        failures = 0 if exit_code == 0 else self.health.get('consecutive_failures', 0) + 1
+        self.write_health(
+            status='idle',
+            current_run=None,
+            last_run={'scheduled': _iso(scheduled), 'started': _iso(started),
+                      'finished': _iso(finished), 'exit_code': exit_code,
+                      'seconds': round((finished - started).total_seconds(), 3)},
+            consecutive_failures=failures
+        )
+        return exit_code
+
+    def run_forever(self):
+        """Run the job at every fire time until stop() is called"""
+        self.write_health(status='idle', ready=True)
+        due = self.missed_run(self.clock())
+        if due is not None:
+            print(f"⏩ Catching up on the run scheduled for {due.isoformat()}")
+            self.write_health(next_run=_iso(due))
+            self.run_once(due)
+
+        while not self._stopping:
+            scheduled = self.schedule.next_after(self.clock())
+            fire = scheduled + timedelta(seconds=self.rng.uniform(0, self.jitter))
+            self.write_health(next_run=_iso(fire))
+            print(f"🕗 Next run at {fire.isoformat()}")
+            if self._wait_until(fire):
+                self.run_once(scheduled)
+
+        self.write_health(status='stopped', ready=False, next_run=None)
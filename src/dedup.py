@@ -0,0 +1,272 @@
+"""
+Dedup module for catching near-duplicate concepts before they are sent.
+Keeps a MinHash/LSH index over normalized title shingles.
+"""
+
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    from .ai_generator import AIConceptGenerator
+    from .history import strip_title_boilerplate
+except ImportError:
+    from ai_generator import AIConceptGenerator
+    from history import strip_title_boilerplate
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalize a concept title for duplicate detection
+
+    Lowercases, drops prompt boilerplate prefixes such as "Concept Name",
+    removes parenthesized acronyms and punctuation, and collapses spaces.
+
+    Args:
+        title: Raw concept title
+
+    Returns:
+        Normalized title
+    """
+    text = strip_title_boilerplate(title).lower()
+    text = re.sub(r"\([^)]*\)", " ", text)
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+def shingles(title: str, size: int = 4) -> Set[str]:
+    """
+    Character shingles of the normalized title
+
+    Args:
+        title: Raw concept title
+        size: Shingle length
+
+    Returns:
+        Set of shingles (the whole normalized title if shorter than size)
+    """
+    text = normalize_title(title)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """MinHash signatures bucketed by LSH bands for sublinear near-duplicate lookup"""
+
+    def __init__(self, threshold: float = 0.5, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 4, seed: int = 1):
+        """
+        Initialize index
+
+        Args:
+            threshold: Minimum shingle Jaccard similarity counted as a duplicate
+            num_perm: Number of MinHash permutations
+            bands: Number of LSH bands (must divide num_perm)
+            shingle_size: Character shingle length
+            seed: Seed for the permutation coefficients
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 61, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 61, size=num_perm, dtype=np.uint64)
+
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._titles: List[str] = []
+        self._shingles: List[Set[str]] = []
+        self._normalized: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    @classmethod
+    def from_titles(cls, titles: Iterable[str], **kwargs) -> 'NearDuplicateIndex':
+        """
+        Build an index over existing titles
+
+        Args:
+            titles: Titles to index
+            **kwargs: Passed to the constructor
+
+        Returns:
+            Populated index
+        """
+        index = cls(**kwargs)
+        for title in titles:
+            index.add(title)
+        return index
+
+    def _signature(self, title_shingles: Set[str]) -> np.ndarray:
+        """MinHash signature of a shingle set"""
+        if not title_shingles:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in title_shingles),
+            dtype=np.uint64,
+            count=len(title_shingles)
+        )
+        # Multiplication wraps modulo 2**64, which is fine for hashing
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, title: str) -> int:
+        """
+        Add a title to the index
+
+        Args:
+            title: Concept title
+
+        Returns:
+            Internal id of the title
+        """
+        title_shingles = shingles(title, self.shingle_size)
+        doc_id = len(self._titles)
+        self._titles.append(title)
+        self._shingles.append(title_shingles)
+        self._normalized.setdefault(normalize_title(title), doc_id)
+
+        for band, key in enumerate(self._band_keys(self._signature(title_shingles))):
+            self._buckets[band].setdefault(key, []).append(doc_id)
+        return doc_id
+
+    def query(self, title: str) -> List[Tuple[str, float]]:
+        """
+        Find indexed titles similar to title
+
+        Args:
+            title: Concept title to look up
+
+        Returns:
+            (indexed title, Jaccard similarity) pairs above the threshold, best first
+        """
+        normalized = normalize_title(title)
+        title_shingles = shingles(title, self.shingle_size)
+
+        candidates: Set[int] = set()
+        exact = self._normalized.get(normalized)
+        if exact is not None:
+            candidates.add(exact)
+        for band, key in enumerate(self._band_keys(self._signature(title_shingles))):
+            candidates.update(self._buckets[band].get(key, ()))
+
+        matches = []
+        for doc_id in candidates:
+            other = self._shingles[doc_id]
+            union = len(title_shingles | other)
+            similarity = len(title_shingles & other) / union if union else 1.0
+            if similarity >= self.threshold:
+                matches.append((self._titles[doc_id], similarity))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
+
+    def is_duplicate(self, title: str) -> bool:
+        """
+        Check whether title is a near-duplicate of anything indexed
+
+        Args:
+            title: Concept title
+
+        Returns:
+            True if a similar title has been indexed
+        """
+        return bool(self.query(title))
+
+
+class DuplicateGate:
+    """Reject near-duplicate concepts and regenerate only the rejected slots"""
+
+    def __init__(self, index: NearDuplicateIndex, max_rounds: int = 2):
+        """
+        Initialize gate
+
+        Args:
+            index: Index over previously sent concepts
+            max_rounds: Maximum number of targeted regeneration rounds
+        """
+        self.index = index
+        self.max_rounds = max_rounds
+
+    def find_duplicates(self, titles: List[str]) -> List[int]:
+        """
+        Positions of titles that repeat history or an earlier title of the same issue
+
+        Args:
+            titles: Concept titles of one issue
+
+        Returns:
+            Indices of rejected titles
+        """
+        rejected = []
+        issue_index = NearDuplicateIndex(
+            threshold=self.index.threshold,
+            num_perm=self.index.num_perm,
+            bands=self.index.bands,
+            shingle_size=self.index.shingle_size
+        )
+        for position, title in enumerate(titles):
+            if self.index.is_duplicate(title) or issue_index.is_duplicate(title):
+                rejected.append(position)
+            else:
+                issue_index.add(title)
+        return rejected
+
+    def enforce(self, concepts_text: str, generator: AIConceptGenerator,
+                avoid: Optional[List[str]] = None) -> str:
+        """
+        Replace near-duplicate concept sections with freshly generated ones
+
+        Args:
+            concepts_text: Generated content with one section per concept
+            generator: Generator used for targeted regeneration
+            avoid: Extra topics the replacements must avoid
+
+        Returns:
+            Content in which no concept duplicates history, when achievable
+            within max_rounds (remaining duplicates are kept rather than dropped)
+        """
+        preamble, sections = AIConceptGenerator.split_concept_sections(concepts_text)
+        if not sections:
+            return concepts_text
+
+        titles = [title for title, _ in sections]
+        texts = [text for _, text in sections]
+        changed = False
+
+        for _ in range(self.max_rounds):
+            rejected = self.find_duplicates(titles)
+            if not rejected:
+                break
+
+            print(f"⚠️ Regenerating {len(rejected)} near-duplicate concept(s): {[titles[i] for i in rejected]}")
+            kept = [title for i, title in enumerate(titles) if i not in rejected]
+            replacement_text = generator.regenerate_concepts(
+                [titles[i] for i in rejected],
+                list(avoid or []) + kept
+            )
+            _, replacements = AIConceptGenerator.split_concept_sections(replacement_text)
+            for position, (title, text) in zip(rejected, replacements):
+                titles[position] = title
+                texts[position] = text
+                changed = True
+
+        if not changed:
+            return concepts_text
+        return AIConceptGenerator.join_concept_sections(texts, preamble)
@@ -0,0 +1,216 @@
+"""
+Diversity module for choosing the concepts that go into an issue.
+Embeds concept titles locally and selects a diverse subset with MMR.
+"""
+
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from .ai_generator import AIConceptGenerator
+except ImportError:
+    from ai_generator import AIConceptGenerator
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """Stateless hashing vectorizer producing L2-normalized float32 rows"""
+
+    def __init__(self, n_features: int = 1024, char_ngram: int = 3):
+        """
+        Initialize embedder
+
+        Args:
+            n_features: Width of the hashed feature space
+            char_ngram: Character n-gram size used inside each word
+        """
+        self.n_features = n_features
+        self.char_ngram = char_ngram
+
+    def _features(self, text: str) -> List[str]:
+        """Word unigrams, word bigrams and in-word character n-grams"""
+        words = _TOKEN_RE.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        n = self.char_ngram
+        for word in words:
+            padded = f"<{word}>"
+            features.extend("#" + padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed texts into a (len(texts), n_features) matrix
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Matrix whose non-empty rows have unit L2 norm
+        """
+        rows: List[int] = []
+        cols: List[int] = []
+        signs: List[float] = []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode('utf-8'))
+                rows.append(row)
+                cols.append(digest % self.n_features)
+                signs.append(1.0 if digest & 0x80000000 else -1.0)
+
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        if rows:
+            np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(signs, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+def mmr_select(candidates: np.ndarray, history: Optional[np.ndarray], k: int,
+               diversity: float = 0.5) -> List[int]:
+    """
+    Pick k candidate rows by maximal marginal relevance
+
+    Relevance is novelty against history (1 - max cosine similarity to any
+    past concept); redundancy is the max similarity to already picked rows.
+
+    Args:
+        candidates: (n, d) normalized candidate embeddings
+        history: (m, d) normalized history embeddings, or None
+        k: Number of rows to pick
+        diversity: Weight of redundancy versus novelty, in [0, 1]
+
+    Returns:
+        Indices of picked candidates, in pick order
+    """
+    n = candidates.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    if history is not None and history.shape[0]:
+        novelty = 1.0 - (candidates @ history.T).max(axis=1)
+    else:
+        novelty = np.ones(n, dtype=np.float32)
+
+    pairwise = candidates @ candidates.T
+    redundancy = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked: List[int] = []
+
+    for _ in range(k):
+        scores = (1.0 - diversity) * novelty - diversity * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+
+    return picked
+
+
+class ConceptSelector:
+    """Select a diverse subset of generated concepts"""
+
+    def __init__(self, embedder: Optional[HashingEmbedder] = None, diversity: float = 0.5):
+        """
+        Initialize selector
+
+        Args:
+            embedder: Embedder used for titles (defaults to HashingEmbedder())
+            diversity: Weight of redundancy versus novelty, in [0, 1]
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.diversity = diversity
+        self._history_titles: List[str] = []
+        self._history_matrix: Optional[np.ndarray] = None
+        self._history_rows: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _embed_history(self, history: Sequence[str]) -> np.ndarray:
+        """
+        Embed history, embedding only titles the previous call did not see
+
+        A sliding window of recent titles mostly overlaps the previous one,
+        so each run embeds just the titles sent since. Rows are kept only for
+        the current history, which bounds the cache by the history window.
+        """
+        with self._lock:
+            if self._history_matrix is None or list(history) != self._history_titles:
+                rows = self._history_rows
+                missing = [title for title in dict.fromkeys(history) if title not in rows]
+                if missing:
+                    rows.update(zip(missing, self.embedder.embed(missing)))
+                self._history_rows = {title: rows[title] for title in history}
+                self._history_titles = list(history)
+                self._history_matrix = np.stack([rows[title] for title in history])
+            return self._history_matrix
+
+    def select(self, titles: Sequence[str], history: Sequence[str], k: int = 5) -> List[int]:
+        """
+        Choose k titles that are novel and distinct from each other
+
+        Args:
+            titles: Candidate concept titles
+            history: Previously sent concept titles
+            k: Number of titles to keep
+
+        Returns:
+            Indices into titles, in original order
+        """
+        if len(titles) <= k:
+            return list(range(len(titles)))
+        candidates = self.embedder.embed(titles)
+        past = self._embed_history(history) if history else None
+        return sorted(mmr_select(candidates, past, k, self.diversity))
+
+    def select_concepts(self, concepts_text: str, history: Sequence[str], k: int = 5) -> str:
+        """
+        Reduce generated content to its k most diverse concepts
+
+        Args:
+            concepts_text: Generated content with one section per concept
+            history: Previously sent concept titles
+            k: Number of concepts to keep
+
+        Returns:
+            Content containing only the selected concept sections, renumbered
+        """
+        _, sections = AIConceptGenerator.split_concept_sections(concepts_text)
+        if len(sections) <= k:
+            return concepts_text
+
+        keep = self.select([title for title, _ in sections], history, k)
+        # The preamble is dropped: it usually announces the candidate count
+        return AIConceptGenerator.join_concept_sections([sections[i][1] for i in keep])
+
+
+_shared_selectors: Dict[tuple, ConceptSelector] = {}
+_shared_selectors_lock = threading.Lock()
+
+
+def shared_concept_selector(key: str = '', diversity: float = 0.5) -> ConceptSelector:
+    """
+    Get the process-wide selector for a concept history, creating it on first use
+
+    Runs in one process (e.g. the daemon) reuse the history embeddings of
+    earlier runs. Use one key per history so segments do not evict each other.
+
+    Args:
+        key: History identity, e.g. a segment slug
+        diversity: Weight of redundancy versus novelty, in [0, 1]
+
+    Returns:
+        The shared ConceptSelector
+    """
+    with _shared_selectors_lock:
+        selector = _shared_selectors.get((key, diversity))
+        if selector is None:
+            selector = _shared_selectors[(key, diversity)] = ConceptSelector(diversity=diversity)
+        return selector
@@ -0,0 +1,436 @@
+"""
+Document module for parsing generated Markdown-like content.
+Parses a response once into a light tree shared by title extraction and rendering.
+"""
+
+import html
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+
+# Section labels that are never concept titles
+SECTION_LABELS = frozenset({
+    "definition",
+    "definitions",
+    "clear definition",
+    "key points",
+    "key point",
+    "key takeaways",
+    "practical applications",
+    "practical application",
+    "applications",
+    "example",
+    "examples",
+    "relevant example",
+    "a relevant example",
+    "use cases",
+    "overview",
+    "summary",
+    "conclusion",
+    "insights",
+    "concept name",
+})
+
+_NUMBER_PREFIX_RE = re.compile(r'^\d+[\).\s-]*')
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+_LIST_MARKER_RE = re.compile(r'^(?:[-•]\s*|\*\s+)')
+_ORDERED_MARKER_RE = re.compile(r'^(\d+)[.)]\s+')
+
+
+def clean_heading_text(text: str) -> str:
+    """
+    Strip Markdown markers, colons and leading numbering from heading text
+
+    Args:
+        text: Raw heading line
+
+    Returns:
+        Cleaned title text
+    """
+    clean = text.replace('#', '').replace('*', '').replace(':', '').strip()
+    return _NUMBER_PREFIX_RE.sub('', clean).strip()
+
+
+def is_concept_title(title: str) -> bool:
+    """
+    Check whether cleaned heading text is a plausible concept title
+
+    Args:
+        title: Cleaned heading text
+
+    Returns:
+        True unless it is too short/long, a list remnant or a section label
+    """
+    return (5 < len(title) < 100 and not title.startswith('-')
+            and title.lower() not in SECTION_LABELS)
+
+
+def render_inline(text: str) -> str:
+    """
+    Escape text for HTML and render **bold** spans in a single regex pass
+
+    Args:
+        text: Inline Markdown text
+
+    Returns:
+        HTML fragment
+    """
+    return _BOLD_RE.sub(r'<strong>\1</strong>', html.escape(text, quote=False))
+
+
+def strip_inline(text: str) -> str:
+    """Remove inline Markdown markers for plain-text output"""
+    return _BOLD_RE.sub(r'\1', text)
+
+
+@dataclass
+class Paragraph:
+    """A paragraph of inline text"""
+
+    text: str
+
+
+@dataclass
+class SubHeading:
+    """A section label inside a concept, such as "Key Points" """
+
+    text: str
+
+
+@dataclass
+class BulletList:
+    """A run of consecutive list items, numbered when ordered"""
+
+    items: List[str] = field(default_factory=list)
+    ordered: bool = False
+
+
+Block = Union[Paragraph, SubHeading, BulletList]
+
+
+@dataclass
+class Concept:
+    """One concept card: its heading, cleaned title, body blocks and source text"""
+
+    heading: str
+    title: str
+    blocks: List[Block] = field(default_factory=list)
+    source_lines: List[str] = field(default_factory=list)
+
+    @property
+    def source(self) -> str:
+        """Original text of the concept section"""
+        return '\n'.join(self.source_lines).strip()
+
+
+@dataclass
+class Document:
+    """Parsed response: loose blocks before the first concept, then concepts"""
+
+    preamble: List[Block] = field(default_factory=list)
+    preamble_lines: List[str] = field(default_factory=list)
+    concepts: List[Concept] = field(default_factory=list)
+
+    def titles(self, limit: Optional[int] = None) -> List[str]:
+        """
+        Unique concept titles in order
+
+        Args:
+            limit: Maximum number of titles to return
+
+        Returns:
+            List of concept titles
+        """
+        unique = []
+        seen = set()
+        for concept in self.concepts:
+            if concept.title not in seen:
+                seen.add(concept.title)
+                unique.append(concept.title)
+                if limit is not None and len(unique) == limit:
+                    break
+        return unique
+
+
+def _heading(line: str):
+    """
+    Classify a stripped line as a heading
+
+    Returns:
+        (display text, cleaned title) if the line is a standalone heading, else None
+    """
+    if line.startswith('#'):
+        display = line.lstrip('#').strip()
+    elif line.startswith('**') and line.endswith('**') and len(line) > 4:
+        display = line.strip('* ')
+        if len(display.split()) > 8:
+            return None
+    elif line[0].isdigit() and len(line.split()) <= 8:
+        display = line
+    else:
+        return None
+    return display, clean_heading_text(line)
+
+
+class IncrementalParser:
+    """
+    Line-oriented parser that accepts content in arbitrary chunks
+
+    Standalone headings ('#' lines, short numbered lines, fully bold short
+    lines) start a new concept unless they are a section label such as
+    "Key Points", which becomes a SubHeading of the current concept. A
+    concept is complete as soon as the next one starts, so streamed
+    responses yield concepts while the rest is still being generated.
+
+    Numbered lines are ordered list items inside a list, under a section
+    label, or when their number does not go past the concepts seen so far.
+    Otherwise a short numbered line is held back until the next non-blank
+    line: it is a concept heading unless that line continues a list.
+    """
+
+    def __init__(self):
+        self.doc = Document()
+        self._blocks = self.doc.preamble
+        self._source = self.doc.preamble_lines
+        self._list: Optional[BulletList] = None
+        self._pending = ''
+        self._candidate: Optional[str] = None
+        self._held: List[str] = []
+
+    def feed(self, chunk: str) -> List[Concept]:
+        """
+        Consume a chunk of text
+
+        Args:
+            chunk: Next piece of the response
+
+        Returns:
+            Concepts completed by this chunk
+        """
+        lines = (self._pending + chunk).split('\n')
+        self._pending = lines.pop()
+        completed = []
+        for raw_line in lines:
+            completed.extend(self.feed_line(raw_line))
+        return completed
+
+    def close(self) -> List[Concept]:
+        """
+        Flush buffered text at end of input
+
+        Returns:
+            Concepts completed by the end of input (at most the last one)
+        """
+        pending, self._pending = self._pending, ''
+        completed = self.feed_line(pending) if pending else []
+        self.finish()
+        if self.doc.concepts:
+            completed.append(self.doc.concepts[-1])
+        return completed
+
+    def finish(self):
+        """
+        Settle a held-back numbered line at end of input; with nothing after
+        it, it is a list item rather than a concept without a body
+        """
+        if self._candidate is not None:
+            self._resolve(heading=False)
+
+    def feed_line(self, raw_line: str) -> List[Concept]:
+        """
+        Consume one complete line
+
+        Args:
+            raw_line: Line without its trailing newline
+
+        Returns:
+            Concepts completed because this line started new ones
+        """
+        line = raw_line.strip()
+        completed = []
+        if self._candidate is not None:
+            if not line:
+                self._held.append(raw_line)
+                return completed
+            is_list_line = _ORDERED_MARKER_RE.match(line) or _LIST_MARKER_RE.match(line)
+            completed.extend(self._resolve(heading=not is_list_line))
+        completed.extend(self._consume(raw_line, line))
+        return completed
+
+    def _resolve(self, heading: bool) -> List[Concept]:
+        """Turn the held-back numbered line into a concept heading or a list item"""
+        candidate, held = self._candidate, self._held
+        self._candidate, self._held = None, []
+        if heading:
+            completed = self._start_concept(candidate, *_heading(candidate.strip()))
+        else:
+            self._add_list_item(candidate, candidate.strip())
+            completed = []
+        for raw_line in held:
+            self._consume(raw_line, '')
+        return completed
+
+    def _start_concept(self, raw_line: str, display: str, title: str) -> List[Concept]:
+        finished = [self.doc.concepts[-1]] if self.doc.concepts else []
+        concept = Concept(display, title, source_lines=[raw_line])
+        self.doc.concepts.append(concept)
+        self._blocks = concept.blocks
+        self._source = concept.source_lines
+        self._list = None
+        return finished
+
+    def _numbered_item(self, line: str) -> bool:
+        """Whether a numbered line belongs to a list rather than possibly starting a concept"""
+        match = _ORDERED_MARKER_RE.match(line)
+        if match is None:
+            return False
+        if self._list is not None or (self._blocks and isinstance(self._blocks[-1], SubHeading)):
+            return True
+        # Concept numbers only go up; "1." under concept 1 restarts a list
+        return int(match.group(1)) <= len(self.doc.concepts)
+
+    def _add_list_item(self, raw_line: str, line: str):
+        ordered = _ORDERED_MARKER_RE.match(line)
+        marker = ordered or _LIST_MARKER_RE.match(line)
+        self._source.append(raw_line)
+        if self._list is None or self._list.ordered != bool(ordered):
+            self._list = BulletList(ordered=bool(ordered))
+            self._blocks.append(self._list)
+        self._list.items.append(line[marker.end():].strip())
+
+    def _consume(self, raw_line: str, line: str) -> List[Concept]:
+        """Consume one line once no numbered line is held back"""
+        if not line:
+            self._list = None
+            self._source.append(raw_line)
+            return []
+
+        if self._numbered_item(line):
+            self._add_list_item(raw_line, line)
+            return []
+
+        heading = _heading(line)
+        if heading is not None:
+            display, title = heading
+            if is_concept_title(title):
+                if line[0].isdigit():
+                    self._candidate = raw_line
+                    return []
+                return self._start_concept(raw_line, display, title)
+            if title:
+                self._list = None
+                self._blocks.append(SubHeading(display.strip('* :')))
+                self._source.append(raw_line)
+                return []
+
+        if _ORDERED_MARKER_RE.match(line) or _LIST_MARKER_RE.match(line):
+            self._add_list_item(raw_line, line)
+            return []
+
+        self._list = None
+        self._source.append(raw_line)
+        self._blocks.append(Paragraph(line))
+        return []
+
+
+def parse_markdown(content: str) -> Document:
+    """
+    Parse generated content into a Document in one pass over its lines
+
+    Args:
+        content: Generated content text
+
+    Returns:
+        Parsed Document
+    """
+    parser = IncrementalParser()
+    for raw_line in content.split('\n'):
+        parser.feed_line(raw_line)
+    parser.finish()
+    return parser.doc
+
+
+def _render_blocks_html(blocks: List[Block], out: List[str]):
+    for block in blocks:
+        if isinstance(block, Paragraph):
+            out.append(f'<p>{render_inline(block.text)}</p>')
+        elif isinstance(block, SubHeading):
+            out.append(f'<p><strong>{render_inline(block.text)}</strong></p>')
+        else:
+            tag = 'ol' if block.ordered else 'ul'
+            out.append(f'<{tag}>')
+            out.extend(f'<li>{render_inline(item)}</li>' for item in block.items)
+            out.append(f'</{tag}>')
+
+
+def render_concept_html(concept: Concept) -> str:
+    """
+    Render one concept as an HTML card
+
+    Args:
+        concept: Parsed concept
+
+    Returns:
+        HTML for a single concept card
+    """
+    out = ['<div class="concept-card">', f'<h3>{render_inline(concept.heading)}</h3>']
+    _render_blocks_html(concept.blocks, out)
+    out.append('</div>')
+    return '\n'.join(out)
+
+
+def render_html(doc: Document, rendered_cards: Optional[Dict[str, str]] = None) -> str:
+    """
+    Render a Document as concept-card HTML
+
+    Args:
+        doc: Parsed document
+        rendered_cards: Optional cache of card HTML keyed by concept source text,
+            e.g. cards rendered while the response was streaming
+
+    Returns:
+        HTML fragment with one card per concept (plus one for any preamble)
+    """
+    out: List[str] = []
+    if doc.preamble:
+        out.append('<div class="concept-card">')
+        _render_blocks_html(doc.preamble, out)
+        out.append('</div>')
+    for concept in doc.concepts:
+        card = rendered_cards.get(concept.source) if rendered_cards else None
+        out.append(card if card is not None else render_concept_html(concept))
+    return '\n'.join(out)
+
+
+def _render_blocks_text(blocks: List[Block], out: List[str]):
+    for block in blocks:
+        if isinstance(block, Paragraph):
+            out.append(strip_inline(block.text))
+        elif isinstance(block, SubHeading):
+            out.append(f"{strip_inline(block.text)}:")
+        elif block.ordered:
+            out.extend(f"  {n}. {strip_inline(item)}" for n, item in enumerate(block.items, start=1))
+        else:
+            out.extend(f"  • {strip_inline(item)}" for item in block.items)
+
+
+def render_text(doc: Document) -> str:
+    """
+    Render a Document as plain text
+
+    Args:
+        doc: Parsed document
+
+    Returns:
+        Plain-text rendering suitable for text/plain email parts
+    """
+    out: List[str] = []
+    _render_blocks_text(doc.preamble, out)
+    for concept in doc.concepts:
+        if out:
+            out.append('')
+        out.append(strip_inline(concept.heading))
+        out.append('-' * len(out[-1]))
+        _render_blocks_text(concept.blocks, out)
+    return '\n'.join(out)
@@ -3,15 +3,370 @@ Email Sender module for sending emails via SMTP.
 Handles Gmail SMTP configuration and email delivery.
 """
 
+import secrets
 import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from email import quoprimime
+from email.header import Header
 from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+@dataclass
+class SendResult:
+    """Delivery outcome for a single recipient"""
+    
+    to_email: str
+    success: bool
+    error: Optional[str] = None
+    refused: Dict[str, Tuple[int, bytes]] = field(default_factory=dict)
+
+
+def _qp_encode(data: bytes) -> bytes:
+    """
+    Quoted-printable encode a fragment so fragments can be concatenated
+    
+    A fragment that does not end in a line break gets a soft line break,
+    so the next fragment starts a new encoded line without changing the
+    decoded text. Lines stay within the 76 characters RFC 2045 allows.
+    """
+    if not data:
+        return b''
+    encoded = quoprimime.body_encode(data.decode('latin-1'), maxlinelen=75, eol='\r\n')
+    if not encoded.endswith('\r\n'):
+        encoded += '=\r\n'
+    return encoded.encode('ascii')
+
+
+def _header_line(name: str, value: str) -> bytes:
+    """Encode one header line, RFC 2047-encoding non-ASCII values"""
+    if '\r' in value or '\n' in value:
+        raise ValueError(f"Line break in {name} header")
+    if not value.isascii() or len(name) + len(value) > 76:
+        value = Header(value, 'utf-8', header_name=name).encode(linesep='\r\n')
+    return f"{name}: {value}\r\n".encode('ascii')
+
+
+class PreparedBody:
+    """HTML body transfer-encoded once, reused for every recipient
+    
+    The static parts of the (optionally slotted) HTML are quoted-printable
+    encoded up front. Each message then costs only its From/To/Subject
+    headers and the encoded slot values spliced between the cached chunks.
+    """
+    
+    def __init__(self, chunks: Sequence[bytes], slots: Sequence[str] = ()):
+        """
+        Initialize prepared body
+        
+        Args:
+            chunks: UTF-8 HTML around the slots (len(slots) + 1 chunks),
+                e.g. CompiledTemplate.chunks
+            slots: Names of the per-recipient values between the chunks
+        """
+        self.slots = list(slots)
+        boundary = f"{'=' * 15}{secrets.token_hex(10)}=="
+        self.head = (
+            f'MIME-Version: 1.0\r\n'
+            f'Content-Type: multipart/alternative;\r\n boundary="{boundary}"\r\n\r\n'
+            f'--{boundary}\r\n'
+            f'Content-Type: text/html; charset="utf-8"\r\n'
+            f'MIME-Version: 1.0\r\n'
+            f'Content-Transfer-Encoding: quoted-printable\r\n\r\n'
+        ).encode('ascii')
+        self.tail = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        self.chunks = [_qp_encode(chunk) for chunk in chunks]
+    
+    @classmethod
+    def from_html(cls, html_content: str) -> 'PreparedBody':
+        """
+        Prepare a body that is identical for every recipient
+        
+        Args:
+            html_content: HTML content of the email
+            
+        Returns:
+            PreparedBody without slots
+        """
+        return cls([html_content.encode('utf-8')])
+    
+    @classmethod
+    def from_template(cls, template) -> 'PreparedBody':
+        """
+        Prepare a body from a template whose open slots vary per recipient
+        
+        Args:
+            template: email_template.CompiledTemplate (e.g. EmailTemplate.compiled_issue())
+            
+        Returns:
+            PreparedBody with the template's slots
+        """
+        return cls(template.chunks, template.slots)
+    
+    def message_bytes(self, from_email: str, to_email: str, subject: str, **values) -> bytes:
+        """
+        Assemble one recipient's message
+        
+        Args:
+            from_email: From header
+            to_email: To header
+            subject: Subject header
+            **values: Value (str or bytes) for every slot
+            
+        Returns:
+            The complete message with CRLF line endings, ready for SMTP
+            
+        Raises:
+            KeyError: If a slot has no value
+        """
+        parts = [_header_line('From', from_email), _header_line('To', to_email),
+                 _header_line('Subject', subject), self.head, self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            value = values[slot]
+            parts.append(_qp_encode(value if isinstance(value, bytes) else str(value).encode('utf-8')))
+            parts.append(chunk)
+        parts.append(self.tail)
+        return b''.join(parts)
+
+
+class _PooledConnection:
+    """Logged-in SMTP connection plus the number of messages it has sent"""
+    
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.messages_sent = 0
+    
+    def close(self):
+        """Close the underlying connection, ignoring errors from a dead socket"""
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                self.smtp.close()
+            except OSError:
+                pass
+
+
+class SMTPConnectionPool:
+    """Bounded, thread-safe pool of logged-in SMTP connections"""
+    
+    def __init__(self, smtp_server: str, smtp_port: int, username: str, password: str,
+                 max_size: int = 4, max_messages_per_connection: int = 100,
+                 timeout: float = 30.0, use_ssl: bool = True):
+        """
+        Initialize connection pool
+        
+        Args:
+            smtp_server: SMTP server address
+            smtp_port: SMTP server port
+            username: Login user name
+            password: Login password
+            max_size: Maximum number of simultaneously open connections
+            max_messages_per_connection: Messages sent before a connection is recycled
+            timeout: Socket timeout in seconds
+            use_ssl: Connect with implicit TLS (port 465); otherwise connect in
+                plain text and upgrade with STARTTLS when the server offers it
+        """
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.username = username
+        self.password = password
+        self.max_size = max(1, max_size)
+        self.max_messages_per_connection = max(1, max_messages_per_connection)
+        self.timeout = timeout
+        self.use_ssl = use_ssl
+        
+        self._idle: List[_PooledConnection] = []
+        self._open_count = 0
+        self._closed = False
+        self._condition = threading.Condition()
+    
+    def _connect(self) -> _PooledConnection:
+        """Open a new connection and log in"""
+        with metrics.span('smtp.connect', server=self.smtp_server):
+            if self.use_ssl:
+                smtp = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=self.timeout)
+            else:
+                smtp = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        try:
+            if not self.use_ssl:
+                smtp.ehlo()
+                if smtp.has_extn('starttls'):
+                    smtp.starttls()
+                    smtp.ehlo()
+            with metrics.span('smtp.login'):
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return _PooledConnection(smtp)
+    
+    def acquire(self) -> _PooledConnection:
+        """
+        Take an idle connection or open a new one, blocking while the pool is exhausted
+        
+        Returns:
+            A logged-in pooled connection
+        """
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("SMTP connection pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._open_count < self.max_size:
+                    self._open_count += 1
+                    break
+                self._condition.wait()
+        
+        try:
+            return self._connect()
+        except Exception:
+            with self._condition:
+                self._open_count -= 1
+                self._condition.notify()
+            raise
+    
+    def release(self, conn: _PooledConnection, discard: bool = False):
+        """
+        Return a connection to the pool
+        
+        Args:
+            conn: Connection obtained from acquire()
+            discard: Close the connection instead of keeping it idle
+        """
+        recycle = conn.messages_sent >= self.max_messages_per_connection
+        with self._condition:
+            if discard or recycle or self._closed:
+                self._open_count -= 1
+            else:
+                self._idle.append(conn)
+                conn = None
+            self._condition.notify()
+        
+        if conn is not None:
+            conn.close()
+    
+    @staticmethod
+    def _connection_lost(error: BaseException) -> bool:
+        """Whether a failed command left the connection unusable"""
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return True
+        # 421: the server is closing the transmission channel
+        if isinstance(error, smtplib.SMTPResponseException):
+            return error.smtp_code == 421
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return any(code == 421 for code, _ in error.recipients.values())
+        if isinstance(error, smtplib.SMTPException):
+            return False
+        return isinstance(error, OSError)
+    
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException as error:
+            # smtplib closes the socket itself on some errors, e.g. 421 replies
+            self.release(conn, discard=self._connection_lost(error) or conn.smtp.sock is None)
+            raise
+        else:
+            self.release(conn)
+    
+    def sendmail(self, from_addr: str, to_addrs, msg, reconnect_attempts: int = 1):
+        """
+        Send a message over a pooled connection, reconnecting if the server hung up
+        
+        Args:
+            from_addr: Envelope sender
+            to_addrs: Envelope recipient or list of recipients
+            msg: Serialized message (str or bytes)
+            reconnect_attempts: How many times to retry on a fresh connection
+            
+        Returns:
+            Dictionary of refused recipients, as returned by smtplib
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.connection() as conn, metrics.span('smtp.send', attempt=attempt + 1):
+                    refused = conn.smtp.sendmail(from_addr, to_addrs, msg)
+                    conn.messages_sent += 1
+                    return refused
+            except smtplib.SMTPServerDisconnected:
+                attempt += 1
+                if attempt > reconnect_attempts:
+                    raise
+    
+    def warm(self, count: Optional[int] = None) -> int:
+        """
+        Check idle connections with NOOP and open new ones ahead of a send
+        
+        Args:
+            count: Idle connections wanted (defaults to the pool size)
+            
+        Returns:
+            Number of idle, working connections
+        """
+        count = min(count or self.max_size, self.max_size)
+        with self._condition:
+            idle, self._idle = self._idle, []
+        
+        alive = []
+        for conn in idle:
+            try:
+                healthy = conn.smtp.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                healthy = False
+            if healthy:
+                alive.append(conn)
+            else:
+                self.release(conn, discard=True)
+        with self._condition:
+            self._idle.extend(alive)
+            self._condition.notify_all()
+        
+        while True:
+            with self._condition:
+                if self._closed or len(self._idle) >= count or self._open_count >= self.max_size:
+                    return len(self._idle)
+                self._open_count += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._condition:
+                    self._open_count -= 1
+                    self._condition.notify()
+                raise
+            self.release(conn)
+    
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+            self._condition.notify_all()
+        
+        for conn in idle:
+            conn.close()
 
 
 class EmailSender:
     """Class to send emails using Gmail SMTP"""
     
-    def __init__(self, smtp_server: str, smtp_port: int, from_email: str, app_password: str):
+    def __init__(self, smtp_server: str, smtp_port: int, from_email: str, app_password: str,
+                 pool_size: int = 4, max_messages_per_connection: int = 100,
+                 use_ssl: bool = True):
         """
         Initialize email sender
         
@@ -20,11 +375,69 @@ class EmailSender:
             smtp_port: SMTP server port
             from_email: Sender email address
             app_password: Gmail app password
+            pool_size: Maximum number of concurrent SMTP connections
+            max_messages_per_connection: Messages sent before a connection is recycled
+            use_ssl: Implicit TLS (port 465) instead of STARTTLS (port 587)
         """
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.from_email = from_email
         self.app_password = app_password
+        self.pool_size = max(1, pool_size)
+        self.max_messages_per_connection = max_messages_per_connection
+        self.use_ssl = use_ssl
+        self._pool: Optional[SMTPConnectionPool] = None
+        self._pool_lock = threading.Lock()
+    
+    @property
+    def pool(self) -> SMTPConnectionPool:
+        """Lazily created connection pool shared by all sends"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = SMTPConnectionPool(
+                        self.smtp_server,
+                        self.smtp_port,
+                        self.from_email,
+                        self.app_password,
+                        max_size=self.pool_size,
+                        max_messages_per_connection=self.max_messages_per_connection,
+                        use_ssl=self.use_ssl
+                    )
+        return self._pool
+    
+    def close(self):
+        """Close all pooled SMTP connections"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+    
+    def warm(self, connections: Optional[int] = None) -> int:
+        """
+        Log in ahead of a send so the first messages go out without a handshake
+        
+        Args:
+            connections: Connections to have ready (defaults to the pool size)
+            
+        Returns:
+            Number of ready connections
+        """
+        return self.pool.warm(connections)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _deliver(self, to_email: str, msg) -> Dict[str, Tuple[int, bytes]]:
+        """Send a built message (or prepared message bytes) through the connection pool"""
+        try:
+            return self.pool.sendmail(self.from_email, to_email,
+                                      msg if isinstance(msg, bytes) else msg.as_string())
+        except smtplib.SMTPException as e:
+            raise Exception(f"Failed to send email: {str(e)}")
     
     def send_html_email(self, to_email: str, subject: str, html_content: str):
         """
@@ -38,23 +451,9 @@ class EmailSender:
         Raises:
             Exception: If email sending fails
         """
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['From'] = self.from_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Attach HTML content
-        html_part = MIMEText(html_content, 'html')
-        msg.attach(html_part)
-        
-        try:
-            # Connect to SMTP server and send
-            with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as smtp:
-                smtp.login(self.from_email, self.app_password)
-                smtp.sendmail(self.from_email, to_email, msg.as_string())
-        except smtplib.SMTPException as e:
-            raise Exception(f"Failed to send email: {str(e)}")
+        with metrics.span('send.build'):
+            data = PreparedBody.from_html(html_content).message_bytes(self.from_email, to_email, subject)
+        self._deliver(to_email, data)
     
     def send_plain_email(self, to_email: str, subject: str, text_content: str):
         """
@@ -73,9 +472,53 @@ class EmailSender:
         msg['To'] = to_email
         msg['Subject'] = subject
         
-        try:
-            with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as smtp:
-                smtp.login(self.from_email, self.app_password)
-                smtp.sendmail(self.from_email, to_email, msg.as_string())
-        except smtplib.SMTPException as e:
-            raise Exception(f"Failed to send email: {str(e)}")
+        self._deliver(to_email, msg)
+    
+    def send_bulk(self, messages: Iterable[dict], max_workers: Optional[int] = None,
+                  rate_limiter=None) -> List[SendResult]:
+        """
+        Send many HTML emails over the shared connection pool
+        
+        Messages sharing a body are transfer-encoded once: pass the same
+        'html_content' string, or a PreparedBody as 'body' plus the
+        recipient's slot 'values'.
+        
+        Args:
+            messages: Dicts with 'to_email', 'subject' and either 'html_content'
+                or 'body' (PreparedBody) and optional 'values' (slot values)
+            max_workers: Number of sending threads (defaults to the pool size)
+            rate_limiter: Optional object whose acquire(to_email) blocks until
+                a message may be sent, e.g. a ratelimit.RateLimiter
+                
+        Returns:
+            One SendResult per message, in input order
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+        
+        bodies: Dict[str, PreparedBody] = {}
+        for message in messages:
+            if 'body' not in message and message['html_content'] not in bodies:
+                bodies[message['html_content']] = PreparedBody.from_html(message['html_content'])
+        
+        def send_one(message: dict) -> SendResult:
+            to_email = message['to_email']
+            if rate_limiter is not None:
+                rate_limiter.acquire(to_email)
+            body = message.get('body') or bodies[message['html_content']]
+            try:
+                data = body.message_bytes(self.from_email, to_email, message['subject'],
+                                          **message.get('values', {}))
+                refused = self.pool.sendmail(self.from_email, to_email, data)
+            except smtplib.SMTPRecipientsRefused as e:
+                return SendResult(to_email, False, str(e), dict(e.recipients))
+            except (smtplib.SMTPException, OSError, ValueError) as e:
+                return SendResult(to_email, False, str(e))
+            if refused:
+                return SendResult(to_email, False, "Recipient refused", refused)
+            return SendResult(to_email, True)
+        
+        workers = max(1, min(max_workers or self.pool_size, len(messages)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(send_one, messages))
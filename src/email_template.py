@@ -3,51 +3,39 @@ Email Template module for creating beautiful HTML emails.
 Generates responsive email layouts.
 """
 
+import html
+import re
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional, Sequence
 
+try:
+    from .document import parse_markdown, render_html
+    from .metrics import metrics
+except ImportError:
+    from document import parse_markdown, render_html
+    from metrics import metrics
 
-class EmailTemplate:
-    """Class to generate beautiful HTML email templates"""
-    
-    @staticmethod
-    def create_html_email(concepts_text: str, date: Optional[str] = None) -> str:
-        """
-        Create a beautiful, responsive HTML email template
-        
-        Args:
-            concepts_text: The AI concepts content
-            date: Date string (defaults to today)
-            
-        Returns:
-            Complete HTML email string
-        """
-        if date is None:
-            date = datetime.now().strftime("%B %d, %Y")
-        
-        # Convert plain text to HTML with proper formatting
-        html_content = EmailTemplate._format_content(concepts_text)
-        
-        html_template = f"""<!DOCTYPE html>
+
+HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>AI Insight Daily</title>
     <style>
-        body {{
+        body {
             margin: 0;
             padding: 0;
             background-color: #f3f4f6;
             font-family: 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
             color: #1f2937;
-        }}
-        .wrapper {{
+        }
+        .wrapper {
             width: 100%;
             background: linear-gradient(135deg, #6b73ff 0%, #000dff 100%);
             padding: 40px 0;
-        }}
-        .container {{
+        }
+        .container {
             width: 600px;
             max-width: 90%;
             margin: 0 auto;
@@ -55,24 +43,24 @@ class EmailTemplate:
             border-radius: 16px;
             overflow: hidden;
             box-shadow: 0 20px 45px rgba(15, 23, 42, 0.18);
-        }}
-        .header {{
+        }
+        .header {
             padding: 45px 35px 35px;
             text-align: center;
             background: radial-gradient(circle at top left, #a5b4fc, #4c1d95);
             color: #ffffff;
-        }}
-        .header h1 {{
+        }
+        .header h1 {
             margin: 0 0 12px;
             font-size: 30px;
             letter-spacing: 0.6px;
-        }}
-        .header p {{
+        }
+        .header p {
             margin: 0;
             font-size: 16px;
             color: rgba(255, 255, 255, 0.85);
-        }}
-        .date-bar {{
+        }
+        .date-bar {
             padding: 14px 35px;
             background: #eef2ff;
             border-bottom: 1px solid #c7d2fe;
@@ -81,69 +69,69 @@ class EmailTemplate:
             color: #4338ca;
             font-weight: 600;
             letter-spacing: 0.4px;
-        }}
-        .content {{
+        }
+        .content {
             padding: 35px;
             background: linear-gradient(180deg, rgba(249, 250, 251, 0.94) 0%, #ffffff 45%);
-        }}
-        .intro {{
+        }
+        .intro {
             margin: 0 0 28px;
             font-size: 17px;
             color: #334155;
             line-height: 1.6;
-        }}
-        .concept-card {{
+        }
+        .concept-card {
             background: #ffffff;
             border-radius: 14px;
             padding: 22px 24px;
             margin-bottom: 18px;
             border: 1px solid rgba(99, 102, 241, 0.18);
             box-shadow: 0 15px 30px rgba(15, 23, 42, 0.08);
-        }}
-        .concept-card h3 {{
+        }
+        .concept-card h3 {
             margin: 0 0 14px;
             font-size: 20px;
             color: #312e81;
-        }}
-        .concept-card p {{
+        }
+        .concept-card p {
             margin: 12px 0;
             font-size: 15px;
             color: #475569;
             line-height: 1.6;
-        }}
-        .concept-card ul {{
+        }
+        .concept-card ul {
             margin: 10px 0 0 18px;
             padding: 0;
-        }}
-        .concept-card li {{
+        }
+        .concept-card li {
             margin: 6px 0;
             color: #374151;
             font-size: 15px;
-        }}
-        .concept-card strong {{
+        }
+        .concept-card strong {
             color: #1f2937;
-        }}
-        .footer {{
+        }
+        .footer {
             padding: 32px 28px 36px;
             background: #0f172a;
             text-align: center;
             color: rgba(226, 232, 240, 0.85);
             font-size: 13px;
-        }}
-        .footer p {{
+        }
+        .footer p {
             margin: 6px 0;
-        }}
-        @media (max-width: 640px) {{
-            .content {{
+        }
+        @media (max-width: 640px) {
+            .content {
                 padding: 24px;
-            }}
-            .concept-card {{
+            }
+            .concept-card {
                 padding: 20px;
-            }}
-            .concept-card h3 {{
+            }
+            .concept-card h3 {
                 font-size: 18px;
-            }}
-        }}
+            }
+        }
     </style>
 </head>
 <body>
@@ -151,12 +139,12 @@ class EmailTemplate:
         <div class="container">
             <div class="header">
                 <h1>🤖 AI Insight Daily</h1>
-                <p>5 Concepts, 5 Minutes • Curated for Moussaab Boutelis</p>
+                <p>5 Concepts, 5 Minutes • Curated for {{recipient_name}}</p>
             </div>
-            <div class="date-bar">📅 {date}</div>
+            <div class="date-bar">📅 {{date}}</div>
             <div class="content">
-                <p class="intro">Hello Moussaab! 👋 Welcome to your daily briefing. Here are the five freshest AI concepts curated to expand your knowledge today.</p>
-                {html_content}
+                <p class="intro">Hello {{first_name}}! 👋 Welcome to your daily briefing. Here are the five freshest AI concepts curated to expand your knowledge today.</p>
+                {{body}}
             </div>
             <div class="footer">
                 <p>Stay curious, keep building! 🚀</p>
@@ -166,86 +154,228 @@ class EmailTemplate:
     </div>
 </body>
 </html>"""
+
+_SLOT_RE = re.compile(r"\{\{(\w+)\}\}")
+
+
+class CompiledTemplate:
+    """Template pre-split into static UTF-8 byte chunks and named slots"""
+    
+    def __init__(self, source: str):
+        """
+        Compile a template containing {{slot}} markers
         
-        return html_template
+        Args:
+            source: Template text
+        """
+        self.chunks: List[bytes] = []
+        self.slots: List[str] = []
+        position = 0
+        for match in _SLOT_RE.finditer(source):
+            self.chunks.append(source[position:match.start()].encode('utf-8'))
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.chunks.append(source[position:].encode('utf-8'))
     
     @staticmethod
-    def _format_content(content: str) -> str:
+    def encode_values(**values) -> dict:
         """
-        Format plain text content into HTML with proper styling
+        Encode slot values once so they can be reused across renders
+        
+        Returns:
+            Mapping of slot name to UTF-8 bytes
+        """
+        return {name: value if isinstance(value, bytes) else str(value).encode('utf-8')
+                for name, value in values.items()}
+    
+    def render_bytes(self, **values) -> bytes:
+        """
+        Splice slot values between the static chunks
         
         Args:
-            content: Plain text content
+            **values: Value (str or bytes) for every slot
             
         Returns:
-            Formatted HTML content
+            Rendered document as UTF-8 bytes
+            
+        Raises:
+            KeyError: If a slot has no value
         """
-        lines = content.split('\n')
-        html_lines: list[str] = []
-        in_list = False
-        inside_card = False
-
-        def close_list():
-            nonlocal in_list
-            if in_list:
-                html_lines.append('</ul>')
-                in_list = False
-
-        def close_card():
-            nonlocal inside_card
-            if inside_card:
-                close_list()
-                html_lines.append('</div>')
-                inside_card = False
-
-        for raw_line in lines:
-            line = raw_line.strip()
-
-            if not line:
-                close_list()
-                continue
-
-            is_heading = False
-            heading_text = ''
-
-            if line.startswith('#'):
-                is_heading = True
-                heading_text = line.lstrip('#').strip()
-            elif line.startswith('**') and line.endswith('**'):
-                heading_text = line.strip('* ')
-                is_heading = len(heading_text.split()) <= 8
-            elif line[0].isdigit() if line else False:
-                is_heading = True
-                heading_text = line
-
-            if is_heading and heading_text:
-                close_card()
-                inside_card = True
-                html_lines.append('<div class="concept-card">')
-                html_lines.append(f'<h3>{heading_text}</h3>')
-                continue
-
-            if line.startswith(('-', '•', '*')):
-                if not inside_card:
-                    inside_card = True
-                    html_lines.append('<div class="concept-card">')
-                if not in_list:
-                    html_lines.append('<ul>')
-                    in_list = True
-                html_lines.append(f'<li>{line[1:].strip()}</li>')
-                continue
-
-            close_list()
+        values = self.encode_values(**values)
+        parts = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            parts.append(values[slot])
+            parts.append(chunk)
+        return b''.join(parts)
+    
+    def partial(self, **values) -> 'CompiledTemplate':
+        """
+        Fill some slots, keeping the others open
+        
+        Args:
+            **values: Value (str or bytes) for each slot to fill
+            
+        Returns:
+            New template whose chunks include the filled values
+        """
+        values = self.encode_values(**values)
+        filled = CompiledTemplate('')
+        filled.chunks, filled.slots = [self.chunks[0]], []
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            if slot in values:
+                filled.chunks[-1] += values[slot] + chunk
+            else:
+                filled.slots.append(slot)
+                filled.chunks.append(chunk)
+        return filled
+    
+    def render(self, **values) -> str:
+        """
+        Render the template as a string
+        
+        Args:
+            **values: Value (str or bytes) for every slot
+            
+        Returns:
+            Rendered document
+        """
+        return self.render_bytes(**values).decode('utf-8')
 
-            if not inside_card:
-                inside_card = True
-                html_lines.append('<div class="concept-card">')
 
-            formatted_line = line
-            while '**' in formatted_line:
-                formatted_line = formatted_line.replace('**', '<strong>', 1).replace('**', '</strong>', 1)
-            html_lines.append(f'<p>{formatted_line}</p>')
+_compiled_template: Optional[CompiledTemplate] = None
 
-        close_card()
 
-        return '\n'.join(html_lines)
+class EmailTemplate:
+    """Class to generate beautiful HTML email templates"""
+    
+    DEFAULT_RECIPIENT_NAME = "Moussaab Boutelis"
+    
+    @staticmethod
+    def compiled() -> CompiledTemplate:
+        """
+        Get the email skeleton, compiled once per process
+        
+        Returns:
+            Shared CompiledTemplate for the daily email
+        """
+        global _compiled_template
+        if _compiled_template is None:
+            _compiled_template = CompiledTemplate(HTML_TEMPLATE)
+        return _compiled_template
+    
+    @staticmethod
+    def load_template(path: Optional[str] = None) -> CompiledTemplate:
+        """
+        Replace the email skeleton, e.g. with an edited copy of HTML_TEMPLATE
+        
+        Args:
+            path: HTML file using the built-in template's {{slots}};
+                None restores the built-in template
+        
+        Returns:
+            The CompiledTemplate now in use
+        
+        Raises:
+            ValueError: If the file uses a slot the built-in template does not have
+        """
+        global _compiled_template
+        if path:
+            with open(path, 'r', encoding='utf-8') as f:
+                compiled = CompiledTemplate(f.read())
+        else:
+            compiled = CompiledTemplate(HTML_TEMPLATE)
+        unknown = set(compiled.slots) - set(CompiledTemplate(HTML_TEMPLATE).slots)
+        if unknown:
+            raise ValueError(f"Unknown template slots in {path}: {', '.join(sorted(unknown))}")
+        _compiled_template = compiled
+        return compiled
+    
+    @staticmethod
+    def recipient_slots(recipient_name: str) -> dict:
+        """Escaped personalization values for one recipient"""
+        name = recipient_name.strip() or EmailTemplate.DEFAULT_RECIPIENT_NAME
+        return {
+            'recipient_name': html.escape(name),
+            'first_name': html.escape(name.split()[0]),
+        }
+    
+    @staticmethod
+    def create_html_email(concepts_text: str, date: Optional[str] = None,
+                          recipient_name: Optional[str] = None,
+                          rendered_cards: Optional[Dict[str, str]] = None) -> str:
+        """
+        Create a beautiful, responsive HTML email template
+        
+        Args:
+            concepts_text: The AI concepts content
+            date: Date string (defaults to today)
+            recipient_name: Full name shown in the greeting (defaults to the owner)
+            rendered_cards: Card HTML already rendered during streaming, keyed by concept source
+            
+        Returns:
+            Complete HTML email string
+        """
+        return EmailTemplate.create_html_emails(
+            concepts_text,
+            [recipient_name or EmailTemplate.DEFAULT_RECIPIENT_NAME],
+            date,
+            rendered_cards
+        )[0]
+    
+    @staticmethod
+    def create_html_emails(concepts_text: str, recipient_names: Sequence[str],
+                           date: Optional[str] = None,
+                           rendered_cards: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Create one personalized email per recipient, formatting the body once
+        
+        Args:
+            concepts_text: The AI concepts content
+            recipient_names: Full name of each recipient
+            date: Date string (defaults to today)
+            rendered_cards: Card HTML already rendered during streaming, keyed by concept source
+            
+        Returns:
+            Complete HTML email string per recipient, in input order
+        """
+        issue = EmailTemplate.compiled_issue(concepts_text, date, rendered_cards)
+        return [issue.render(**EmailTemplate.recipient_slots(name)) for name in recipient_names]
+    
+    @staticmethod
+    def compiled_issue(concepts_text: str, date: Optional[str] = None,
+                       rendered_cards: Optional[Dict[str, str]] = None) -> CompiledTemplate:
+        """
+        Render everything shared by an issue's recipients, leaving the
+        recipient_slots() open
+        
+        Args:
+            concepts_text: The AI concepts content
+            date: Date string (defaults to today)
+            rendered_cards: Card HTML already rendered during streaming, keyed by concept source
+            
+        Returns:
+            Template with only the recipient_name and first_name slots
+        """
+        if date is None:
+            date = datetime.now().strftime("%B %d, %Y")
+        
+        return EmailTemplate.compiled().partial(
+            date=html.escape(date),
+            # Convert plain text to HTML with proper formatting
+            body=EmailTemplate._format_content(concepts_text, rendered_cards)
+        )
+    
+    @staticmethod
+    def _format_content(content: str, rendered_cards: Optional[Dict[str, str]] = None) -> str:
+        """
+        Format plain text content into HTML with proper styling
+        
+        Args:
+            content: Plain text content
+            rendered_cards: Optional card HTML to reuse, keyed by concept source
+            
+        Returns:
+            Formatted HTML content
+        """
+        with metrics.span('render.format'):
+            return render_html(parse_markdown(content), rendered_cards)
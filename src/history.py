@@ -0,0 +1,203 @@
+"""
+History module for encoding past concepts compactly in prompts.
+Cleans noisy titles and summarizes long histories as topic groups.
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    from .document import SECTION_LABELS
+except ImportError:
+    from document import SECTION_LABELS
+
+
+# Boilerplate the model sometimes copies from the prompt into titles
+_PREFIX_RE = re.compile(r"^(?:(?:new\s+)?concept(?:\s+name)?|topic|title)\s*\d*\s*[:.\-]*\s+",
+                        re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Words too generic to name a topic group
+GENERIC_WORDS = frozenset({
+    "a", "an", "and", "the", "of", "for", "in", "on", "with", "to", "by", "via", "from",
+    "ai", "artificial", "intelligence", "based", "driven", "powered", "enhanced",
+    "augmented", "enabled", "aware", "using", "system", "systems", "model", "models",
+    "learning", "framework", "frameworks", "approach", "approaches", "new",
+})
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for English prompt text (about 4 characters per token)
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        Estimated number of tokens
+    """
+    return (len(text) + 3) // 4
+
+
+def strip_title_boilerplate(title: str) -> str:
+    """
+    Remove prompt boilerplate prefixes such as "Concept Name" from a title
+
+    Args:
+        title: Raw concept title
+
+    Returns:
+        Title without the prefix, original casing preserved
+    """
+    return _PREFIX_RE.sub("", title.strip()).strip()
+
+
+def _keywords(title: str) -> List[str]:
+    """Distinctive, lightly stemmed words of a title"""
+    words = []
+    for word in _WORD_RE.findall(title.lower()):
+        if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+            word = word[:-1]
+        if word not in GENERIC_WORDS and len(word) > 2:
+            words.append(word)
+    return words
+
+
+@dataclass
+class CompactHistory:
+    """Prompt-ready encoding of the concept history"""
+
+    text: str
+    estimated_tokens: int
+    raw_tokens: int
+    groups: List[Tuple[str, int]] = field(default_factory=list)
+    dropped: int = 0
+
+
+class HistoryCompactor:
+    """Encode previously sent concepts within a token budget"""
+
+    def __init__(self, token_budget: int = 400, min_group_size: int = 2):
+        """
+        Initialize compactor
+
+        Args:
+            token_budget: Maximum estimated tokens for the encoded history
+            min_group_size: Titles sharing a keyword needed to form a group
+        """
+        self.token_budget = token_budget
+        self.min_group_size = min_group_size
+
+    @staticmethod
+    def clean(titles: Sequence[str]) -> Tuple[List[str], int]:
+        """
+        Strip boilerplate, drop noise entries and repeated titles
+
+        Args:
+            titles: Raw history, oldest first
+
+        Returns:
+            Tuple of (cleaned titles oldest first, number of dropped entries)
+        """
+        cleaned: Dict[str, str] = {}
+        for title in titles:
+            title = strip_title_boilerplate(title)
+            key = " ".join(_WORD_RE.findall(title.lower()))
+            if not key or key in SECTION_LABELS:
+                continue
+            # Re-inserting moves a repeated title to its most recent position
+            cleaned.pop(key, None)
+            cleaned[key] = title
+        kept = list(cleaned.values())
+        return kept, len(titles) - len(kept)
+
+    def group(self, titles: Sequence[str]) -> List[Tuple[str, List[str]]]:
+        """
+        Cluster titles by their most widely shared keyword
+
+        Args:
+            titles: Cleaned titles
+
+        Returns:
+            (label, member titles) pairs, largest group first; titles that share
+            no keyword with enough others are omitted
+        """
+        keywords = [_keywords(title) for title in titles]
+        frequency = Counter(word for words in keywords for word in set(words))
+
+        members: Dict[str, List[str]] = {}
+        for title, words in zip(titles, keywords):
+            if not words:
+                continue
+            best = max(words, key=lambda word: (frequency[word], word))
+            if frequency[best] >= self.min_group_size:
+                members.setdefault(best, []).append(title)
+
+        groups = []
+        for keyword, group_titles in members.items():
+            if len(group_titles) < self.min_group_size:
+                continue
+            # Label with the keyword plus its most common companion in the group
+            companions = Counter(
+                word for title in group_titles for word in set(_keywords(title)) if word != keyword
+            )
+            label = keyword
+            if companions:
+                companion, count = companions.most_common(1)[0]
+                if count >= 2:
+                    label = f"{keyword} {companion}"
+            groups.append((label, group_titles))
+
+        groups.sort(key=lambda item: (-len(item[1]), item[0]))
+        return groups
+
+    def compact(self, titles: Sequence[str]) -> CompactHistory:
+        """
+        Encode history as verbatim titles when it fits, otherwise as topic
+        groups with counts plus as many recent titles as the budget allows
+
+        Args:
+            titles: Raw history, oldest first
+
+        Returns:
+            CompactHistory with the encoded text and its estimated size
+        """
+        cleaned, dropped = self.clean(titles)
+        raw_tokens = estimate_tokens(", ".join(titles))
+        if not cleaned:
+            return CompactHistory("none", estimate_tokens("none"), raw_tokens, dropped=dropped)
+
+        verbatim = ", ".join(cleaned)
+        if estimate_tokens(verbatim) <= self.token_budget:
+            return CompactHistory(verbatim, estimate_tokens(verbatim), raw_tokens, dropped=dropped)
+
+        groups = [(label, len(members)) for label, members in self.group(cleaned)]
+        theme_parts: List[str] = []
+        themes = ""
+        for label, count in groups:
+            candidate = "Themes already covered (topic: count): " + ", ".join(
+                theme_parts + [f"{label}: {count}"])
+            # Keep at least half the budget for recent titles
+            if estimate_tokens(candidate) > self.token_budget // 2:
+                break
+            theme_parts.append(f"{label}: {count}")
+            themes = candidate
+
+        recent: List[str] = []
+        prefix = "Most recent: "
+        used = estimate_tokens(themes) + estimate_tokens(prefix) + 1
+        for title in reversed(cleaned):
+            cost = estimate_tokens(title + ", ")
+            if used + cost > self.token_budget:
+                break
+            recent.append(title)
+            used += cost
+
+        parts = [prefix + ", ".join(recent)] if recent else []
+        if themes:
+            parts.append(themes)
+        text = ". ".join(parts)
+        return CompactHistory(text, estimate_tokens(text), raw_tokens,
+                              groups=groups[:len(theme_parts)], dropped=dropped)
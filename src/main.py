@@ -3,81 +3,497 @@ Main module for AI Insight Daily project.
 Orchestrates the daily email generation and sending workflow.
 """
 
+import os
+import sqlite3
 import sys
-from config import config
+from contextlib import nullcontext
+from datetime import datetime
+from config import ConfigError, config
 from storage import ConceptStorage
 from ai_generator import AIConceptGenerator
 from email_template import EmailTemplate
 from email_sender import EmailSender
+from diversity import shared_concept_selector
+from dedup import DuplicateGate, NearDuplicateIndex
+from document import render_concept_html
+from metrics import metrics
+from outbox import DeliveryWorker, Outbox, OutboxWriter
+from checkpoint import CheckpointStore, checkpoint_key
+from providers import Provider, shared_provider_router
+from ratelimit import shared_api_guard
+from backlog import BacklogFiller, IssueBacklog
+from subscribers import Segment
+from archive import IssueArchive
+from search import ConceptIndex
 
 
-def main():
-    """Main execution function for daily AI concepts email"""
+def generate_streaming(ai_generator, previous_concepts, index, rendered_cards):
+    """
+    Generate concepts in streaming mode, checking and rendering each one as it arrives
+    
+    Streaming asks for exactly the issue size, so the cards rendered here
+    are reused by the template unless a concept is later replaced.
+    
+    Args:
+        ai_generator: Generator used for the completion
+        previous_concepts: List of previously covered topics
+        index: Near-duplicate index over the history
+        rendered_cards: Dict filled with card HTML keyed by concept source
+        
+    Returns:
+        Full generated concepts text
+    """
+    for concept in ai_generator.stream_concepts(
+        previous_concepts,
+        count=config.concepts_per_issue,
+        idle_timeout=config.stream_idle_timeout
+    ):
+        rendered_cards[concept.source] = render_concept_html(concept)
+        flag = " (near-duplicate, will be replaced)" if index.is_duplicate(concept.title) else ""
+        print(f"   ↳ {concept.title}{flag}")
+    return ai_generator.last_stream_text
+
+
+def api_guard():
+    """Rate limiter and circuit breaker shared by every generator in this process"""
+    return shared_api_guard(
+        config.api_base_url,
+        requests_per_second=config.api_requests_per_second,
+        failure_threshold=config.api_circuit_failure_threshold,
+        reset_timeout=config.api_circuit_reset_timeout,
+        burst=config.api_burst
+    )
+
+
+def api_router():
+    """
+    Router over Perplexity and the API_PROVIDERS backups, shared by every generator
+    
+    Returns:
+        The process-wide ProviderRouter, or None without backups
+    """
+    if not config.api_providers:
+        return None
+    primary = Provider('perplexity', config.api_base_url, config.model_name, config.perplexity_api_key or '')
+    return shared_provider_router(
+        [primary] + config.api_providers,
+        alpha=config.api_routing_alpha,
+        hedge_quantile=config.api_hedge_quantile,
+        hedge_min_samples=config.api_hedge_min_samples,
+        hedge_min_delay=config.api_hedge_min_delay,
+        max_workers=2 * config.api_max_concurrency
+    )
+
+
+def make_generator(interest=None, language=None, session=None):
+    """
+    Build a generator from the configuration
+    
+    Args:
+        interest: Optional focus area of a subscriber segment
+        language: Optional content language of a subscriber segment
+        session: Optional keep-alive HTTP session owned by the caller
+        
+    Returns:
+        AIConceptGenerator sharing the process-wide API guard and provider router
+    """
+    return AIConceptGenerator(
+        api_key=config.perplexity_api_key,
+        api_url=config.api_base_url,
+        model=config.model_name,
+        max_tokens=config.max_tokens,
+        temperature=config.temperature,
+        max_concurrency=config.api_max_concurrency,
+        history_token_budget=config.prompt_history_token_budget,
+        interest=interest,
+        language=language,
+        max_retries=config.api_max_retries,
+        retry_delay=config.api_retry_delay,
+        max_retry_delay=config.api_max_retry_delay,
+        guard=api_guard(),
+        session=session,
+        router=api_router()
+    )
+
+
+def make_email_sender():
+    """Build an SMTP sender from the configuration"""
+    return EmailSender(
+        smtp_server=config.smtp_server,
+        smtp_port=config.smtp_port,
+        from_email=config.from_email,
+        app_password=config.app_password,
+        pool_size=config.smtp_pool_size,
+        max_messages_per_connection=config.smtp_max_messages_per_connection,
+        use_ssl=config.smtp_use_ssl
+    )
+
+
+def email_sender_for(connections=None):
+    """
+    Sender for one run, as a context manager
+    
+    Args:
+        connections: daemon.WarmConnections kept open between runs, if any
+        
+    Returns:
+        The warm sender (left open after the run) or a new one (closed after it)
+    """
+    if connections is not None:
+        return nullcontext(connections.email_sender)
+    return make_email_sender()
+
+
+def make_delivery_worker(outbox, email_sender, rate_limiter=None):
+    """Build an outbox delivery worker from the configuration"""
+    return DeliveryWorker(
+        outbox, email_sender,
+        batch_size=config.outbox_batch_size,
+        max_attempts=config.outbox_max_attempts,
+        retry_delay=config.outbox_retry_delay,
+        max_retry_delay=config.outbox_max_retry_delay,
+        lease=config.outbox_lease_seconds,
+        rate_limiter=rate_limiter
+    )
+
+
+def print_delivery_report(report):
+    """Summarize an outbox drain"""
+    print(f"📤 Delivered {report.sent} queued emails")
+    for to_email, error in report.deferred:
+        print(f"   ⏳ Deferred {to_email}: {error}")
+    for to_email, error in report.dead:
+        print(f"   ❌ Dead-lettered {to_email}: {error}")
+    if report.released:
+        print(f"   ⏸️  Mail server unavailable, {report.released} emails left queued: {report.server_error}")
+
+
+def deliver_queued(connections=None, rate_limiter=None):
+    """
+    Drain the outbox in this process when OUTBOX_DELIVER_INLINE is set
+    
+    Deferred messages stay queued for the next drain, by a later run or a
+    separate `cli.py outbox --deliver --watch` worker.
+    
+    Args:
+        connections: daemon.WarmConnections to reuse instead of opening new ones
+        rate_limiter: Optional ratelimit.RateLimiter applied to every message
+        
+    Returns:
+        Exit code (1 if a message was dead-lettered)
+    """
+    if not (config.outbox_enabled and config.outbox_deliver_inline):
+        return 0
+    print("\n📤 Delivering the outbox...")
+    outbox = Outbox(config.outbox_file)
+    try:
+        with email_sender_for(connections) as email_sender:
+            report = make_delivery_worker(outbox, email_sender, rate_limiter).drain()
+        outbox.prune(config.checkpoint_retention_days)
+    finally:
+        outbox.close()
+    print_delivery_report(report)
+    return 1 if report.dead else 0
+
+
+def queue_email(key, to_email, subject, html_email):
+    """
+    Write a rendered email to the outbox
+    
+    Args:
+        key: Identity of the message across runs, e.g. the issue's send marker key
+        to_email: Recipient email address
+        subject: Email subject line
+        html_email: Rendered HTML
+    """
+    outbox = Outbox(config.outbox_file)
+    try:
+        result = OutboxWriter(outbox, config.from_email).send_bulk(
+            [{'to_email': to_email, 'subject': subject, 'html_content': html_email, 'key': key}]
+        )[0]
+    finally:
+        outbox.close()
+    if not result.success:
+        raise Exception(f"Could not queue the email: {result.error}")
+
+
+def load_template():
+    """Use EMAIL_TEMPLATE_FILE as the email skeleton when it is set"""
+    if config.email_template_file:
+        EmailTemplate.load_template(config.email_template_file)
+
+
+def backlog_filler(segment, backlog, session=None):
+    """Filler that tops up a segment's backlog using the configured batch sizes"""
+    return BacklogFiller(
+        lambda: make_generator(segment.interest, segment.language, session),
+        backlog,
+        concepts_per_issue=config.concepts_per_issue,
+        concepts_per_request=config.backlog_concepts_per_request,
+        duplicate_threshold=config.duplicate_threshold
+    )
+
+
+def take_from_backlog(segment, history, refills, session=None):
+    """
+    Take a segment's next prefetched issue, starting a background refill when low
+    
+    Issues leave the queue once their titles are in the segment's history,
+    so an issue that failed to send is offered again on the next run.
+    
+    Args:
+        segment: subscribers.Segment
+        history: Titles already sent to the segment
+        refills: List collecting started refill threads (join before exiting)
+        session: Optional keep-alive HTTP session owned by the caller
+        
+    Returns:
+        Concepts text of the next issue
+    """
+    backlog = IssueBacklog(config.backlog_file)
+    filler = backlog_filler(segment, backlog, session)
+    entry = backlog.peek(segment.slug, sent_titles=history)
+    if entry is None:
+        print("   Backlog empty; generating a batch now...")
+        filler.fill(segment.slug, history, config.backlog_target_issues)
+        entry = backlog.peek(segment.slug, sent_titles=history)
+        if entry is None:
+            backlog.close()
+            raise Exception("Backlog batch produced no complete issues")
+    
+    remaining = backlog.size(segment.slug) - 1
+    print(f"   Took a prefetched issue; {remaining} more in the backlog")
+    if remaining < config.backlog_low_watermark:
+        # The current issue is still queued until it has been sent, hence + 1
+        refills.append(filler.fill_in_background(segment.slug, history,
+                                                 config.backlog_target_issues + 1,
+                                                 close_when_done=True))
+    else:
+        backlog.close()
+    return entry.concepts_text
+
+
+def wait_for_refills(refills):
+    """Let background backlog refills finish before the process exits"""
+    if any(thread.is_alive() for thread in refills):
+        print("\n⏳ Waiting for the backlog refill to finish...")
+    for thread in refills:
+        thread.join()
+
+
+def choose_topics(topics, k, history, selector, index):
+    """
+    Pick the topics worth writing up before any are expanded
+    
+    Args:
+        topics: Candidate concept names
+        k: Number of topics wanted
+        history: Recent concept history
+        selector: ConceptSelector used for diversity
+        index: Near-duplicate index over the history
+        
+    Returns:
+        Up to k fresh, mutually diverse topics
+    """
+    fresh = [topic for topic in topics if not index.is_duplicate(topic)]
+    return [fresh[i] for i in selector.select(fresh, history, k=k)]
+
+
+def generate_issue(previous_concepts, history, rendered_cards, interest=None, language=None,
+                   session=None):
+    """
+    Generate, select and de-duplicate one issue's concepts
+    
+    Args:
+        previous_concepts: Recent topics included in the prompt
+        history: Recent concept history used for selection and duplicate checks
+        rendered_cards: Dict filled with card HTML when streaming
+        interest: Optional focus area of a subscriber segment
+        language: Optional content language of a subscriber segment
+        session: Optional keep-alive HTTP session owned by the caller
+        
+    Returns:
+        Final concepts text for the issue
+    """
+    ai_generator = make_generator(interest, language, session)
+    
+    selector = shared_concept_selector(f"{interest}:{language}", config.selection_diversity)
+    gate = DuplicateGate(
+        NearDuplicateIndex.from_titles(history, threshold=config.duplicate_threshold),
+        max_rounds=config.duplicate_regeneration_rounds
+    )
+    
+    with ai_generator:
+        if config.stream_generation:
+            concepts_text = generate_streaming(
+                ai_generator,
+                previous_concepts,
+                gate.index,
+                rendered_cards
+            )
+        elif config.parallel_generation:
+            concepts_text = ai_generator.generate_concepts_parallel(
+                previous_concepts,
+                count=config.concepts_per_issue,
+                candidates=config.candidate_concepts,
+                choose=lambda topics, k: choose_topics(topics, k, history, selector, gate.index),
+                concept_max_tokens=config.concept_max_tokens
+            )
+        else:
+            concepts_text = ai_generator.generate_concepts(
+                previous_concepts,
+                count=max(config.candidate_concepts, config.concepts_per_issue)
+            )
+        print(f"   Prompt size: ~{ai_generator.last_prompt_tokens} tokens "
+              f"(history ~{ai_generator.last_history.estimated_tokens} of "
+              f"~{ai_generator.last_history.raw_tokens} raw)")
+        with metrics.span('stage.select'):
+            concepts_text = selector.select_concepts(
+                concepts_text,
+                history=history,
+                k=config.concepts_per_issue
+            )
+        with metrics.span('stage.dedup'):
+            return gate.enforce(concepts_text, ai_generator, avoid=previous_concepts)
+
+
+def main(connections=None):
+    """
+    Main execution function for daily AI concepts email
+    
+    Args:
+        connections: daemon.WarmConnections to reuse instead of opening new ones
+        
+    Returns:
+        Exit code
+    """
+    session = connections.http_session if connections is not None else None
     
     print("=" * 50)
     print("AI INSIGHT DAILY - Starting Daily Email Process")
     print("=" * 50)
     
+    metrics.reset()
+    refills = []
     try:
         # Step 1: Validate configuration
         print("\n[1/6] Validating configuration...")
-        config.validate()
+        with metrics.span('stage.validate'):
+            config.validate()
+            load_template()
         print("✅ Configuration validated successfully")
         
         # Step 2: Initialize storage
         print("\n[2/6] Initializing storage...")
-        storage = ConceptStorage(config.storage_file)
-        previous_concepts = storage.get_recent_concepts(count=50)
+        with metrics.span('stage.storage'):
+            storage = ConceptStorage(config.storage_file, backend=config.storage_backend)
+            previous_concepts = storage.get_recent_concepts(count=config.prompt_history_window)
+            history = storage.get_recent_concepts(count=config.dedup_history_window)
         print(f"✅ Loaded {len(previous_concepts)} previously sent concepts")
         
-        # Step 3: Generate new AI concepts
-        print("\n[3/6] Generating 5 new AI concepts...")
-        ai_generator = AIConceptGenerator(
-            api_key=config.perplexity_api_key,
-            api_url=config.api_base_url,
-            model=config.model_name,
-            max_tokens=config.max_tokens,
-            temperature=config.temperature
-        )
+        # Resume support: stage outputs are keyed by their inputs, and the
+        # send marker is keyed by the issue date and recipient
+        checkpoints = CheckpointStore(config.checkpoint_dir)
+        today = datetime.now()
+        issue_date = today.strftime("%B %d, %Y")
+        issue_key = checkpoint_key('issue', today.strftime("%Y-%m-%d"), config.to_email, config.email_subject)
+        marker = checkpoints.sent_marker(issue_key)
         
-        concepts_text = ai_generator.generate_concepts(previous_concepts)
-        new_concepts = ai_generator.extract_concept_titles(concepts_text)
-        print(f"✅ Generated concepts: {new_concepts[:3]}..." if len(new_concepts) > 3 else f"✅ Generated concepts: {new_concepts}")
-        
-        # Step 4: Create beautiful HTML email
-        print("\n[4/6] Creating HTML email template...")
-        html_email = EmailTemplate.create_html_email(concepts_text)
-        print("✅ Email template created")
-        
-        # Step 5: Send email
-        print("\n[5/6] Sending email...")
-        email_sender = EmailSender(
-            smtp_server=config.smtp_server,
-            smtp_port=config.smtp_port,
-            from_email=config.from_email,
-            app_password=config.app_password
-        )
+        if marker and marker.get('stored'):
+            print(f"\n✅ Today's issue was already sent to {config.to_email}; nothing to do")
+            return deliver_queued(connections)
         
-        email_sender.send_html_email(
-            to_email=config.to_email,
-            subject=config.email_subject,
-            html_content=html_email
-        )
-        print(f"✅ Email sent successfully to {config.to_email}")
+        if marker:
+            print("\n[3-5/6] Today's issue was already sent; resuming at the archive and storage update")
+            new_concepts = marker.get('titles', [])
+            content_key = marker.get('content_key', '')
+            # The run may have stopped before archiving; appending the same issue again is a no-op
+            concepts_text = checkpoints.load('generate', marker['concepts_key']) if marker.get('concepts_key') else None
+            if concepts_text is not None:
+                archive_issue(today.strftime("%Y-%m-%d"), concepts_text,
+                              checkpoints.load('render', content_key, ""))
+        else:
+            # Step 3: Generate new AI concepts
+            print(f"\n[3/6] Generating {config.concepts_per_issue} new AI concepts...")
+            rendered_cards = {}
+            generate_key = checkpoint_key(
+                'generate', today.strftime("%Y-%m-%d"), config.model_name, config.temperature,
+                config.max_tokens, config.concepts_per_issue, config.candidate_concepts,
+                config.selection_diversity, config.duplicate_threshold, config.stream_generation,
+                config.parallel_generation, config.backlog_enabled, history
+            )
+            if config.backlog_enabled:
+                compute = lambda: take_from_backlog(Segment(), history, refills, session)  # noqa: E731
+            else:
+                compute = lambda: generate_issue(previous_concepts, history, rendered_cards,  # noqa: E731
+                                                 session=session)
+            with metrics.span('stage.generate') as attrs:
+                concepts_text, attrs['resumed'] = checkpoints.get_or_compute(
+                    'generate', generate_key, compute
+                )
+            if attrs['resumed']:
+                print("   Resumed from checkpoint")
+            
+            with metrics.span('stage.extract'):
+                new_concepts, _ = checkpoints.get_or_compute(
+                    'titles', checkpoint_key('titles', concepts_text),
+                    lambda: AIConceptGenerator.extract_concept_titles(concepts_text)
+                )
+            print(f"✅ Generated concepts: {new_concepts[:3]}..." if len(new_concepts) > 3 else f"✅ Generated concepts: {new_concepts}")
+            
+            # Step 4: Create beautiful HTML email
+            print("\n[4/6] Creating HTML email template...")
+            content_key = checkpoint_key('render', concepts_text, issue_date, config.recipient_name)
+            with metrics.span('stage.render'):
+                html_email, _ = checkpoints.get_or_compute(
+                    'render', content_key,
+                    lambda: EmailTemplate.create_html_email(
+                        concepts_text,
+                        date=issue_date,
+                        recipient_name=config.recipient_name,
+                        rendered_cards=rendered_cards
+                    )
+                )
+            print("✅ Email template created")
+            
+            # Step 5: Send email (or queue it, so an SMTP failure cannot lose it)
+            if config.outbox_enabled:
+                print("\n[5/6] Queueing email in the outbox...")
+                with metrics.span('stage.send', outbox=True):
+                    queue_email(issue_key, config.to_email, config.email_subject, html_email)
+                checkpoints.mark_sent(issue_key, content_key, new_concepts, concepts_key=generate_key)
+                print(f"✅ Email queued for {config.to_email}")
+            else:
+                print("\n[5/6] Sending email...")
+                with metrics.span('stage.send'), email_sender_for(connections) as email_sender:
+                    email_sender.send_html_email(
+                        to_email=config.to_email,
+                        subject=config.email_subject,
+                        html_content=html_email
+                    )
+                checkpoints.mark_sent(issue_key, content_key, new_concepts, concepts_key=generate_key)
+                print(f"✅ Email sent successfully to {config.to_email}")
+            archive_issue(today.strftime("%Y-%m-%d"), concepts_text, html_email)
         
         # Step 6: Update storage
         print("\n[6/6] Updating concept storage...")
-        storage.add_concepts(new_concepts, max_stored=config.max_stored_concepts)
-        total_concepts = len(storage.load_concepts())
+        with metrics.span('stage.update'):
+            storage.add_concepts(new_concepts, max_stored=config.max_stored_concepts)
+            checkpoints.mark_sent(issue_key, content_key, new_concepts, stored=True)
+            total_concepts = storage.count()
+            checkpoints.prune(config.checkpoint_retention_days)
         print(f"✅ Storage updated. Total concepts tracked: {total_concepts}")
         
+        if deliver_queued(connections):
+            return 1
+        
         print("\n" + "=" * 50)
         print("✅ DAILY EMAIL SENT SUCCESSFULLY!")
         print("=" * 50)
         
         return 0
         
-    except ValueError as e:
+    except ConfigError as e:
         print(f"\n❌ Configuration Error: {e}")
         return 1
     except Exception as e:
@@ -85,7 +501,273 @@ def main():
         import traceback
         traceback.print_exc()
         return 1
+    finally:
+        wait_for_refills(refills)
+        export_metrics()
+
+
+def archive_issue(date, concepts_text, html_email, segment=None):
+    """
+    Keep the full issue in the archive and the search index; failures are
+    reported, not raised
+    
+    Args:
+        date: Issue date as YYYY-MM-DD
+        concepts_text: Generated concepts text
+        html_email: Rendered HTML email
+        segment: subscribers.Segment (defaults to the default segment)
+    """
+    segment = segment or Segment()
+    try:
+        with metrics.span('stage.archive', segment=segment.slug):
+            archive = IssueArchive(config.archive_dir, max_segment_bytes=config.archive_segment_bytes)
+            archive.append(date, concepts_text, html_email, segment=segment.slug,
+                           subject=config.email_subject)
+        with metrics.span('stage.index', segment=segment.slug):
+            index = ConceptIndex(config.search_index_file)
+            try:
+                index.sync(archive)
+            finally:
+                index.close()
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"⚠️ Could not archive the issue: {e}")
+
+
+def segment_storage(segment):
+    """
+    Open the concept history of a subscriber segment
+    
+    The default segment keeps using the original storage file, so a
+    single-recipient setup moves to fan-out without losing its history.
+    
+    Args:
+        segment: subscribers.Segment
+        
+    Returns:
+        ConceptStorage for the segment
+    """
+    if segment.is_default:
+        return ConceptStorage(config.storage_file, backend=config.storage_backend)
+    extension = os.path.splitext(config.storage_file)[1] or '.json'
+    return ConceptStorage(os.path.join(config.segment_storage_dir, segment.slug + extension),
+                          backend=config.storage_backend)
+
+
+def run_fanout(now=None, connections=None):
+    """
+    Send today's issue to every due subscriber in the registry
+    
+    Without a registry file, TO_EMAIL is the only subscriber and is always due,
+    which matches the single-recipient behaviour of main().
+    
+    Args:
+        now: Timezone-aware current time (defaults to now)
+        connections: daemon.WarmConnections to reuse instead of opening new ones
+        
+    Returns:
+        Exit code (0 when every due message was delivered)
+    """
+    from ratelimit import RateLimiter
+    from scheduler import FanOutScheduler
+    from subscribers import Subscriber, SubscriberRegistry
+    
+    print("=" * 50)
+    print("AI INSIGHT DAILY - Starting Subscriber Fan-Out")
+    print("=" * 50)
+    
+    metrics.reset()
+    refills = []
+    session = connections.http_session if connections is not None else None
+    try:
+        config.validate()
+        load_template()
+        registry = SubscriberRegistry(config.subscribers_file)
+        if registry.exists():
+            subscribers = registry.active()
+        else:
+            subscribers = [Subscriber(config.to_email, config.recipient_name, send_hour=0)]
+        print(f"\n👥 {len(subscribers)} active subscribers in {len(registry.by_segment(subscribers))} segments")
+        
+        def generate(segment, local_date):
+            print(f"\n🧠 Generating the {segment.slug} issue for {local_date}...")
+            storage = segment_storage(segment)
+            try:
+                if config.backlog_enabled:
+                    return take_from_backlog(segment, storage.get_recent_concepts(count=config.dedup_history_window), refills, session)
+                return generate_issue(
+                    storage.get_recent_concepts(count=config.prompt_history_window),
+                    storage.get_recent_concepts(count=config.dedup_history_window),
+                    {},
+                    interest=segment.interest,
+                    language=segment.language,
+                    session=session
+                )
+            finally:
+                storage.close()
+        
+        def record(segment, titles):
+            storage = segment_storage(segment)
+            try:
+                storage.add_concepts(titles, max_stored=config.max_stored_concepts)
+            finally:
+                storage.close()
+        
+        limiter = RateLimiter(
+            config.send_rate_per_second,
+            config.provider_rate_limits,
+            default_provider_rate=config.default_provider_rate
+        )
+        # With the outbox, a message counts as sent once it is queued
+        outbox = Outbox(config.outbox_file) if config.outbox_enabled else None
+        with email_sender_for(connections) as email_sender:
+            scheduler = FanOutScheduler(
+                generate, record,
+                OutboxWriter(outbox, config.from_email) if outbox is not None else email_sender,
+                CheckpointStore(config.checkpoint_dir),
+                subject=config.email_subject,
+                rate_limiter=limiter,
+                api_state=api_guard().state,
+                max_api_pause=config.api_max_pause,
+                # Rendered HTML is per recipient, so fan-out archives the concepts text
+                archive=lambda segment, local_date, text: archive_issue(local_date, text, "", segment)
+            )
+            try:
+                report = scheduler.run(subscribers, now)
+            finally:
+                if outbox is not None:
+                    outbox.close()
+        
+        for window in report.windows:
+            print(f"   {window.segment.slug} {window.local_date} {window.timezone} "
+                  f"{window.send_hour:02d}:00 → {len(window.subscribers)} recipients")
+        for window, reason in report.deferred:
+            print(f"   ⏸️ Deferred {window.segment.slug} ({len(window.subscribers)} recipients): {reason}")
+        for result in report.failed:
+            print(f"   ❌ {result.to_email}: {result.error}")
+        print(f"\n✅ {'Queued' if outbox is not None else 'Sent'} {report.sent} of {len(report.results)} "
+              f"due emails from {len(report.issues)} generated issues")
+        delivery_code = deliver_queued(connections, limiter)
+        return 1 if report.failed or report.deferred or delivery_code else 0
+        
+    except ConfigError as e:
+        print(f"\n❌ Configuration Error: {e}")
+        return 1
+    except Exception as e:
+        print(f"\n❌ Error occurred: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return 1
+    finally:
+        wait_for_refills(refills)
+        export_metrics()
+
+
+def run_daemon():
+    """
+    Run as a long-lived process that sends on DAEMON_SCHEDULE
+    
+    Modules, configuration, the email template and the HTTP and SMTP
+    connections are set up once, so a scheduled run starts without a cold
+    start. DAEMON_ENV_FILE and EMAIL_TEMPLATE_FILE are re-read when they
+    change or on SIGHUP; SIGTERM stops the daemon after the current run.
+    
+    Returns:
+        Exit code (1 if the configuration is invalid at startup)
+    """
+    from datetime import timedelta
+    from daemon import CronSchedule, Daemon, EnvFile, WarmConnections
+    
+    print("=" * 50)
+    print("AI INSIGHT DAILY - Starting Daemon")
+    print("=" * 50)
+    
+    env_file = EnvFile(config.daemon_env_file)
+    connections = WarmConnections(
+        lambda: AIConceptGenerator.new_session(config.perplexity_api_key, config.api_max_concurrency),
+        make_email_sender
+    )
+    
+    def reload():
+        env_file.apply()
+        config.reload()
+        load_template()
+        connections.reset()
+        return CronSchedule(config.daemon_schedule, config.daemon_timezone)
+    
+    def job():
+        pipeline = run_fanout if config.daemon_pipeline == 'fanout' else main
+        return pipeline(connections=connections)
+    
+    try:
+        schedule = reload()
+    except (ValueError, OSError) as e:
+        print(f"\n❌ Configuration Error: {e}")
+        return 1
+    EmailTemplate.compiled()
+    
+    service = Daemon(
+        job, schedule, config.daemon_health_file,
+        jitter=config.daemon_jitter_seconds,
+        catchup=timedelta(hours=config.daemon_catchup_hours),
+        warmup=config.daemon_warmup_seconds,
+        warm=lambda: connections.warm(config.api_base_url),
+        reload=reload,
+        watched_files=lambda: [path for path in (env_file.path, config.email_template_file) if path]
+    )
+    service.install_signal_handlers()
+    print(f"✅ Running {config.daemon_pipeline} on '{schedule.expression}' ({config.daemon_timezone}); "
+          f"health in {config.daemon_health_file}")
+    try:
+        service.run_forever()
+    finally:
+        connections.close()
+    print("👋 Daemon stopped")
+    return 0
+
+
+def run_profiled(pipeline, **kwargs):
+    """
+    Run a pipeline under the stage profiler
+    
+    Every metrics span becomes a profiled stage: CPU samples are written as
+    collapsed stacks for flame graphs, and the pipeline stages get a top-N
+    allocation report, in PROFILE_DIR/<run id>/.
+    
+    Args:
+        pipeline: main or run_fanout
+        **kwargs: Arguments for the pipeline
+        
+    Returns:
+        The pipeline's exit code
+    """
+    from profiling import StageProfiler
+    
+    profiler = StageProfiler(interval=config.profile_interval, top=config.profile_top_allocations)
+    with profiler:
+        exit_code = pipeline(**kwargs)
+    directory = os.path.join(config.profile_dir, metrics.run_id)
+    try:
+        profiler.write(directory)
+    except OSError as e:
+        print(f"⚠️ Could not write the profile: {e}")
+        return exit_code
+    print(f"\n🔬 Profile written to {directory}")
+    for name, stage in list(profiler.summary().items())[:12]:
+        allocated = f", {stage['net_kib']:+.1f} KiB" if stage['net_kib'] is not None else ""
+        print(f"   {name:<20} {stage['wall_ms']:>10.1f} ms, {stage['samples']} samples{allocated}")
+    return exit_code
+
+
+def export_metrics():
+    """Write this run's metrics; failures here never fail the run"""
+    try:
+        metrics.write_jsonl(config.metrics_jsonl_file)
+        metrics.write_prometheus(config.metrics_prometheus_file)
+    except OSError as e:
+        print(f"⚠️ Could not write metrics: {e}")
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    if '--daemon' in sys.argv[1:]:
+        sys.exit(run_daemon())
+    sys.exit(run_profiled(main) if '--profile' in sys.argv[1:] else main())
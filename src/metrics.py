@@ -0,0 +1,243 @@
+"""
+Metrics module for lightweight pipeline instrumentation.
+Records timed spans, counters and token usage, and exports them as
+JSON lines and Prometheus text format.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+PROMETHEUS_PREFIX = "ai_insight_daily"
+
+
+class Metrics:
+    """In-process recorder for spans and counters of one run"""
+
+    def __init__(self):
+        """Initialize an empty recorder"""
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Optional profiling.StageProfiler told about every span; None costs one check per span
+        self.profiler = None
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far and start a new run id"""
+        with self._lock:
+            self.run_id = uuid.uuid4().hex[:12]
+            self.records: List[dict] = []
+            self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def _stack(self) -> List[str]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        Time a block of code
+
+        Args:
+            name: Span name, e.g. 'stage.generate' or 'smtp.login'
+            **attrs: Extra attributes stored with the span
+
+        Yields:
+            Mutable attribute dict, so callers can add results (e.g. status codes)
+        """
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.enter(name)
+        started_at = time.time()
+        start = time.perf_counter()
+        status = 'ok'
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            status = 'error'
+            error = f"{type(e).__name__}: {e}"[:300]
+            raise
+        finally:
+            stack.pop()
+            if profiler is not None:
+                profiler.exit(name)
+            self.record_span(name, time.perf_counter() - start, status=status, error=error,
+                             parent=parent, started_at=started_at, **attrs)
+
+    def record_span(self, name: str, duration: float, status: str = 'ok',
+                    error: Optional[str] = None, parent: Optional[str] = None,
+                    started_at: Optional[float] = None, **attrs):
+        """
+        Record a span timed by the caller (e.g. across generator yields)
+
+        Args:
+            name: Span name
+            duration: Duration in seconds
+            status: 'ok' or 'error'
+            error: Error description for failed spans
+            parent: Name of the enclosing span
+            started_at: Unix start time (defaults to now minus duration)
+            **attrs: Extra attributes stored with the span
+        """
+        record = {
+            'type': 'span',
+            'run_id': self.run_id,
+            'name': name,
+            'parent': parent,
+            'start': round(started_at if started_at is not None else time.time() - duration, 6),
+            'duration_ms': round(duration * 1000, 3),
+            'status': status,
+        }
+        if error:
+            record['error'] = error
+        if attrs:
+            record['attrs'] = attrs
+        with self._lock:
+            self.records.append(record)
+
+    def incr(self, name: str, value: float = 1, **labels):
+        """
+        Add to a counter
+
+        Args:
+            name: Counter name
+            value: Amount to add
+            **labels: Label values distinguishing series
+        """
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_usage(self, usage: Optional[dict], model: str = ""):
+        """
+        Record the token usage block of a completion response
+
+        Args:
+            usage: The response's 'usage' dict (ignored when missing)
+            model: Model name used as a label
+        """
+        if not usage:
+            return
+        for kind in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+            value = usage.get(kind)
+            if isinstance(value, (int, float)):
+                self.incr('tokens', value, kind=kind.replace('_tokens', ''), model=model)
+        with self._lock:
+            self.records.append({
+                'type': 'usage',
+                'run_id': self.run_id,
+                'time': round(time.time(), 6),
+                'model': model,
+                'usage': usage,
+            })
+
+    def spans(self, name: Optional[str] = None) -> List[dict]:
+        """
+        Recorded spans, optionally filtered by name
+
+        Args:
+            name: Only return spans with this name
+
+        Returns:
+            List of span records
+        """
+        with self._lock:
+            return [r for r in self.records
+                    if r['type'] == 'span' and (name is None or r['name'] == name)]
+
+    def write_jsonl(self, path: str):
+        """
+        Append this run's records and counters to a JSON-lines file
+
+        Args:
+            path: Destination file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            lines = [json.dumps(record, ensure_ascii=False) for record in self.records]
+            lines.extend(
+                json.dumps({'type': 'counter', 'run_id': self.run_id, 'name': name,
+                            'labels': dict(labels), 'value': value})
+                for (name, labels), value in sorted(self.counters.items())
+            )
+        with open(path, 'a', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line + '\n')
+
+    def to_prometheus(self) -> str:
+        """
+        Render this run in Prometheus text exposition format
+
+        Returns:
+            Exposition text for a node_exporter textfile collector
+        """
+        def label_text(labels) -> str:
+            if not labels:
+                return ""
+            escaped = (
+                '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                for k, v in labels
+            )
+            return "{" + ",".join(escaped) + "}"
+
+        totals: Dict[Tuple[str, str], List[float]] = {}
+        for record in self.spans():
+            key = (record['name'], record['status'])
+            entry = totals.setdefault(key, [0.0, 0])
+            entry[0] += record['duration_ms'] / 1000
+            entry[1] += 1
+
+        span_metric = f"{PROMETHEUS_PREFIX}_span_duration_seconds"
+        lines = [
+            f"# HELP {span_metric} Time spent in each pipeline span during the last run.",
+            f"# TYPE {span_metric} summary",
+        ]
+        for (name, status), (seconds, count) in sorted(totals.items()):
+            labels = label_text([('span', name), ('status', status)])
+            lines.append(f"{span_metric}_sum{labels} {seconds:.6f}")
+            lines.append(f"{span_metric}_count{labels} {count}")
+
+        grouped: Dict[str, List[Tuple[tuple, float]]] = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            grouped.setdefault(name, []).append((labels, value))
+        for name, series in grouped.items():
+            metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f"{metric}{label_text(labels)} {value:g}" for labels, value in series)
+
+        run_metric = f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds"
+        lines.append(f"# TYPE {run_metric} gauge")
+        lines.append(f"{run_metric} {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """
+        Write the Prometheus exposition atomically
+
+        Args:
+            path: Destination file (e.g. a textfile collector .prom file)
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+# Create a global metrics instance
+metrics = Metrics()
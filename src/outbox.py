@@ -0,0 +1,489 @@
+"""
+Outbox module for durable, retryable email delivery.
+Rendered messages are written to a local SQLite queue before any SMTP work,
+and a delivery worker drains it with its own concurrency and retry state.
+"""
+
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from .email_sender import PreparedBody, SendResult
+    from .metrics import metrics
+    from .ratelimit import backoff_delay
+except ImportError:
+    from email_sender import PreparedBody, SendResult
+    from metrics import metrics
+    from ratelimit import backoff_delay
+
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+DEAD = 'dead'
+
+
+@dataclass
+class OutboxEntry:
+    """One queued message, as claimed by a delivery worker"""
+
+    id: int
+    key: str
+    from_email: str
+    to_email: str
+    data: bytes
+    attempts: int = 0
+    last_error: Optional[str] = None
+
+
+@dataclass
+class DeliveryReport:
+    """Outcome of draining the outbox"""
+
+    sent: int = 0
+    deferred: List[Tuple[str, str]] = field(default_factory=list)
+    dead: List[Tuple[str, str]] = field(default_factory=list)
+    released: int = 0
+    server_error: Optional[str] = None
+
+    @property
+    def attempted(self) -> int:
+        return self.sent + len(self.deferred) + len(self.dead)
+
+
+class Outbox:
+    """Durable queue of ready-to-send messages, stored in SQLite
+
+    Messages move from pending to sending (leased by one worker) to sent or
+    dead. A lease that is not settled in time, e.g. because the worker
+    crashed, expires and the message is delivered again, so delivery is
+    at least once.
+    """
+
+    def __init__(self, db_file: str, compression_level: int = 6):
+        """
+        Initialize outbox
+
+        Args:
+            db_file: Path to the SQLite database
+            compression_level: zlib level for stored messages
+        """
+        self.db_file = db_file
+        self.compression_level = compression_level
+        directory = os.path.dirname(db_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_key TEXT NOT NULL UNIQUE,
+                from_email TEXT NOT NULL,
+                to_email TEXT NOT NULL,
+                data BLOB,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_due ON messages(state, next_attempt_at);
+        """)
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], object]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, messages: Iterable[Tuple[str, str, str, bytes]]) -> int:
+        """
+        Store messages for delivery
+
+        Args:
+            messages: (key, from_email, to_email, message bytes) tuples; the key
+                makes enqueueing idempotent, e.g. the recipient's issue key
+
+        Returns:
+            Number of messages added (a key already in the outbox is skipped)
+        """
+        now = time.time()
+        rows = [(key, from_email, to_email, zlib.compress(data, self.compression_level),
+                 PENDING, now, now, now)
+                for key, from_email, to_email, data in messages]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO messages (message_key, from_email, to_email, data, state, "
+                "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return conn.total_changes - before
+
+        with metrics.span('outbox.enqueue', messages=len(rows)) as attrs:
+            attrs['added'] = self._transaction(insert)
+        return attrs['added']
+
+    def claim(self, limit: int, lease: float = 300.0, now: Optional[float] = None) -> List[OutboxEntry]:
+        """
+        Lease due messages for delivery
+
+        Args:
+            limit: Maximum number of messages
+            lease: Seconds before an unsettled message may be claimed again
+            now: Current time (defaults to now)
+
+        Returns:
+            Claimed messages, oldest first
+        """
+        now = time.time() if now is None else now
+
+        def lease_due(conn):
+            rows = conn.execute(
+                "SELECT id, message_key, from_email, to_email, data, attempts, last_error FROM messages "
+                "WHERE state IN (?, ?) AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?",
+                (PENDING, SENDING, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE messages SET state = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                [(SENDING, now + lease, now, row[0]) for row in rows]
+            )
+            return rows
+
+        return [OutboxEntry(row[0], row[1], row[2], row[3], zlib.decompress(row[4]), row[5], row[6])
+                for row in self._transaction(lease_due)]
+
+    def _settle(self, entry_id: int, state: str, next_attempt_at: float, error: Optional[str],
+                keep_data: bool):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE messages SET state = ?, attempts = attempts + 1, next_attempt_at = ?, "
+                "last_error = ?, updated_at = ?" + ("" if keep_data else ", data = NULL") + " WHERE id = ?",
+                (state, next_attempt_at, error, now, entry_id)
+            )
+
+    def mark_sent(self, entry_id: int):
+        """Record a delivery; the message body is dropped, the key is kept"""
+        self._settle(entry_id, SENT, 0.0, None, keep_data=False)
+
+    def defer(self, entry_id: int, error: str, delay: float):
+        """Return a message to the queue for another attempt after delay seconds"""
+        self._settle(entry_id, PENDING, time.time() + delay, error, keep_data=True)
+
+    def dead_letter(self, entry_id: int, error: str):
+        """Give up on a message; it stays in the outbox for inspection and retry_dead()"""
+        self._settle(entry_id, DEAD, 0.0, error, keep_data=True)
+
+    def release(self, entry_ids: Sequence[int], error: str, delay: float):
+        """
+        Return claimed messages to the queue without counting an attempt
+
+        Used when the server failed rather than the messages, e.g. on a
+        login or connection error.
+
+        Args:
+            entry_ids: Claimed messages
+            error: Server error, kept as each message's last error
+            delay: Seconds before the messages may be claimed again
+        """
+        now = time.time()
+        rows = [(PENDING, now + delay, error, now, entry_id) for entry_id in entry_ids]
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE messages SET state = ?, next_attempt_at = ?, last_error = ?, updated_at = ? "
+            "WHERE id = ?",
+            rows
+        ))
+
+    def retry_dead(self) -> int:
+        """
+        Queue every dead letter again, e.g. after fixing an address or the configuration
+
+        Returns:
+            Number of requeued messages
+        """
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE messages SET state = ?, attempts = 0, next_attempt_at = ?, updated_at = ? "
+                "WHERE state = ?",
+                (PENDING, now, now, DEAD)
+            ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Number of messages per state"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM messages GROUP BY state").fetchall()
+        return dict.fromkeys((PENDING, SENDING, SENT, DEAD), 0) | dict(rows)
+
+    def dead_letters(self, limit: int = 50) -> List[Tuple[str, int, str]]:
+        """Recipient, attempts and last error of the newest dead letters"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT to_email, attempts, last_error FROM messages WHERE state = ? "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (DEAD, limit)
+            ).fetchall()
+
+    def next_due(self) -> Optional[float]:
+        """Time the next pending or leased message becomes claimable (None when idle)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM messages WHERE state IN (?, ?)",
+                (PENDING, SENDING)
+            ).fetchone()[0]
+
+    def prune(self, max_age_days: float) -> int:
+        """
+        Delete delivered messages older than max_age_days
+
+        Args:
+            max_age_days: Age limit in days
+
+        Returns:
+            Number of deleted messages
+        """
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM messages WHERE state = ? AND updated_at < ?",
+                (SENT, time.time() - max_age_days * 86400)
+            ).rowcount
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+class OutboxWriter:
+    """Drop-in for EmailSender.send_bulk that queues messages instead of sending them
+
+    A message counts as successful once it is durably queued, so callers
+    such as the fan-out scheduler record it as sent and move on; delivery
+    happens when a DeliveryWorker drains the outbox.
+    """
+
+    def __init__(self, outbox: Outbox, from_email: str):
+        """
+        Initialize writer
+
+        Args:
+            outbox: Queue to write to
+            from_email: Sender email address
+        """
+        self.outbox = outbox
+        self.from_email = from_email
+
+    def send_bulk(self, messages: Iterable[dict], max_workers: Optional[int] = None,
+                  rate_limiter=None) -> List[SendResult]:
+        """
+        Queue many HTML emails (same message dicts as EmailSender.send_bulk)
+
+        Each dict may carry a 'key' identifying the message across runs;
+        otherwise the recipient and subject are used. Rate limits apply at
+        delivery, so max_workers and rate_limiter are ignored here.
+
+        Returns:
+            One SendResult per message, in input order
+        """
+        messages = list(messages)
+        bodies: Dict[str, PreparedBody] = {}
+        rows, results = [], []
+        with metrics.span('send.build', messages=len(messages)):
+            for message in messages:
+                to_email = message['to_email']
+                body = message.get('body')
+                if body is None:
+                    if message['html_content'] not in bodies:
+                        bodies[message['html_content']] = PreparedBody.from_html(message['html_content'])
+                    body = bodies[message['html_content']]
+                try:
+                    data = body.message_bytes(self.from_email, to_email, message['subject'],
+                                              **message.get('values', {}))
+                except (KeyError, ValueError) as e:
+                    results.append(SendResult(to_email, False, str(e)))
+                    continue
+                rows.append((message.get('key') or f"{to_email}\n{message['subject']}",
+                             self.from_email, to_email, data))
+                results.append(SendResult(to_email, True))
+        self.outbox.enqueue(rows)
+        return results
+
+
+def smtp_status(error: Exception) -> Optional[int]:
+    """
+    SMTP reply code of a failed send
+
+    Args:
+        error: Exception raised by smtplib or the socket
+
+    Returns:
+        The reply code, or None for network errors
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused) and error.recipients:
+        return min(code for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code
+    return None
+
+
+class DeliveryWorker:
+    """Drains an outbox through an EmailSender's connection pool
+
+    SMTP 4xx replies and network errors defer a message with exponential
+    backoff; 5xx replies dead-letter it at once, as does running out of
+    attempts. Failures that concern the server rather than the message
+    (login, connection) end the drain at once: the claimed messages that
+    were not delivered go back to the queue without using up an attempt.
+    """
+
+    def __init__(self, outbox: Outbox, sender, max_workers: Optional[int] = None,
+                 batch_size: int = 50, max_attempts: int = 8, retry_delay: float = 60.0,
+                 max_retry_delay: float = 3600.0, lease: float = 300.0, rate_limiter=None):
+        """
+        Initialize worker
+
+        Args:
+            outbox: Queue to drain
+            sender: EmailSender whose pool delivers the messages
+            max_workers: Sending threads (defaults to the sender's pool size)
+            batch_size: Messages claimed at once
+            max_attempts: Attempts before a message is dead-lettered
+            retry_delay: Deferral after the first temporary failure in seconds
+            max_retry_delay: Cap on the exponential deferral in seconds
+            lease: Seconds a claimed message is reserved for this worker
+            rate_limiter: Optional object whose acquire(to_email) blocks until
+                a message may be sent, e.g. a ratelimit.RateLimiter
+        """
+        self.outbox = outbox
+        self.sender = sender
+        self.max_workers = max(1, max_workers or sender.pool_size)
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max(retry_delay, max_retry_delay)
+        self.lease = lease
+        self.rate_limiter = rate_limiter
+
+    def _deliver(self, entry: OutboxEntry,
+                 server_down: threading.Event) -> Tuple[bool, Optional[str], Optional[int], bool]:
+        """
+        Send one message; returns (sent, error, SMTP code, server-level failure)
+
+        Once server_down is set, remaining messages are not attempted and
+        come back as server-level failures without an error.
+        """
+        if server_down.is_set():
+            return False, None, None, True
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(entry.to_email)
+        try:
+            refused = self.sender.pool.sendmail(entry.from_email, entry.to_email, entry.data)
+        except (smtplib.SMTPAuthenticationError, smtplib.SMTPConnectError,
+                smtplib.SMTPServerDisconnected) as e:
+            server_down.set()
+            return False, str(e) or type(e).__name__, None, True
+        except smtplib.SMTPException as e:
+            return False, str(e), smtp_status(e), False
+        except OSError as e:
+            server_down.set()
+            return False, str(e) or type(e).__name__, None, True
+        if refused:
+            return False, f"Recipient refused: {refused}", min(code for code, _ in refused.values()), False
+        return True, None, None, False
+
+    def _settle(self, entry: OutboxEntry, outcome, report: DeliveryReport) -> bool:
+        """Record one outcome; returns whether the server itself failed"""
+        sent, error, code, server_failure = outcome
+        if server_failure:
+            # Settled together by drain(): the message is not at fault
+            report.server_error = report.server_error or error
+            return True
+        if sent:
+            self.outbox.mark_sent(entry.id)
+            report.sent += 1
+            result = 'sent'
+        elif code is not None and 500 <= code < 600:
+            self.outbox.dead_letter(entry.id, error)
+            report.dead.append((entry.to_email, error))
+            result = 'dead'
+        elif entry.attempts + 1 >= self.max_attempts:
+            self.outbox.dead_letter(entry.id, f"Gave up after {entry.attempts + 1} attempts: {error}")
+            report.dead.append((entry.to_email, error))
+            result = 'dead'
+        else:
+            self.outbox.defer(entry.id, error,
+                              backoff_delay(entry.attempts + 1, self.retry_delay, self.max_retry_delay))
+            report.deferred.append((entry.to_email, error))
+            result = 'deferred'
+        metrics.incr('outbox_deliveries', result=result)
+        return False
+
+    def drain(self, max_messages: Optional[int] = None) -> DeliveryReport:
+        """
+        Deliver every message that is due now
+
+        Args:
+            max_messages: Optional cap on messages attempted
+
+        Returns:
+            DeliveryReport of this drain
+        """
+        report = DeliveryReport()
+        with metrics.span('outbox.drain') as attrs, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while max_messages is None or report.attempted < max_messages:
+                limit = self.batch_size if max_messages is None else min(
+                    self.batch_size, max_messages - report.attempted)
+                batch = self.outbox.claim(limit, self.lease)
+                if not batch:
+                    break
+                server_down = threading.Event()
+                outcomes = list(executor.map(lambda entry: self._deliver(entry, server_down), batch))
+                released = [entry.id for entry, outcome in zip(batch, outcomes)
+                            if self._settle(entry, outcome, report)]
+                if released:
+                    self.outbox.release(released, report.server_error, self.retry_delay)
+                    report.released += len(released)
+                    metrics.incr('outbox_deliveries', len(released), result='released')
+                    break
+            attrs.update(sent=report.sent, deferred=len(report.deferred), dead=len(report.dead),
+                         released=report.released)
+        return report
+
+    def run_forever(self, stop: threading.Event, poll_interval: float = 30.0,
+                    on_report: Optional[Callable[[DeliveryReport], None]] = None):
+        """
+        Keep draining until stop is set, sleeping until the next message is due
+
+        Args:
+            stop: Event that ends the loop
+            poll_interval: Longest sleep between checks, so messages queued by
+                another process are picked up
+            on_report: Optional callback for each drain that attempted messages
+        """
+        while not stop.is_set():
+            report = self.drain()
+            if (report.attempted or report.released) and on_report is not None:
+                on_report(report)
+            next_due = self.outbox.next_due()
+            wait = poll_interval if next_due is None else min(poll_interval, next_due - time.time())
+            stop.wait(max(0.05, wait))
@@ -0,0 +1,235 @@
+"""
+Profiling module for per-stage CPU and allocation profiles of a run.
+A sampling profiler attributes every thread's stack to the metrics span it
+is in, and tracemalloc diffs each pipeline stage's allocations. Nothing here
+is imported or running unless profiling is switched on.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .metrics import Metrics, metrics as default_metrics
+except ImportError:
+    from metrics import Metrics, metrics as default_metrics
+
+
+# Spans whose allocations are measured (besides every 'stage.*' and 'fanout.*' span)
+ALLOCATION_SPANS = frozenset({'generate.prompt', 'http.request', 'render.format', 'send.build'})
+
+_UNSAFE_FILENAME_RE = re.compile(r"[^\w.-]+")
+
+
+def _frame_label(code) -> str:
+    """Flame graph frame name: function plus file and first line"""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StageProfiler:
+    """Sampling CPU profiler and tracemalloc, both broken down by metrics span
+
+    While attached, Metrics.span() reports every span entry and exit here.
+    Each CPU sample is attributed to the innermost span open on the sampled
+    thread; threads outside any span are not sampled. Allocation diffs are
+    process-wide, so spans running concurrently share each other's
+    allocations.
+    """
+
+    def __init__(self, interval: float = 0.005, top: int = 10, memory: bool = True,
+                 traceback_limit: int = 1, recorder: Optional[Metrics] = None):
+        """
+        Initialize profiler
+
+        Args:
+            interval: Seconds between stack samples
+            top: Allocation sites reported per stage
+            memory: Also trace allocations (slower; off for CPU-only profiles)
+            traceback_limit: Frames tracemalloc keeps per allocation
+            recorder: Metrics instance whose spans mark the stages (defaults to the global one)
+        """
+        self.interval = interval
+        self.top = top
+        self.memory = memory
+        self.traceback_limit = traceback_limit
+        self.recorder = recorder or default_metrics
+        self.stacks: Dict[str, Counter] = defaultdict(Counter)
+        self.samples: Counter = Counter()
+        self.wall: Counter = Counter()
+        self.allocations: Dict[str, Counter] = defaultdict(Counter)
+        self.net_bytes: Counter = Counter()
+        self.peak_bytes: Dict[str, int] = {}
+        self._active: Dict[int, List[Tuple[str, float, Optional[tracemalloc.Snapshot], bool]]] = {}
+        self._measuring = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_tracemalloc = False
+
+    def start(self) -> 'StageProfiler':
+        """Attach to the metrics recorder and start sampling"""
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(self.traceback_limit)
+            self._started_tracemalloc = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name='stage-profiler', daemon=True)
+        self._thread.start()
+        self.recorder.profiler = self
+        return self
+
+    def stop(self):
+        """Detach and stop sampling"""
+        self.recorder.profiler = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @staticmethod
+    def _measures_allocations(name: str) -> bool:
+        return name.startswith(('stage.', 'fanout.')) or name in ALLOCATION_SPANS
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def enter(self, name: str):
+        """Called by Metrics.span() when a span opens on the current thread"""
+        snapshot, outermost = None, False
+        if self.memory and tracemalloc.is_tracing() and self._measures_allocations(name):
+            with self._lock:
+                outermost = self._measuring == 0
+                self._measuring += 1
+            if outermost:
+                # Peaks are only meaningful for stages that do not overlap another
+                tracemalloc.reset_peak()
+            snapshot = self._snapshot()
+        with self._lock:
+            self._active.setdefault(threading.get_ident(), []).append(
+                (name, time.perf_counter(), snapshot, outermost))
+
+    def exit(self, name: str):
+        """Called by Metrics.span() when a span closes on the current thread"""
+        ident = threading.get_ident()
+        with self._lock:
+            stack = self._active.get(ident)
+            if not stack:
+                return
+            _, started, before, outermost = stack.pop()
+            if not stack:
+                del self._active[ident]
+            self.wall[name] += time.perf_counter() - started
+            if before is not None:
+                self._measuring -= 1
+        if before is None or not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        diff = self._snapshot().compare_to(before, 'traceback')
+        with self._lock:
+            if outermost:
+                self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+            for stat in diff:
+                if stat.size_diff:
+                    frame = stat.traceback[-1]
+                    self.allocations[name][f"{frame.filename}:{frame.lineno}"] += stat.size_diff
+                    self.net_bytes[name] += stat.size_diff
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                active = {ident: [entry[0] for entry in stack] for ident, stack in self._active.items()}
+            for ident, spans in active.items():
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    if frame.f_code.co_filename == __file__:
+                        # The thread is taking a snapshot for us: profiler overhead, not the stage
+                        break
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if frame is not None:
+                    continue
+                stack = ';'.join(spans + labels[::-1])
+                with self._lock:
+                    self.stacks[spans[-1]][stack] += 1
+                    self.samples[spans[-1]] += 1
+
+    def allocation_report(self) -> str:
+        """Top allocation sites per stage, as text"""
+        lines = []
+        for name in sorted(self.net_bytes, key=lambda n: -self.net_bytes[n]):
+            peak = f", peak {self.peak_bytes[name] / 1024:.1f} KiB traced" if name in self.peak_bytes else ""
+            lines.append(f"== {name}: net {self.net_bytes[name] / 1024:+.1f} KiB{peak}")
+            top = sorted(self.allocations[name].items(), key=lambda item: -abs(item[1]))[:self.top]
+            for site, size in top:
+                lines.append(f"   {size / 1024:+10.1f} KiB  {site}")
+            lines.append("")
+        return "\n".join(lines)
+
+    def summary(self) -> Dict[str, dict]:
+        """Wall time, CPU samples and net allocations per span name"""
+        names = set(self.wall) | set(self.samples) | set(self.net_bytes)
+        return {
+            name: {
+                'wall_ms': round(self.wall[name] * 1000, 3),
+                'samples': self.samples[name],
+                'net_kib': round(self.net_bytes[name] / 1024, 1) if name in self.net_bytes else None,
+            }
+            for name in sorted(names, key=lambda n: -self.wall[n])
+        }
+
+    def write(self, directory: str) -> List[str]:
+        """
+        Write the profiles
+
+        Produces one collapsed-stack file per span (flamegraph.pl, speedscope
+        or inferno read them), all.collapsed with the span path as the root
+        frames, allocations.txt and summary.json.
+
+        Args:
+            directory: Output directory, created if needed
+
+        Returns:
+            Paths of the written files
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+
+        def write_file(name: str, text: str):
+            path = os.path.join(directory, name)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            paths.append(path)
+
+        combined = Counter()
+        for name, stacks in sorted(self.stacks.items()):
+            combined.update(stacks)
+            write_file(f"{_UNSAFE_FILENAME_RE.sub('_', name)}.collapsed",
+                       "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+        write_file("all.collapsed", "".join(f"{stack} {count}\n" for stack, count in combined.most_common()))
+        if self.memory:
+            write_file("allocations.txt", self.allocation_report())
+        write_file("summary.json", json.dumps({'interval': self.interval, 'stages': self.summary()}, indent=2))
+        return paths
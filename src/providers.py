@@ -0,0 +1,321 @@
+"""
+Provider routing module for OpenAI-compatible chat-completions endpoints.
+Tracks a live EWMA of latency and error rate per provider, ranks providers
+by it and hedges slow requests with a backup provider.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+T = TypeVar('T')
+
+
+@dataclass(frozen=True)
+class Provider:
+    """One OpenAI-compatible chat-completions endpoint"""
+
+    name: str
+    api_url: str
+    model: str
+    api_key: str = ""
+
+
+def parse_providers(text: Optional[str]) -> List[Provider]:
+    """
+    Parse 'name=url|model|KEY_VARIABLE' entries, e.g.
+    "openai=https://api.openai.com/v1/chat/completions|gpt-4o-mini|OPENAI_API_KEY"
+
+    Args:
+        text: Comma-separated entries in priority order (empty or None for none);
+            the API key is read from the named environment variable
+
+    Returns:
+        Providers in the given order
+
+    Raises:
+        ValueError: If an entry has no URL or model
+    """
+    providers = []
+    for entry in (text or '').split(','):
+        name, _, spec = entry.partition('=')
+        if not name.strip():
+            continue
+        parts = [part.strip() for part in spec.split('|')]
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            raise ValueError(f"Provider {name.strip()!r} needs 'url|model[|KEY_VARIABLE]'")
+        key_variable = parts[2] if len(parts) > 2 else ''
+        providers.append(Provider(name.strip().lower(), parts[0], parts[1],
+                                  os.getenv(key_variable, '') if key_variable else ''))
+    return providers
+
+
+class ProviderStats:
+    """Exponentially weighted latency and error rate of one provider"""
+
+    def __init__(self, alpha: float = 0.2, window: int = 100):
+        """
+        Initialize statistics
+
+        Args:
+            alpha: Weight of the newest observation in the moving averages
+            window: Recent latencies kept for quantiles, overall and per request class
+        """
+        self.alpha = alpha
+        self.window = window
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+        self._by_class: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record_success(self, seconds: Optional[float] = None, request_class: Hashable = None):
+        """
+        Count a successful request, with its latency when comparable to others
+
+        Args:
+            seconds: Latency of the request (None if not comparable, e.g. a stream)
+            request_class: Kind of request, e.g. its max_tokens; quantiles are
+                also kept per class so short and long requests are not mixed
+        """
+        with self._lock:
+            self.error_rate *= 1 - self.alpha
+            if seconds is None:
+                return
+            self._recent.append(seconds)
+            if request_class is not None:
+                self._by_class.setdefault(request_class, deque(maxlen=self.window)).append(seconds)
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += self.alpha * (seconds - self.latency)
+
+    def record_failure(self):
+        """Count a failed request"""
+        with self._lock:
+            self.error_rate += self.alpha * (1 - self.error_rate)
+
+    @property
+    def samples(self) -> int:
+        return len(self._recent)
+
+    def class_samples(self, request_class: Hashable = None) -> int:
+        """Latencies in the recent window of a request class (of all requests for None)"""
+        with self._lock:
+            recent = self._recent if request_class is None else self._by_class.get(request_class, ())
+            return len(recent)
+
+    def quantile(self, q: float, request_class: Hashable = None) -> Optional[float]:
+        """Latency quantile over the recent window of a request class (None before any sample)"""
+        with self._lock:
+            recent = sorted(self._recent if request_class is None else self._by_class.get(request_class, ()))
+        if not recent:
+            return None
+        return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+    def score(self, error_penalty: float) -> Optional[float]:
+        """Expected cost of a request: latency inflated by the error rate (None if unmeasured)"""
+        with self._lock:
+            if self.latency is None:
+                return None
+            return self.latency * (1 + error_penalty * self.error_rate)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {'latency': self.latency, 'error_rate': round(self.error_rate, 4),
+                    'samples': len(self._recent)}
+
+
+_attempt_clock = threading.local()
+
+
+def start_request_clock():
+    """
+    Mark where the provider request itself starts inside a router attempt
+
+    Call it after waiting on the provider's rate limiter or circuit breaker,
+    so that those waits do not count as provider latency. Attempts that never
+    call it are timed from their start.
+    """
+    _attempt_clock.start = time.perf_counter()
+
+
+class ProviderRouter:
+    """Sends each request to the best-ranked provider, hedging slow ones with the next"""
+
+    def __init__(self, providers: Sequence[Provider], alpha: float = 0.2,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 10,
+                 hedge_min_delay: float = 1.0, error_penalty: float = 4.0,
+                 max_workers: int = 16):
+        """
+        Initialize router
+
+        Args:
+            providers: Providers in priority order
+            alpha: Weight of the newest observation in each provider's EWMA
+            hedge_quantile: Latency quantile of the primary after which a backup
+                request is sent
+            hedge_min_samples: Latencies needed before the quantile is trusted;
+                until then requests are not hedged
+            hedge_min_delay: Lower bound on the hedge delay in seconds
+            error_penalty: How strongly the error rate inflates a provider's score
+            max_workers: Threads running requests (two per hedged request)
+        """
+        if not providers:
+            raise ValueError("At least one provider is required")
+        self.providers = list(providers)
+        self.stats: Dict[str, ProviderStats] = {p.name: ProviderStats(alpha) for p in self.providers}
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = max(1, hedge_min_samples)
+        self.hedge_min_delay = max(0.0, hedge_min_delay)
+        self.error_penalty = error_penalty
+        self._executor = ThreadPoolExecutor(max_workers=max(2, max_workers),
+                                            thread_name_prefix='provider')
+
+    def ranked(self) -> List[Provider]:
+        """
+        Providers best first
+
+        Measured providers are ordered by score; unmeasured ones follow in
+        priority order, so a fresh router uses the first provider until it
+        has a reason not to.
+
+        Returns:
+            Every provider, best first
+        """
+        def key(indexed: Tuple[int, Provider]):
+            index, provider = indexed
+            score = self.stats[provider.name].score(self.error_penalty)
+            return (score is None, score or 0.0, index)
+        return [provider for _, provider in sorted(enumerate(self.providers), key=key)]
+
+    def hedge_delay(self, provider: Provider, request_class: Hashable = None) -> Optional[float]:
+        """
+        Seconds to wait on a provider before hedging a request
+
+        Args:
+            provider: Provider the request went to
+            request_class: Kind of request; only latencies of the same class count
+
+        Returns:
+            The provider's latency quantile for the class, or None until it has
+            enough samples
+        """
+        stats = self.stats[provider.name]
+        if stats.class_samples(request_class) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, stats.quantile(self.hedge_quantile, request_class))
+
+    def record(self, provider: Provider, seconds: Optional[float], ok: bool = True,
+               request_class: Hashable = None):
+        """Feed the outcome of a request the router did not time itself"""
+        stats = self.stats[provider.name]
+        if ok:
+            stats.record_success(seconds, request_class)
+        else:
+            stats.record_failure()
+
+    def _timed(self, provider: Provider, attempt: Callable[[Provider], T],
+               request_class: Hashable = None) -> T:
+        start_request_clock()
+        try:
+            result = attempt(provider)
+        except Exception:
+            self.record(provider, None, ok=False)
+            raise
+        self.record(provider, time.perf_counter() - _attempt_clock.start, request_class=request_class)
+        return result
+
+    def call(self, attempt: Callable[[Provider], T], request_class: Hashable = None) -> T:
+        """
+        Run one request against the best provider, hedged with the next best
+
+        The first backup request starts when the primary runs past its latency
+        quantile for the request class, or at once if the primary fails. Each
+        later failure sends the request to the next ranked backup. The first
+        success wins; other requests finish in the background and still update
+        their provider's statistics.
+
+        Args:
+            attempt: Sends the request to a provider and returns the result;
+                it is also where the provider's rate limit and circuit breaker
+                apply, to hedged requests as much as to the first one, before
+                it calls start_request_clock()
+            request_class: Kind of request, e.g. its max_tokens, so that long
+                generations are not hedged by the latency of short calls
+
+        Returns:
+            Result of the first successful request
+
+        Raises:
+            Exception: The primary's error when every request failed
+        """
+        ranked = self.ranked()
+        primary, backups = ranked[0], ranked[1:]
+        if not backups:
+            return self._timed(primary, attempt, request_class)
+
+        pending = {self._executor.submit(self._timed, primary, attempt, request_class): primary}
+        delay = self.hedge_delay(primary, request_class)
+        remaining = iter(backups)
+        errors: Dict[str, Exception] = {}
+        while pending:
+            done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    errors[provider.name] = error
+                    continue
+                if provider is not primary:
+                    metrics.incr('api_hedge_wins', provider=provider.name)
+                return result
+            # The primary is slow, or a request failed: send the same request to
+            # the next backup; only the primary is hedged for being slow
+            delay = None
+            backup = next(remaining, None)
+            if backup is not None:
+                metrics.incr('api_hedges', provider=backup.name, reason='error' if done else 'slow')
+                pending[self._executor.submit(self._timed, backup, attempt, request_class)] = backup
+        raise errors.get(primary.name) or next(iter(errors.values()))
+
+    def state(self) -> Dict[str, dict]:
+        """Statistics per provider, best first"""
+        return {provider.name: self.stats[provider.name].state() for provider in self.ranked()}
+
+
+_shared_routers: Dict[tuple, ProviderRouter] = {}
+_shared_routers_lock = threading.Lock()
+
+
+def shared_provider_router(providers: Sequence[Provider], **settings) -> ProviderRouter:
+    """
+    Get the process-wide router for a list of providers, creating it on first use
+
+    Every generator using the same providers shares their statistics.
+    Settings only apply when the router is created.
+
+    Args:
+        providers: Providers in priority order
+        **settings: ProviderRouter keyword arguments
+
+    Returns:
+        The shared ProviderRouter
+    """
+    key = tuple(providers)
+    with _shared_routers_lock:
+        router = _shared_routers.get(key)
+        if router is None:
+            router = _shared_routers[key] = ProviderRouter(providers, **settings)
+        return router
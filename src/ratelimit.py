@@ -0,0 +1,442 @@
+"""
+Rate limiting module for outbound email delivery and API calls.
+Token buckets for a global send rate and per-provider (recipient domain) rates,
+plus an adaptive limiter, backoff and circuit breaker for the completion API.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+# Recipient domains that share one mailbox provider's inbound limits
+PROVIDER_DOMAINS = {
+    'gmail.com': 'gmail',
+    'googlemail.com': 'gmail',
+    'outlook.com': 'microsoft',
+    'hotmail.com': 'microsoft',
+    'live.com': 'microsoft',
+    'msn.com': 'microsoft',
+    'yahoo.com': 'yahoo',
+    'ymail.com': 'yahoo',
+    'icloud.com': 'apple',
+    'me.com': 'apple',
+}
+
+
+def provider_for(email: str) -> str:
+    """
+    Map a recipient address to its mailbox provider
+
+    Args:
+        email: Recipient email address
+
+    Returns:
+        Provider name for well-known domains, otherwise the domain itself
+    """
+    domain = email.rpartition('@')[2].strip().lower()
+    return PROVIDER_DOMAINS.get(domain, domain)
+
+
+def parse_rates(text: Optional[str]) -> Dict[str, float]:
+    """
+    Parse 'provider=rate' pairs, e.g. "gmail=2,microsoft=1"
+
+    Args:
+        text: Comma-separated pairs (empty or None for none)
+
+    Returns:
+        Mapping of provider to messages per second
+    """
+    rates = {}
+    for pair in (text or '').split(','):
+        name, _, value = pair.partition('=')
+        if name.strip() and value.strip():
+            rates[name.strip().lower()] = float(value)
+    return rates
+
+
+class TokenBucket:
+    """Thread-safe token bucket; a rate of zero or less means unlimited"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Initialize token bucket
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst size (defaults to one second of tokens, at least 1)
+            clock: Monotonic clock, injectable for tests
+            sleep: Sleep function, injectable for tests
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens if available
+
+        Args:
+            tokens: Number of tokens to take
+
+        Returns:
+            0.0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Block until tokens are taken
+
+        Args:
+            tokens: Number of tokens to take
+
+        Returns:
+            Total seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return waited
+            self._sleep(wait)
+            waited += wait
+
+
+class RateLimiter:
+    """Global send rate combined with per-provider rates"""
+
+    def __init__(self, global_rate: float, provider_rates: Optional[Dict[str, float]] = None,
+                 default_provider_rate: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Initialize rate limiter
+
+        Args:
+            global_rate: Messages per second across all providers (<= 0 for unlimited)
+            provider_rates: Messages per second for specific providers
+            default_provider_rate: Rate for providers without an entry (<= 0 for unlimited)
+            clock: Monotonic clock, injectable for tests
+            sleep: Sleep function, injectable for tests
+        """
+        self._clock = clock
+        self._sleep = sleep
+        self.global_bucket = TokenBucket(global_rate, clock=clock, sleep=sleep)
+        self.provider_rates = dict(provider_rates or {})
+        self.default_provider_rate = default_provider_rate
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket_for(self, provider: str) -> TokenBucket:
+        """
+        Get (creating on first use) the bucket of a provider
+
+        Args:
+            provider: Provider name from provider_for()
+
+        Returns:
+            The provider's token bucket
+        """
+        with self._lock:
+            bucket = self._buckets.get(provider)
+            if bucket is None:
+                rate = self.provider_rates.get(provider, self.default_provider_rate)
+                bucket = self._buckets[provider] = TokenBucket(rate, clock=self._clock, sleep=self._sleep)
+            return bucket
+
+    def acquire(self, email: str) -> float:
+        """
+        Block until one message to email may be sent
+
+        Args:
+            email: Recipient email address
+
+        Returns:
+            Total seconds spent waiting
+        """
+        waited = self.bucket_for(provider_for(email)).acquire()
+        return waited + self.global_bucket.acquire()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Parse a Retry-After header
+
+    Args:
+        value: Header value, either delay seconds or an HTTP date
+        now: Current Unix time (defaults to time.time())
+
+    Returns:
+        Seconds to wait (never negative), or None if absent or unparseable
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None,
+                  rng: Callable[[], float] = random.random) -> float:
+    """
+    Exponential backoff with jitter
+
+    Half of the exponential delay is fixed and half is random, so workers that
+    failed together do not retry together. A server-provided Retry-After is
+    used as a lower bound.
+
+    Args:
+        attempt: Number of the failed attempt, starting at 1
+        base: Delay after the first failure in seconds
+        cap: Maximum backoff in seconds (Retry-After may exceed it)
+        retry_after: Seconds requested by the server, if any
+        rng: Random source returning floats in [0, 1)
+
+    Returns:
+        Seconds to wait before the next attempt
+    """
+    delay = min(cap, base * 2 ** (attempt - 1))
+    delay = delay / 2 + rng() * delay / 2
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    Token bucket that adapts its rate to provider feedback
+
+    Throttling responses halve the rate (down to min_rate) and can pause the
+    bucket until a Retry-After deadline; successes raise it again additively
+    up to max_rate. A rate of zero or less means unlimited, but pauses still apply.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 min_rate: Optional[float] = None, max_rate: Optional[float] = None,
+                 increase_step: Optional[float] = None, decrease_factor: float = 0.5,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Initialize adaptive bucket
+
+        Args:
+            rate: Initial tokens per second
+            capacity: Maximum burst size
+            min_rate: Lowest rate after repeated throttling (defaults to rate / 16)
+            max_rate: Highest rate after recovery (defaults to rate)
+            increase_step: Rate added per success (defaults to max_rate / 20)
+            decrease_factor: Rate multiplier applied on throttling
+            clock: Monotonic clock, injectable for tests
+            sleep: Sleep function, injectable for tests
+        """
+        super().__init__(rate, capacity, clock, sleep)
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.increase_step = increase_step if increase_step is not None else self.max_rate / 20
+        self.decrease_factor = decrease_factor
+        self._paused_until = 0.0
+        self.throttle_count = 0
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        with self._lock:
+            pause = self._paused_until - self._clock()
+        if pause > 0:
+            return pause
+        return super().try_acquire(tokens)
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """
+        Slow down after a throttling response
+
+        Args:
+            retry_after: Seconds the server asked every caller to wait
+        """
+        with self._lock:
+            now = self._clock()
+            self.throttle_count += 1
+            if self.rate > 0:
+                self._refill(now)
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def record_success(self):
+        """Speed back up after a successful call"""
+        with self._lock:
+            if 0 < self.rate < self.max_rate:
+                self._refill(self._clock())
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def state(self) -> dict:
+        """Current rate, available tokens and remaining pause"""
+        with self._lock:
+            now = self._clock()
+            if self.rate > 0:
+                self._refill(now)
+            return {
+                'rate': self.rate,
+                'max_rate': self.max_rate,
+                'tokens': round(self._tokens, 3),
+                'paused_for': round(max(0.0, self._paused_until - now), 3),
+                'throttled': self.throttle_count,
+            }
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a provider keeps failing
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    raise CircuitOpenError for reset_timeout seconds. Then a single probe call
+    is let through (half-open); its success closes the circuit, its failure
+    opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize circuit breaker
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe
+            clock: Monotonic clock, injectable for tests
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """'closed', 'open' or 'half_open'"""
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            return self._state
+
+    def before_call(self):
+        """
+        Check that a call may proceed
+
+        Raises:
+            CircuitOpenError: While open, or while a half-open probe is in flight
+        """
+        state = self.state
+        with self._lock:
+            if state == self.OPEN:
+                remaining = self.reset_timeout - (self._clock() - self._opened_at)
+                raise CircuitOpenError(f"Circuit open after {self._failures} consecutive failures; "
+                                       f"retrying in {max(0.0, remaining):.0f}s")
+            if state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError("Circuit half-open; a probe request is in flight")
+                self._probe_in_flight = True
+
+    def record_success(self):
+        """Close the circuit and reset the failure count"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """Count a failure, opening the circuit at the threshold or after a failed probe"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+            self._probe_in_flight = False
+
+
+class ApiGuard:
+    """Adaptive rate limiter and circuit breaker protecting one API"""
+
+    def __init__(self, bucket: AdaptiveTokenBucket, breaker: CircuitBreaker):
+        """
+        Initialize guard
+
+        Args:
+            bucket: Request rate limiter
+            breaker: Circuit breaker
+        """
+        self.bucket = bucket
+        self.breaker = breaker
+
+    def state(self) -> dict:
+        """Limiter state plus the circuit state, for callers that throttle a whole run"""
+        return dict(self.bucket.state(), circuit=self.breaker.state)
+
+
+_shared_guards: Dict[str, ApiGuard] = {}
+_shared_guards_lock = threading.Lock()
+
+
+def shared_api_guard(key: str, requests_per_second: float = 0.0, failure_threshold: int = 5,
+                     reset_timeout: float = 60.0, burst: Optional[float] = None) -> ApiGuard:
+    """
+    Get the process-wide guard for an API, creating it on first use
+
+    Every generator and worker thread using the same key shares one limiter
+    and one circuit breaker. Settings only apply when the guard is created.
+
+    Args:
+        key: API identity, e.g. its URL
+        requests_per_second: Initial and maximum request rate (<= 0 for unlimited)
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds the circuit stays open before a probe
+        burst: Requests allowed at once before the rate applies (defaults to one
+            second's worth, at least 1)
+
+    Returns:
+        The shared ApiGuard
+    """
+    with _shared_guards_lock:
+        guard = _shared_guards.get(key)
+        if guard is None:
+            guard = _shared_guards[key] = ApiGuard(
+                AdaptiveTokenBucket(requests_per_second, burst),
+                CircuitBreaker(failure_threshold, reset_timeout)
+            )
+        return guard
@@ -0,0 +1,238 @@
+"""
+Scheduler module for fanning one run out to many subscribers.
+Generates each segment's issue once, batches recipients into send windows
+by local time, and dispatches them in parallel under rate limits.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from .checkpoint import CheckpointStore, checkpoint_key
+    from .document import parse_markdown
+    from .email_sender import PreparedBody, SendResult
+    from .email_template import EmailTemplate
+    from .metrics import metrics
+    from .subscribers import Segment, Subscriber
+except ImportError:
+    from checkpoint import CheckpointStore, checkpoint_key
+    from document import parse_markdown
+    from email_sender import PreparedBody, SendResult
+    from email_template import EmailTemplate
+    from metrics import metrics
+    from subscribers import Segment, Subscriber
+
+
+def issue_key(local_date: str, email: str, subject: str) -> str:
+    """
+    Key of the send marker for one recipient's issue of a day
+
+    Args:
+        local_date: Recipient's local date as YYYY-MM-DD
+        email: Recipient email address
+        subject: Email subject line
+
+    Returns:
+        Checkpoint key shared with the single-recipient pipeline
+    """
+    return checkpoint_key('issue', local_date, email, subject)
+
+
+@dataclass
+class SendWindow:
+    """Due subscribers of one segment sharing a local date, timezone and send hour"""
+
+    segment: Segment
+    local_date: str
+    timezone: str
+    send_hour: int
+    subscribers: List[Subscriber] = field(default_factory=list)
+
+
+@dataclass
+class FanOutReport:
+    """Outcome of one scheduler run"""
+
+    windows: List[SendWindow] = field(default_factory=list)
+    issues: List[Tuple[Segment, str]] = field(default_factory=list)
+    results: List[SendResult] = field(default_factory=list)
+    deferred: List[Tuple[SendWindow, str]] = field(default_factory=list)
+
+    @property
+    def sent(self) -> int:
+        """Number of messages accepted by the mail server"""
+        return sum(1 for r in self.results if r.success)
+
+    @property
+    def failed(self) -> List[SendResult]:
+        """Results of messages that were not delivered"""
+        return [r for r in self.results if not r.success]
+
+
+class FanOutScheduler:
+    """Generate once per segment, deliver to every due subscriber"""
+
+    def __init__(self, generate: Callable[[Segment, str], str],
+                 record: Callable[[Segment, List[str]], None],
+                 sender, checkpoints: CheckpointStore, subject: str,
+                 rate_limiter=None, max_workers: Optional[int] = None,
+                 api_state: Optional[Callable[[], dict]] = None, max_api_pause: float = 300.0,
+                 archive: Optional[Callable[[Segment, str, str], None]] = None):
+        """
+        Initialize scheduler
+
+        Args:
+            generate: Returns the concepts text for (segment, local date YYYY-MM-DD)
+            record: Adds a segment's sent concept titles to its history
+            sender: EmailSender (or anything with a compatible send_bulk)
+            checkpoints: Store for generated issues and send markers
+            subject: Email subject line
+            rate_limiter: Optional ratelimit.RateLimiter applied to every message
+            max_workers: Sending threads (defaults to the sender's pool size)
+            api_state: Returns the completion API guard's state (see
+                ratelimit.ApiGuard.state); segments are deferred while its circuit
+                is open or it is paused for longer than max_api_pause
+            max_api_pause: Longest API pause in seconds worth waiting for
+            archive: Optional callback keeping (segment, local date, concepts text)
+                of each delivered issue
+        """
+        self.generate = generate
+        self.record = record
+        self.sender = sender
+        self.checkpoints = checkpoints
+        self.subject = subject
+        self.rate_limiter = rate_limiter
+        self.max_workers = max_workers
+        self.api_state = api_state
+        self.max_api_pause = max_api_pause
+        self.archive = archive
+
+    def plan(self, subscribers: Sequence[Subscriber], now: Optional[datetime] = None) -> List[SendWindow]:
+        """
+        Group subscribers into send windows for the issue of their latest
+        reached send time (see Subscriber.due_date) if they have not received it
+
+        Args:
+            subscribers: Active subscribers
+            now: Current time (defaults to now, UTC)
+
+        Returns:
+            Send windows ordered by segment, date, timezone and hour
+        """
+        now = now or datetime.now(timezone.utc)
+        windows: Dict[tuple, SendWindow] = {}
+        for subscriber in subscribers:
+            if not subscriber.active:
+                continue
+            local_date = subscriber.due_date(now).isoformat()
+            if self.checkpoints.sent_marker(issue_key(local_date, subscriber.email, self.subject)):
+                continue
+            key = (subscriber.segment, local_date, subscriber.timezone, subscriber.send_hour)
+            if key not in windows:
+                windows[key] = SendWindow(*key)
+            windows[key].subscribers.append(subscriber)
+        return [windows[key] for key in sorted(windows, key=lambda k: (k[0].slug,) + k[1:])]
+
+    def _issue(self, segment: Segment, local_date: str) -> str:
+        """Concepts text of a segment's issue, generated at most once per date"""
+        key = checkpoint_key('segment-issue', segment.slug, local_date)
+        with metrics.span('fanout.generate', segment=segment.slug) as attrs:
+            text, attrs['resumed'] = self.checkpoints.get_or_compute(
+                'segment-issue', key, lambda: self.generate(segment, local_date)
+            )
+        return text
+
+    def _api_unavailable(self) -> Optional[str]:
+        """Reason to stop generating for this run, or None if the API is usable"""
+        if self.api_state is None:
+            return None
+        state = self.api_state()
+        if state.get('circuit') == 'open':
+            return "completion API circuit is open"
+        if state.get('paused_for', 0) > self.max_api_pause:
+            return f"completion API asked to wait {state['paused_for']:.0f}s"
+        return None
+
+    def run(self, subscribers: Sequence[Subscriber], now: Optional[datetime] = None) -> FanOutReport:
+        """
+        Generate, render and deliver every due issue
+
+        Args:
+            subscribers: Active subscribers
+            now: Current time (defaults to now, UTC)
+
+        Returns:
+            FanOutReport with the windows, generated issues and send results
+        """
+        report = FanOutReport(windows=self.plan(subscribers, now))
+        issues: Dict[Tuple[Segment, str], str] = {}
+        failures: Dict[Tuple[Segment, str], str] = {}
+        messages: List[dict] = []
+        pending: List[Tuple[Segment, str, str]] = []
+
+        for window in report.windows:
+            issue = (window.segment, window.local_date)
+            if issue not in issues and issue not in failures:
+                # Deferred windows stay unmarked, so the next run picks them up
+                reason = self._api_unavailable()
+                if reason is None:
+                    try:
+                        issues[issue] = self._issue(*issue)
+                        report.issues.append(issue)
+                    except Exception as e:
+                        reason = f"generation failed: {e}"
+                if reason is not None:
+                    failures[issue] = reason
+            if issue in failures:
+                report.deferred.append((window, failures[issue]))
+                continue
+            concepts_text = issues[issue]
+
+            # The window's body is rendered and transfer-encoded once; each
+            # message only adds its headers and the recipient's name slots
+            display_date = datetime.fromisoformat(window.local_date).strftime("%B %d, %Y")
+            with metrics.span('fanout.render', segment=window.segment.slug,
+                              recipients=len(window.subscribers)):
+                body = PreparedBody.from_template(EmailTemplate.compiled_issue(concepts_text, date=display_date))
+            for subscriber in window.subscribers:
+                name = subscriber.name or subscriber.email.split('@')[0]
+                messages.append({'to_email': subscriber.email, 'subject': self.subject,
+                                 'body': body, 'values': EmailTemplate.recipient_slots(name),
+                                 'key': issue_key(window.local_date, subscriber.email, self.subject)})
+                pending.append((window.segment, window.local_date, subscriber.email))
+
+        with metrics.span('fanout.send', messages=len(messages)):
+            report.results = self.sender.send_bulk(messages, max_workers=self.max_workers,
+                                                   rate_limiter=self.rate_limiter)
+
+        delivered = set()
+        for (segment, local_date, email), result in zip(pending, report.results):
+            metrics.incr('fanout_messages', segment=segment.slug,
+                         result='sent' if result.success else 'failed')
+            if result.success:
+                delivered.add((segment, local_date))
+
+        # Each segment's history is updated once per date, after its first
+        # delivery and before any send marker: a run stopped in between sends
+        # again on the next run instead of never recording the issue
+        for segment, local_date in report.issues:
+            if (segment, local_date) not in delivered:
+                continue
+            history_key = checkpoint_key('segment-history', segment.slug, local_date)
+            if self.checkpoints.sent_marker(history_key):
+                continue
+            titles = parse_markdown(issues[(segment, local_date)]).titles()
+            self.record(segment, titles)
+            self.checkpoints.mark_sent(history_key, history_key, titles, stored=True)
+            if self.archive is not None:
+                self.archive(segment, local_date, issues[(segment, local_date)])
+
+        for (segment, local_date, email), result in zip(pending, report.results):
+            if result.success:
+                titles = parse_markdown(issues[(segment, local_date)]).titles()
+                content_key = checkpoint_key('segment-issue', segment.slug, local_date)
+                self.checkpoints.mark_sent(issue_key(local_date, email, self.subject), content_key,
+                                           titles, stored=True)
+
+        return report
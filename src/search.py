@@ -0,0 +1,309 @@
+"""
+Search module for full-text search over past concepts.
+Keeps an inverted index (term -> concept postings) in SQLite that grows by
+one issue at a time, and ranks matches with BM25.
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from .document import parse_markdown, strip_inline
+except ImportError:
+    from document import parse_markdown, strip_inline
+
+
+# BM25 parameters and how many times title terms count relative to body terms
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 3
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_MARKUP_RE = re.compile(r"[#*_`>\[\]]+")
+
+STOPWORDS = frozenset("""
+a about an and are as at be been but by can do does for from has have how in into is it
+its of on or that the their then there these this to was we were what when which while
+who why will with you your
+""".split())
+
+# Suffix -> replacement, longest first; the first match is applied
+_SUFFIXES = (
+    ('ational', 'ate'), ('ization', 'ize'), ('fulness', 'ful'), ('iveness', 'ive'),
+    ('ousness', 'ous'), ('ations', 'ate'), ('ation', 'ate'), ('ments', ''), ('ment', ''),
+    ('ness', ''), ('ings', ''), ('sses', 'ss'), ('ies', 'y'), ('ied', 'y'), ('ers', ''),
+    ('ing', ''), ('ed', ''), ('er', ''), ('al', ''), ('es', ''), ('s', ''),
+)
+
+
+def stem(word: str) -> str:
+    """
+    Reduce a lowercase word to a crude stem (a light Porter-style stemmer)
+
+    Args:
+        word: Lowercase token
+
+    Returns:
+        Stem shared by the word's common inflections, e.g. 'retriev' for
+        'retrieval', 'retrieve' and 'retrieved'
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    for suffix, replacement in _SUFFIXES:
+        if not word.endswith(suffix):
+            continue
+        base = word[:-len(suffix)]
+        if suffix == 's' and word.endswith(('ss', 'us', 'is')):
+            break
+        if suffix == 'al' and len(base) < 5:
+            break
+        if len(base) >= 3:
+            word = base + replacement
+            if replacement == '' and len(word) > 3 and word[-1] == word[-2] and word[-1] not in 'lsz':
+                word = word[:-1]  # running -> run
+        break
+    if len(word) > 4 and word.endswith('e'):
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into stemmed index terms
+
+    Args:
+        text: Plain or Markdown text
+
+    Returns:
+        Terms in order, stopwords removed
+    """
+    return [stem(word) for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+@dataclass
+class SearchHit:
+    """One ranked concept"""
+
+    title: str
+    date: str
+    segment: str
+    score: float
+    snippet: str = ""
+
+
+def _snippet(markdown: str, length: int = 160) -> str:
+    """Plain-text start of a concept body"""
+    body = markdown.split('\n', 1)[1] if '\n' in markdown else markdown
+    text = ' '.join(_MARKUP_RE.sub(' ', strip_inline(body)).split())
+    return text if len(text) <= length else text[:length].rsplit(' ', 1)[0] + '…'
+
+
+class ConceptIndex:
+    """Inverted index over concept titles and bodies, with BM25 ranking"""
+
+    def __init__(self, db_file: str):
+        """
+        Initialize index
+
+        Args:
+            db_file: Path to the SQLite database
+        """
+        self.db_file = db_file
+        directory = os.path.dirname(db_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                segment TEXT NOT NULL,
+                date TEXT NOT NULL,
+                title TEXT NOT NULL,
+                snippet TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                UNIQUE (segment, date, title)
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS issues (
+                segment TEXT NOT NULL,
+                date TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                PRIMARY KEY (segment, date, content_hash)
+            ) WITHOUT ROWID;
+        """)
+
+    def _stats(self) -> Tuple[int, int]:
+        """Number of indexed concepts and their total length in terms"""
+        rows = dict(self._conn.execute("SELECT key, value FROM stats").fetchall())
+        return rows.get('docs', 0), rows.get('terms', 0)
+
+    def add_concepts(self, date: str, concepts: Iterable[Tuple[str, str]],
+                     segment: str = 'general-en') -> int:
+        """
+        Index concepts of one issue; only their own postings are written
+
+        Args:
+            date: Issue date as YYYY-MM-DD
+            concepts: (title, Markdown section) pairs
+            segment: Subscriber segment slug
+
+        Returns:
+            Number of newly indexed concepts (already indexed ones are skipped)
+        """
+        prepared = []
+        for title, markdown in concepts:
+            counts: Dict[str, int] = {}
+            for term in tokenize(title) * TITLE_WEIGHT + tokenize(markdown.split('\n', 1)[-1]):
+                counts[term] = counts.get(term, 0) + 1
+            prepared.append((title, _snippet(markdown), counts))
+
+        added = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for title, snippet, counts in prepared:
+                    length = sum(counts.values())
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO docs (segment, date, title, snippet, length) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (segment, date, title, snippet, length)
+                    )
+                    if cursor.rowcount == 0:
+                        continue
+                    doc_id = cursor.lastrowid
+                    self._conn.executemany(
+                        "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                        [(term, doc_id, tf) for term, tf in counts.items()]
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO terms (term, df) VALUES (?, 1) "
+                        "ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                        [(term,) for term in counts]
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO stats (key, value) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                        [('docs', 1), ('terms', length)]
+                    )
+                    added += 1
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return added
+
+    def add_issue(self, date: str, concepts_text: str, segment: str = 'general-en') -> int:
+        """
+        Index the concepts of a generated issue
+
+        Args:
+            date: Issue date as YYYY-MM-DD
+            concepts_text: Generated concepts text
+            segment: Subscriber segment slug
+
+        Returns:
+            Number of newly indexed concepts
+        """
+        doc = parse_markdown(concepts_text)
+        return self.add_concepts(date, [(c.title, c.source) for c in doc.concepts], segment)
+
+    def sync(self, archive) -> int:
+        """
+        Index archived issues that are not indexed yet
+
+        Args:
+            archive: archive.IssueArchive
+
+        Returns:
+            Number of newly indexed concepts
+        """
+        with self._lock:
+            seen = set(self._conn.execute("SELECT segment, date, content_hash FROM issues").fetchall())
+        added = 0
+        for entry in archive.entries():
+            if (entry.segment, entry.date, entry.content_hash) in seen:
+                continue
+            record = archive.read(entry)
+            added += self.add_concepts(entry.date, [(c['title'], c['markdown']) for c in record['concepts']],
+                                       entry.segment)
+            with self._lock:
+                self._conn.execute("INSERT OR IGNORE INTO issues (segment, date, content_hash) VALUES (?, ?, ?)",
+                                   (entry.segment, entry.date, entry.content_hash))
+        return added
+
+    def search(self, query: str, limit: int = 10, segment: Optional[str] = None) -> List[SearchHit]:
+        """
+        Rank indexed concepts against a query with BM25
+
+        Args:
+            query: Free-text query
+            limit: Maximum number of hits
+            segment: Only concepts of this segment slug
+
+        Returns:
+            Hits, best first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+
+        with self._lock:
+            docs, total_length = self._stats()
+            placeholders = ','.join('?' * len(terms))
+            weights = []
+            for term, df in self._conn.execute(
+                    f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms):
+                weights += [term, math.log(1 + (docs - df + 0.5) / (df + 0.5))]
+            if not weights:
+                return []
+
+            # Postings are scored and ranked inside SQLite, so no per-posting
+            # Python work is done however common the query terms are
+            rows = self._conn.execute(
+                f"WITH query(term, idf) AS (VALUES {','.join(['(?, ?)'] * (len(weights) // 2))}) "
+                "SELECT p.doc_id, SUM(query.idf * p.tf * ? / (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score "
+                "FROM query JOIN postings p ON p.term = query.term JOIN docs d ON d.id = p.doc_id "
+                + ("WHERE d.segment = ? " if segment else "")
+                + "GROUP BY p.doc_id ORDER BY score DESC, p.doc_id DESC LIMIT ?",
+                weights + [BM25_K1 + 1, BM25_K1, BM25_B, BM25_B, total_length / docs]
+                + ([segment] if segment else []) + [limit]
+            ).fetchall()
+            hits = []
+            for doc_id, score in rows:
+                title, date, doc_segment, snippet = self._conn.execute(
+                    "SELECT title, date, segment, snippet FROM docs WHERE id = ?", (doc_id,)
+                ).fetchone()
+                hits.append(SearchHit(title, date, doc_segment, round(score, 4), snippet))
+        return hits
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._stats()[0]
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
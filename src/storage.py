@@ -1,87 +1,345 @@
 """
 Storage module for tracking sent AI concepts.
-Handles reading and writing concept history to JSON file.
+Handles reading and writing concept history to a JSON file or SQLite database.
 """
 
 import json
 import os
-from typing import List
+import sqlite3
+import threading
+import time
+from typing import List, Optional
 
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+
+class StorageBackend:
+    """Interface shared by all concept storage backends"""
+
+    def load_concepts(self) -> List[str]:
+        """Return every stored concept title, oldest first"""
+        raise NotImplementedError
+
+    def save_concepts(self, concepts: List[str]):
+        """Replace the stored history with concepts"""
+        raise NotImplementedError
+
+    def add_concepts(self, new_concepts: List[str], max_stored: int = 100):
+        """Append concepts, keeping at most max_stored of the newest"""
+        raise NotImplementedError
+
+    def get_recent_concepts(self, count: int = 50) -> List[str]:
+        """Return the newest count titles, oldest first"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Return the number of stored titles"""
+        return len(self.load_concepts())
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+
+class JSONStorageBackend(StorageBackend):
+    """Concept history kept as a JSON list in a single file"""
 
-class ConceptStorage:
-    """Class to manage storage of sent concepts"""
-    
     def __init__(self, storage_file: str):
         """
-        Initialize storage with file path
-        
+        Initialize JSON backend
+
         Args:
             storage_file: Path to JSON file storing sent concepts
         """
         self.storage_file = storage_file
+        self._cache_key = None
+        self._cache: List[str] = []
         self._ensure_storage_exists()
-    
+
     def _ensure_storage_exists(self):
         """Create storage directory and file if they don't exist"""
         # Create directory if it doesn't exist
         directory = os.path.dirname(self.storage_file)
         if directory and not os.path.exists(directory):
             os.makedirs(directory)
-        
+
         # Create empty file if it doesn't exist
         if not os.path.exists(self.storage_file):
             self.save_concepts([])
-    
+
+    def _file_key(self):
+        """Identity of the file contents on disk, used to skip re-parsing"""
+        try:
+            stat = os.stat(self.storage_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _cached_concepts(self) -> List[str]:
+        """Parsed file contents, re-read only when the file changed"""
+        key = self._file_key()
+        if key is not None and key == self._cache_key:
+            return self._cache
+
+        try:
+            with open(self.storage_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                concepts = data if isinstance(data, list) else []
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+        self._cache_key = key
+        self._cache = concepts
+        return concepts
+
+    def load_concepts(self) -> List[str]:
+        return list(self._cached_concepts())
+
+    def save_concepts(self, concepts: List[str]):
+        # Write to a temporary file and rename so readers never see a partial file
+        tmp_file = f"{self.storage_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(concepts, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.storage_file)
+
+        self._cache_key = self._file_key()
+        self._cache = list(concepts)
+
+    def add_concepts(self, new_concepts: List[str], max_stored: int = 100):
+        existing_concepts = self._cached_concepts()
+        updated_concepts = existing_concepts + new_concepts
+
+        # Keep only the most recent concepts
+        if len(updated_concepts) > max_stored:
+            updated_concepts = updated_concepts[-max_stored:]
+
+        self.save_concepts(updated_concepts)
+
+    def get_recent_concepts(self, count: int = 50) -> List[str]:
+        concepts = self._cached_concepts()
+        return concepts[-count:] if concepts and count > 0 else []
+
+    def count(self) -> int:
+        return len(self._cached_concepts())
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """Concept history kept in an indexed SQLite table with transactional appends"""
+
+    def __init__(self, db_file: str, migrate_from: Optional[str] = None):
+        """
+        Initialize SQLite backend
+
+        Args:
+            db_file: Path to the SQLite database
+            migrate_from: JSON history imported when the database is empty
+        """
+        self.db_file = db_file
+        directory = os.path.dirname(db_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS concepts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_concepts_created_at ON concepts(created_at);
+        """)
+
+        if migrate_from and os.path.exists(migrate_from) and self.count() == 0:
+            migrate_json_to_sqlite(migrate_from, self)
+
+    def _transaction(self, statements):
+        """Run callable(statements) inside a write transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def load_concepts(self) -> List[str]:
+        return [row[0] for row in self._query("SELECT title FROM concepts ORDER BY id")]
+
+    def save_concepts(self, concepts: List[str]):
+        now = time.time()
+
+        def replace(conn):
+            conn.execute("DELETE FROM concepts")
+            conn.executemany(
+                "INSERT INTO concepts (title, created_at) VALUES (?, ?)",
+                [(title, now) for title in concepts]
+            )
+
+        self._transaction(replace)
+
+    def add_concepts(self, new_concepts: List[str], max_stored: int = 100):
+        now = time.time()
+
+        def append(conn):
+            conn.executemany(
+                "INSERT INTO concepts (title, created_at) VALUES (?, ?)",
+                [(title, now) for title in new_concepts]
+            )
+            # Ids are contiguous (rows only ever leave from the oldest end),
+            # so the cut-off is computed from MAX(id) without scanning
+            conn.execute(
+                "DELETE FROM concepts WHERE id <= (SELECT MAX(id) FROM concepts) - ?",
+                (max(0, max_stored),)
+            )
+
+        self._transaction(append)
+
+    def get_recent_concepts(self, count: int = 50) -> List[str]:
+        if count <= 0:
+            return []
+        rows = self._query(
+            "SELECT title FROM (SELECT id, title FROM concepts ORDER BY id DESC LIMIT ?) "
+            "ORDER BY id",
+            (count,)
+        )
+        return [row[0] for row in rows]
+
+    def get_concepts_since(self, timestamp: float) -> List[str]:
+        """
+        Return titles stored at or after a Unix timestamp, oldest first
+
+        Args:
+            timestamp: Lower bound on created_at
+        """
+        rows = self._query(
+            "SELECT title FROM concepts WHERE created_at >= ? ORDER BY id",
+            (timestamp,)
+        )
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM concepts")[0][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_to_sqlite(json_file: str, backend: SQLiteStorageBackend) -> int:
+    """
+    Append the history from a JSON storage file to a SQLite backend
+
+    Args:
+        json_file: Path to a JSON list of concept titles
+        backend: Destination backend
+
+    Returns:
+        Number of migrated titles
+    """
+    concepts = JSONStorageBackend(json_file).load_concepts()
+    if concepts:
+        backend.add_concepts(concepts, max_stored=len(concepts) + backend.count())
+    return len(concepts)
+
+
+class ConceptStorage:
+    """Class to manage storage of sent concepts"""
+
+    def __init__(self, storage_file: str, backend: Optional[str] = None):
+        """
+        Initialize storage with file path
+
+        Args:
+            storage_file: Path to the JSON (or SQLite) file storing sent concepts
+            backend: 'json' or 'sqlite'; inferred from the file extension when omitted.
+                With 'sqlite' and a .json path, the database lives next to the JSON
+                file and the JSON history is migrated into it on first use.
+        """
+        self.storage_file = storage_file
+
+        if backend is None:
+            backend = 'sqlite' if storage_file.endswith(SQLITE_SUFFIXES) else 'json'
+
+        self.backend_name = backend
+        if backend == 'sqlite':
+            migrate_from = None
+            if not storage_file.endswith(SQLITE_SUFFIXES):
+                migrate_from = storage_file
+                storage_file = os.path.splitext(storage_file)[0] + '.db'
+            self.backend: StorageBackend = SQLiteStorageBackend(storage_file, migrate_from)
+        elif backend == 'json':
+            self.backend = JSONStorageBackend(storage_file)
+        else:
+            raise ValueError(f"Unknown storage backend: {backend}")
+
     def load_concepts(self) -> List[str]:
         """
         Load previously sent concepts from storage
-        
+
         Returns:
             List of previously sent concept titles
         """
-        try:
-            with open(self.storage_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-    
+        with metrics.span('storage.load', backend=self.backend_name):
+            return self.backend.load_concepts()
+
     def save_concepts(self, concepts: List[str]):
         """
         Save concepts list to storage
-        
+
         Args:
             concepts: List of concept titles to save
         """
-        with open(self.storage_file, 'w', encoding='utf-8') as f:
-            json.dump(concepts, f, indent=2, ensure_ascii=False)
-    
+        with metrics.span('storage.save', backend=self.backend_name):
+            self.backend.save_concepts(concepts)
+
     def add_concepts(self, new_concepts: List[str], max_stored: int = 100):
         """
         Add new concepts to storage, maintaining maximum storage limit
-        
+
         Args:
             new_concepts: List of new concept titles to add
             max_stored: Maximum number of concepts to keep in storage
         """
-        existing_concepts = self.load_concepts()
-        updated_concepts = existing_concepts + new_concepts
-        
-        # Keep only the most recent concepts
-        if len(updated_concepts) > max_stored:
-            updated_concepts = updated_concepts[-max_stored:]
-        
-        self.save_concepts(updated_concepts)
-    
+        with metrics.span('storage.add', backend=self.backend_name):
+            self.backend.add_concepts(new_concepts, max_stored)
+
     def get_recent_concepts(self, count: int = 50) -> List[str]:
         """
         Get the most recent concepts for duplicate avoidance
-        
+
         Args:
             count: Number of recent concepts to retrieve
-            
+
         Returns:
             List of recent concept titles
         """
-        concepts = self.load_concepts()
-        return concepts[-count:] if concepts else []
+        with metrics.span('storage.recent', backend=self.backend_name):
+            return self.backend.get_recent_concepts(count)
+
+    def count(self) -> int:
+        """
+        Get the number of tracked concepts
+
+        Returns:
+            Number of stored concept titles
+        """
+        with metrics.span('storage.count', backend=self.backend_name):
+            return self.backend.count()
+
+    def close(self):
+        """Release backend resources"""
+        self.backend.close()
@@ -0,0 +1,208 @@
+"""
+Subscribers module for the multi-recipient registry.
+Stores subscribers with their segment (interest area and language) and
+their local delivery time.
+"""
+
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, fields
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+DEFAULT_INTEREST = 'general'
+DEFAULT_LANGUAGE = 'en'
+
+
+@dataclass(frozen=True)
+class Segment:
+    """Subscribers that receive the same generated content"""
+
+    interest: str = DEFAULT_INTEREST
+    language: str = DEFAULT_LANGUAGE
+
+    @property
+    def slug(self) -> str:
+        """File-name-safe identifier, e.g. 'computer-vision-fr'"""
+        return re.sub(r'[^a-z0-9]+', '-', f"{self.interest}-{self.language}".lower()).strip('-')
+
+    @property
+    def is_default(self) -> bool:
+        """True for the segment served by the original single-recipient setup"""
+        return self == Segment()
+
+
+@dataclass
+class Subscriber:
+    """One recipient, their segment and their local send time"""
+
+    email: str
+    name: str = ""
+    interest: str = DEFAULT_INTEREST
+    language: str = DEFAULT_LANGUAGE
+    timezone: str = 'UTC'
+    send_hour: int = 8
+    active: bool = True
+
+    def __post_init__(self):
+        self.email = self.email.strip()
+        if '@' not in self.email:
+            raise ValueError(f"Invalid subscriber email: {self.email!r}")
+        if not 0 <= self.send_hour <= 23:
+            raise ValueError(f"send_hour must be between 0 and 23, got {self.send_hour}")
+        try:
+            ZoneInfo(self.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone for {self.email}: {self.timezone!r}") from None
+
+    @property
+    def segment(self) -> Segment:
+        """Segment deciding which generated issue this subscriber gets"""
+        return Segment(self.interest.strip().lower() or DEFAULT_INTEREST,
+                       self.language.strip().lower() or DEFAULT_LANGUAGE)
+
+    @property
+    def tzinfo(self) -> ZoneInfo:
+        """Subscriber's timezone"""
+        return ZoneInfo(self.timezone)
+
+    def local_time(self, now: datetime) -> datetime:
+        """
+        Convert an aware datetime to the subscriber's local time
+
+        Args:
+            now: Timezone-aware current time
+
+        Returns:
+            Local datetime
+        """
+        return now.astimezone(self.tzinfo)
+
+    def is_due(self, now: datetime) -> bool:
+        """
+        Check whether today's local send time has been reached
+
+        Args:
+            now: Timezone-aware current time
+
+        Returns:
+            True from send_hour local time until local midnight
+        """
+        return self.local_time(now).hour >= self.send_hour
+
+    def due_date(self, now: datetime) -> date:
+        """
+        Local date of the latest send time that has been reached
+
+        Before send_hour this is yesterday, so a run that starts before the
+        local send time (e.g. a once-daily cron) still catches up on the
+        issue an earlier run could not send.
+
+        Args:
+            now: Timezone-aware current time
+
+        Returns:
+            Today's local date from send_hour on, else yesterday's
+        """
+        local_date = self.local_time(now).date()
+        return local_date if self.is_due(now) else local_date - timedelta(days=1)
+
+
+class SubscriberRegistry:
+    """Subscribers kept as a JSON list in a single file"""
+
+    def __init__(self, registry_file: str):
+        """
+        Initialize registry
+
+        Args:
+            registry_file: Path to the JSON file of subscribers
+        """
+        self.registry_file = registry_file
+
+    def exists(self) -> bool:
+        """Whether the registry file has been created"""
+        return os.path.exists(self.registry_file)
+
+    def load(self) -> List[Subscriber]:
+        """
+        Load all subscribers
+
+        Returns:
+            List of subscribers (empty if the file does not exist)
+
+        Raises:
+            ValueError: If an entry is invalid
+        """
+        try:
+            with open(self.registry_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+
+        known = {f.name for f in fields(Subscriber)}
+        return [Subscriber(**{k: v for k, v in entry.items() if k in known}) for entry in data]
+
+    def save(self, subscribers: List[Subscriber]):
+        """
+        Replace the registry contents
+
+        Args:
+            subscribers: Subscribers to store
+        """
+        directory = os.path.dirname(self.registry_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = f"{self.registry_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump([asdict(s) for s in subscribers], f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.registry_file)
+
+    def add(self, subscriber: Subscriber):
+        """
+        Add a subscriber, replacing any entry with the same email
+
+        Args:
+            subscriber: Subscriber to add
+        """
+        others = [s for s in self.load() if s.email.lower() != subscriber.email.lower()]
+        self.save(others + [subscriber])
+
+    def remove(self, email: str) -> bool:
+        """
+        Remove a subscriber
+
+        Args:
+            email: Address to remove
+
+        Returns:
+            True if a subscriber was removed
+        """
+        subscribers = self.load()
+        remaining = [s for s in subscribers if s.email.lower() != email.strip().lower()]
+        if len(remaining) == len(subscribers):
+            return False
+        self.save(remaining)
+        return True
+
+    def active(self) -> List[Subscriber]:
+        """Subscribers that should receive issues"""
+        return [s for s in self.load() if s.active]
+
+    def by_segment(self, subscribers: Optional[List[Subscriber]] = None) -> Dict[Segment, List[Subscriber]]:
+        """
+        Group subscribers by segment
+
+        Args:
+            subscribers: Subscribers to group (defaults to the active ones)
+
+        Returns:
+            Mapping of segment to its subscribers, in registry order
+        """
+        groups: Dict[Segment, List[Subscriber]] = {}
+        for subscriber in self.active() if subscribers is None else subscribers:
+            groups.setdefault(subscriber.segment, []).append(subscriber)
+        return groups
@@ -11,9 +11,26 @@ import os
 # Add src directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from src.storage import ConceptStorage
-from src.email_template import EmailTemplate
+from src.storage import ConceptStorage, JSONStorageBackend, SQLiteStorageBackend
+from src.email_template import CompiledTemplate, EmailTemplate
 from src.ai_generator import AIConceptGenerator
+from src.email_sender import EmailSender
+from src.diversity import ConceptSelector, HashingEmbedder
+from src.dedup import DuplicateGate, NearDuplicateIndex, normalize_title
+from src.history import HistoryCompactor, estimate_tokens
+from src.document import BulletList, IncrementalParser, parse_markdown, render_html, render_text
+from src.metrics import Metrics
+from src.checkpoint import CheckpointStore, checkpoint_key
+from src.email_sender import SendResult
+from src.ratelimit import (AdaptiveTokenBucket, ApiGuard, CircuitBreaker, CircuitOpenError,
+                           RateLimiter, TokenBucket, backoff_delay, parse_retry_after,
+                           provider_for)
+from src.ai_generator import APIError
+from src.scheduler import FanOutScheduler, issue_key
+from src.subscribers import Segment, Subscriber, SubscriberRegistry
+from src.backlog import BacklogFiller, IssueBacklog, build_issues
+from src.archive import IssueArchive
+from src.search import ConceptIndex, stem, tokenize
 
 
 class TestConceptStorage(unittest.TestCase):
@@ -58,6 +75,52 @@ class TestConceptStorage(unittest.TestCase):
         recent = self.storage.get_recent_concepts(count=10)
         self.assertEqual(len(recent), 10)
         self.assertEqual(recent[-1], "Concept 99")
+    
+    def test_backend_selection(self):
+        """Test that the default backend for a .json path is JSON"""
+        self.assertIsInstance(self.storage.backend, JSONStorageBackend)
+        self.assertEqual(self.storage.count(), 0)
+
+
+class TestSQLiteConceptStorage(unittest.TestCase):
+    """Test ConceptStorage with the SQLite backend"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_file = os.path.join(self.tmp_dir.name, 'concepts.json')
+        self.storage = None
+    
+    def tearDown(self):
+        """Clean up test files"""
+        if self.storage is not None:
+            self.storage.close()
+        self.tmp_dir.cleanup()
+    
+    def test_append_trim_and_tail(self):
+        """Test appends, the storage limit and tail reads"""
+        self.storage = ConceptStorage(self.json_file, backend='sqlite')
+        self.assertIsInstance(self.storage.backend, SQLiteStorageBackend)
+        
+        self.storage.add_concepts([f"Concept {i}" for i in range(80)], max_stored=100)
+        self.storage.add_concepts([f"Concept {i}" for i in range(80, 150)], max_stored=100)
+        
+        self.assertEqual(self.storage.count(), 100)
+        self.assertEqual(self.storage.load_concepts()[0], "Concept 50")
+        self.assertEqual(self.storage.get_recent_concepts(count=3),
+                         ["Concept 147", "Concept 148", "Concept 149"])
+    
+    def test_migrates_existing_json(self):
+        """Test that JSON history is imported into an empty database once"""
+        ConceptStorage(self.json_file).add_concepts(["Concept A", "Concept B"])
+        
+        self.storage = ConceptStorage(self.json_file, backend='sqlite')
+        self.assertEqual(self.storage.load_concepts(), ["Concept A", "Concept B"])
+        self.storage.close()
+        
+        self.storage = ConceptStorage(self.json_file, backend='sqlite')
+        self.assertEqual(self.storage.count(), 2)
 
 
 class TestEmailTemplate(unittest.TestCase):
@@ -89,6 +152,38 @@ This is a test concept with **bold text**.
         self.assertIn("<strong>", formatted)
         self.assertIn("</strong>", formatted)
         self.assertIn("bold text", formatted)
+    
+    def test_compiled_template_splices_slots(self):
+        """Test that a compiled template joins static chunks and slot values"""
+        template = CompiledTemplate("<p>{{greeting}}, {{name}}!</p>")
+        
+        self.assertEqual(template.slots, ["greeting", "name"])
+        self.assertEqual(template.render(greeting="Hi", name=b"Ada"), "<p>Hi, Ada!</p>")
+        with self.assertRaises(KeyError):
+            template.render(greeting="Hi")
+    
+    def test_create_html_emails_personalizes_each_recipient(self):
+        """Test per-recipient personalization with a shared body"""
+        with patch.object(EmailTemplate, '_format_content',
+                          wraps=EmailTemplate._format_content) as formatter:
+            emails = EmailTemplate.create_html_emails(
+                "# Test Concept\n\nBody",
+                ["Ada Lovelace", "Alan <Turing>"],
+                date="January 01, 2026"
+            )
+        
+        formatter.assert_called_once()
+        self.assertEqual(len(emails), 2)
+        self.assertIn("Hello Ada!", emails[0])
+        self.assertIn("Curated for Ada Lovelace", emails[0])
+        self.assertIn("Curated for Alan &lt;Turing&gt;", emails[1])
+        self.assertIn("January 01, 2026", emails[1])
+        self.assertNotIn("{{", emails[0])
+    
+    def test_default_recipient(self):
+        """Test that the single-recipient API keeps the default greeting"""
+        html = EmailTemplate.create_html_email("# Test Concept", date="Today")
+        self.assertIn("Hello Moussaab!", html)
 
 
 class TestAIConceptGenerator(unittest.TestCase):
@@ -128,6 +223,1823 @@ Even more text"""
         titles = AIConceptGenerator.extract_concept_titles(content)
         self.assertGreater(len(titles), 0)
         self.assertTrue(all(isinstance(t, str) for t in titles))
+    
+    @staticmethod
+    def _ok_response(content):
+        response = Mock(status_code=200)
+        response.json.return_value = {"choices": [{"message": {"content": content}}]}
+        return response
+    
+    def test_generate_concepts_reuses_session(self):
+        """Test that requests go through the shared keep-alive session"""
+        session = Mock()
+        session.post.return_value = self._ok_response("# Concept")
+        self.generator._session = session
+        
+        self.generator.generate_concepts([])
+        self.generator.generate_concepts(["Concept"])
+        
+        self.assertEqual(session.post.call_count, 2)
+    
+    def test_generate_many_runs_concurrently(self):
+        """Test that generate_many overlaps requests up to the concurrency limit"""
+        import threading
+        import time
+        
+        generator = AIConceptGenerator(
+            api_key="test_key",
+            api_url="https://test.api",
+            model="test_model",
+            max_concurrency=3
+        )
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+        
+        def fake_post(url, json, timeout):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.05)
+            with lock:
+                state["active"] -= 1
+            return self._ok_response(json["messages"][0]["content"][-10:])
+        
+        generator._session = Mock()
+        generator._session.post.side_effect = fake_post
+        
+        results = generator.generate_many([[f"Topic {i}"] for i in range(6)])
+        
+        self.assertEqual(len(results), 6)
+        self.assertEqual(state["peak"], 3)
+    
+    def test_complete_many_inside_an_event_loop_reports_batch_usage(self):
+        """Test that complete_many works under a running loop and sums the usage of its requests"""
+        import asyncio
+        
+        generator = AIConceptGenerator(api_key="k", api_url="https://test.api", model="m")
+        
+        def fake_post(url, json, timeout):
+            prompt = json["messages"][0]["content"]
+            response = self._ok_response(prompt.upper())
+            response.json.return_value["usage"] = {"prompt_tokens": len(prompt), "total_tokens": 10}
+            return response
+        
+        generator._session = Mock()
+        generator._session.post.side_effect = fake_post
+        
+        async def caller():
+            return generator.complete_many(["a", "bb", "ccc"])
+        
+        self.assertEqual(asyncio.run(caller()), ["A", "BB", "CCC"])
+        self.assertEqual(generator.last_usage, {"prompt_tokens": 6, "total_tokens": 30})
+    
+    def test_stream_concepts_parses_server_sent_events(self):
+        """Test that streamed deltas are parsed into concepts as they arrive"""
+        import json
+        deltas = ["## 1. Liquid Neural", " Networks\nBody one\n", "## 2. Sparse Experts\n", "Body two"]
+        lines = [""] + [
+            "data: " + json.dumps({"choices": [{"delta": {"content": d}}]}) for d in deltas
+        ] + [": keep-alive", "data: [DONE]"]
+        response = MagicMock(status_code=200, encoding="utf-8")
+        response.__enter__.return_value = response
+        response.iter_lines.return_value = iter(lines)
+        self.generator._session = Mock()
+        self.generator._session.post.return_value = response
+        
+        titles = [c.title for c in self.generator.stream_concepts([], idle_timeout=5)]
+        
+        self.assertEqual(titles, ["Liquid Neural Networks", "Sparse Experts"])
+        self.assertEqual(self.generator.last_stream_text, "".join(deltas))
+        kwargs = self.generator._session.post.call_args.kwargs
+        self.assertTrue(kwargs["stream"])
+        self.assertTrue(kwargs["json"]["stream"])
+        self.assertEqual(kwargs["timeout"][1], 5)
+    
+    def test_agenerate_concepts_retries_without_blocking(self):
+        """Test that async retries recover from network errors"""
+        import asyncio
+        from requests.exceptions import ConnectionError as RequestsConnectionError
+        
+        generator = AIConceptGenerator(
+            api_key="test_key",
+            api_url="https://test.api",
+            model="test_model",
+            retry_delay=0
+        )
+        generator._session = Mock()
+        generator._session.post.side_effect = [
+            RequestsConnectionError("reset"),
+            self._ok_response("# Recovered")
+        ]
+        
+        content = asyncio.run(generator.agenerate_concepts([]))
+        self.assertEqual(content, "# Recovered")
+    
+    def test_parse_topics(self):
+        """Test that names are read from numbered, bulleted and heading lists"""
+        content = """Here are the topics:
+1. Retrieval-Augmented Generation - grounding answers in documents
+2) **Mixture of Experts**
+- Speculative Decoding: faster inference
+## 4. RLHF
+- Key Points
+5. retrieval-augmented generation"""
+        
+        self.assertEqual(AIConceptGenerator.parse_topics(content),
+                         ["Retrieval-Augmented Generation", "Mixture of Experts",
+                          "Speculative Decoding", "RLHF"])
+    
+    def test_parallel_generation_expands_each_topic_concurrently(self):
+        """Test one short topics request, then one request per chosen topic merged in order"""
+        import re
+        import threading
+        
+        lock = threading.Lock()
+        payloads = []
+        
+        def fake_post(url, json, timeout):
+            prompt = json["messages"][0]["content"]
+            with lock:
+                payloads.append(json)
+            if "names only" in prompt:
+                return self._ok_response("1. Graph Neural Networks\n2. Old Topic\n3. Diffusion Models\n4. State Space Models")
+            topic = re.search(r"concept in artificial intelligence: (.+)", prompt).group(1)
+            return self._ok_response(f"## 1. {topic}\n\n**Definition:** About {topic}.")
+        
+        generator = AIConceptGenerator(api_key="k", api_url="https://test.api", model="m", max_tokens=2000)
+        generator._session = Mock()
+        generator._session.post.side_effect = fake_post
+        
+        text = generator.generate_concepts_parallel(
+            ["Old Topic"], count=3, candidates=4,
+            choose=lambda topics, k: [t for t in topics if t != "Old Topic"],
+            concept_max_tokens=500
+        )
+        
+        self.assertEqual(AIConceptGenerator.extract_concept_titles(text),
+                         ["Graph Neural Networks", "Diffusion Models", "State Space Models"])
+        self.assertIn("## 3. State Space Models", text)
+        self.assertEqual(len(payloads), 4)
+        self.assertLess(payloads[0]["max_tokens"], 500)
+        self.assertEqual({p["max_tokens"] for p in payloads[1:]}, {500})
+    
+    def test_parallel_generation_falls_back_to_one_request(self):
+        """Test that too few usable topics fall back to the single-request path"""
+        generator = AIConceptGenerator(api_key="k", api_url="https://test.api", model="m")
+        generator._session = Mock()
+        generator._session.post.side_effect = [
+            self._ok_response("1. Only One Topic"),
+            self._ok_response("## 1. Concept A\n\nBody\n\n## 2. Concept B\n\nBody")
+        ]
+        
+        text = generator.generate_concepts_parallel([], count=2)
+        
+        self.assertIn("Concept B", text)
+        prompt = generator._session.post.call_args.kwargs["json"]["messages"][0]["content"]
+        self.assertIn("2 NEW concepts", prompt)
+
+
+
+class TestEmailSender(unittest.TestCase):
+    """Test EmailSender class"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.sender = EmailSender(
+            smtp_server="smtp.test",
+            smtp_port=465,
+            from_email="from@test.com",
+            app_password="secret",
+            pool_size=2,
+            max_messages_per_connection=2
+        )
+    
+    def tearDown(self):
+        """Close pooled connections"""
+        self.sender.close()
+    
+    @patch('src.email_sender.smtplib.SMTP_SSL')
+    def test_connection_is_reused(self, mock_smtp):
+        """Test that consecutive sends share one logged-in connection"""
+        mock_smtp.return_value.sendmail.return_value = {}
+        self.sender.send_html_email("a@test.com", "Subject", "<p>Hi</p>")
+        self.sender.send_plain_email("b@test.com", "Subject", "Hi")
+        
+        self.assertEqual(mock_smtp.call_count, 1)
+        self.assertEqual(mock_smtp.return_value.login.call_count, 1)
+        self.assertEqual(mock_smtp.return_value.sendmail.call_count, 2)
+    
+    @patch('src.email_sender.smtplib.SMTP_SSL')
+    def test_message_cap_recycles_connection(self, mock_smtp):
+        """Test that a connection is replaced after its message cap"""
+        mock_smtp.return_value.sendmail.return_value = {}
+        for i in range(3):
+            self.sender.send_html_email(f"{i}@test.com", "Subject", "<p>Hi</p>")
+        
+        self.assertEqual(mock_smtp.call_count, 2)
+        mock_smtp.return_value.quit.assert_called_once()
+    
+    @patch('src.email_sender.smtplib.SMTP_SSL')
+    def test_reconnect_on_disconnect(self, mock_smtp):
+        """Test that a dropped connection is replaced and the send retried"""
+        import smtplib
+        mock_smtp.return_value.sendmail.side_effect = [
+            smtplib.SMTPServerDisconnected("gone"),
+            {}
+        ]
+        self.sender.send_html_email("a@test.com", "Subject", "<p>Hi</p>")
+        
+        self.assertEqual(mock_smtp.call_count, 2)
+    
+    @patch('src.email_sender.smtplib.SMTP_SSL')
+    def test_421_reply_discards_the_connection(self, mock_smtp):
+        """Test that a connection closed with 421 is not handed out again, unlike one that got a 550"""
+        import smtplib
+        mock_smtp.return_value.sendmail.side_effect = [
+            smtplib.SMTPRecipientsRefused({"a@test.com": (550, b"No such user")}),
+            smtplib.SMTPDataError(421, b"Service shutting down"),
+            {}
+        ]
+        pool = self.sender.pool
+        for _ in range(2):
+            with self.assertRaises(smtplib.SMTPException):
+                pool.sendmail("from@test.com", "a@test.com", b"Hi")
+            self.assertEqual(mock_smtp.call_count, 1)
+        pool.sendmail("from@test.com", "a@test.com", b"Hi")
+        
+        self.assertEqual(mock_smtp.call_count, 2)
+    
+    def test_prepared_body_decodes_to_the_rendered_email(self):
+        """Test that spliced quoted-printable parts parse back to the rendered HTML"""
+        import email
+        from email import policy
+        from src.email_sender import PreparedBody
+        content = "## 1. Attention\n\n" + "Long line with ünïcode and = signs. " * 20
+        issue = EmailTemplate.compiled_issue(content, date="January 01, 2026")
+        body = PreparedBody.from_template(issue)
+        slots = EmailTemplate.recipient_slots("Zoë Ångström")
+        
+        data = body.message_bytes("from@test.com", "zoe@test.com", "Daily ✨ AI", **slots)
+        parsed = email.message_from_bytes(data, policy=policy.default)
+        self.assertEqual(parsed['Subject'], "Daily ✨ AI")
+        self.assertEqual(parsed['To'], "zoe@test.com")
+        html_part = parsed.get_body(('html',))
+        # Line breaks travel as CRLF, the canonical form for text parts
+        self.assertEqual(html_part.get_content().replace("\r\n", "\n"), issue.render(**slots))
+        self.assertEqual(html_part['Content-Transfer-Encoding'], "quoted-printable")
+        self.assertTrue(all(len(line) <= 76 for line in data.split(b"\r\n")))
+        self.assertNotIn(b"\n", data.replace(b"\r\n", b""))
+        with self.assertRaises(ValueError):
+            body.message_bytes("from@test.com", "x@test.com\r\nBcc: y@test.com", "S", **slots)
+    
+    @patch('src.email_sender.smtplib.SMTP_SSL')
+    def test_send_bulk_reports_per_recipient(self, mock_smtp):
+        """Test bulk sending returns one result per recipient"""
+        import smtplib
+        
+        def fake_sendmail(from_addr, to_addr, msg):
+            if to_addr == "bad@test.com":
+                raise smtplib.SMTPRecipientsRefused({to_addr: (550, b"No such user")})
+            return {}
+        
+        mock_smtp.return_value.sendmail.side_effect = fake_sendmail
+        messages = [
+            {"to_email": f"user{i}@test.com", "subject": "S", "html_content": "<p>Hi</p>"}
+            for i in range(5)
+        ]
+        messages.append({"to_email": "bad@test.com", "subject": "S", "html_content": "<p>Hi</p>"})
+        
+        results = self.sender.send_bulk(messages)
+        
+        self.assertEqual([r.to_email for r in results], [m["to_email"] for m in messages])
+        self.assertTrue(all(r.success for r in results[:5]))
+        self.assertFalse(results[-1].success)
+        self.assertIn("bad@test.com", results[-1].refused)
+        self.assertLessEqual(mock_smtp.call_count, 4)
+
+
+
+class TestConceptSelector(unittest.TestCase):
+    """Test ConceptSelector class"""
+    
+    def test_embeddings_are_normalized(self):
+        """Test that embeddings are unit length and similar titles score high"""
+        vectors = HashingEmbedder().embed([
+            "AI-Driven Cultural Heritage Synthesis",
+            "AI-Augmented Computational Creativity for Cultural Heritage",
+            "Zero-Knowledge Proofs for Model Verification"
+        ])
+        
+        self.assertAlmostEqual(float((vectors[0] ** 2).sum()), 1.0, places=5)
+        self.assertGreater(vectors[0] @ vectors[1], vectors[0] @ vectors[2])
+    
+    def test_select_avoids_near_copies_and_history(self):
+        """Test that MMR drops near-duplicates and concepts already sent"""
+        titles = [
+            "AI-Driven Cultural Heritage Synthesis",
+            "AI-Augmented Cultural Heritage Synthesis",
+            "Neuro-Symbolic AI Integration",
+            "Federated Learning at the Edge",
+            "Sparse Mixture of Experts",
+            "Retrieval-Augmented Generation",
+        ]
+        history = ["Neuro-Symbolic AI Integration"]
+        
+        keep = ConceptSelector().select(titles, history, k=4)
+        
+        self.assertEqual(len(keep), 4)
+        self.assertNotIn(2, keep)
+        self.assertFalse(0 in keep and 1 in keep)
+    
+    def test_select_concepts_rebuilds_content(self):
+        """Test that selection keeps whole sections and renumbers them"""
+        content = "Here are 6 concepts.\n\n" + "\n\n".join(
+            f"## {i}. Topic Number {word}\n\nBody {i}\n- Point"
+            for i, word in enumerate(["Alpha", "Beta", "Gamma", "Delta", "Epsilon", "Zeta"], 1)
+        )
+        
+        selected = ConceptSelector().select_concepts(content, [], k=5)
+        titles = AIConceptGenerator.extract_concept_titles(selected, limit=10)
+        
+        self.assertEqual(len(titles), 5)
+        self.assertNotIn("Here are 6 concepts", selected)
+        self.assertTrue(selected.startswith("## 1. "))
+        self.assertIn("## 5. ", selected)
+    
+    def test_sliding_history_embeds_only_new_titles(self):
+        """Test that a shared selector re-embeds only titles added since the last run"""
+        from src.diversity import shared_concept_selector
+        
+        class CountingEmbedder(HashingEmbedder):
+            embedded = 0
+            
+            def embed(self, texts):
+                CountingEmbedder.embedded += len(texts)
+                return super().embed(texts)
+        
+        selector = ConceptSelector(embedder=CountingEmbedder())
+        history = [f"Concept {i}" for i in range(100)]
+        selector._embed_history(history)
+        matrix = selector._embed_history(history[5:] + ["New One", "New Two"])
+        
+        self.assertEqual(CountingEmbedder.embedded, 102)
+        self.assertEqual(matrix.shape[0], 97)
+        self.assertEqual(matrix.tolist(), HashingEmbedder().embed(history[5:] + ["New One", "New Two"]).tolist())
+        self.assertIs(shared_concept_selector("ai-en"), shared_concept_selector("ai-en"))
+        self.assertIsNot(shared_concept_selector("ai-en"), shared_concept_selector("ai-fr"))
+    
+    def test_select_concepts_ignores_numbered_key_points(self):
+        """Test that numbered key points are never selected as concepts"""
+        names = ["Federated Learning", "Diffusion Models", "Mixture of Experts", "Graph Neural Networks",
+                 "Retrieval-Augmented Generation", "Neural Radiance Fields", "Liquid Neural Networks",
+                 "Constitutional Training"]
+        content = "Here are 8 concepts.\n\n" + "\n\n".join(
+            f"{i}. {name}\nA short definition of {name}.\n\nKey Points:\n"
+            f"1. Reduces cost at scale\n2. Improves {name.split()[0]} quality\n3. Easy to deploy"
+            for i, name in enumerate(names, 1)
+        )
+        
+        selected = ConceptSelector().select_concepts(content, ["Federated Learning"], k=5)
+        titles = AIConceptGenerator.extract_concept_titles(selected, limit=10)
+        
+        self.assertEqual(len(titles), 5)
+        self.assertTrue(set(titles) <= set(names))
+        self.assertNotIn("Federated Learning", titles)
+        self.assertEqual(selected.count("Reduces cost at scale"), 5)
+
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+    """Test NearDuplicateIndex and DuplicateGate classes"""
+    
+    def test_normalize_title_strips_prompt_prefixes(self):
+        """Test that boilerplate prefixes do not hide repeats"""
+        self.assertEqual(
+            normalize_title("Concept Name Zero-Knowledge AI Verification Protocols"),
+            normalize_title("Zero-Knowledge AI Verification Protocols")
+        )
+        self.assertEqual(normalize_title("Continual Self-Supervised Learning (CSSL)"),
+                         "continual self supervised learning")
+    
+    def test_query_finds_near_duplicates_only(self):
+        """Test near-duplicate lookup against indexed history"""
+        index = NearDuplicateIndex.from_titles([
+            "Concept Name Zero-Knowledge AI Verification Protocols",
+            "Neuro-Symbolic AI Integration",
+            "AI-Driven Digital Forensics",
+        ])
+        
+        self.assertTrue(index.is_duplicate("Zero-Knowledge AI Verification Protocol"))
+        self.assertTrue(index.is_duplicate("Neuro Symbolic AI Integration"))
+        self.assertFalse(index.is_duplicate("Sparse Mixture of Experts"))
+        self.assertEqual(len(index), 3)
+    
+    def test_gate_regenerates_only_rejected_slots(self):
+        """Test that only duplicate sections are replaced"""
+        content = "\n\n".join([
+            "## 1. Neuro-Symbolic AI Integration\n\nOld topic.",
+            "## 2. Sparse Mixture of Experts\n\nFresh topic.",
+            "## 3. Sparse Mixtures of Experts\n\nSame as above.",
+        ])
+        generator = Mock()
+        generator.regenerate_concepts.return_value = (
+            "## 1. Liquid Neural Networks\n\nNew.\n\n## 2. Test-Time Compute Scaling\n\nNew."
+        )
+        gate = DuplicateGate(NearDuplicateIndex.from_titles(["Neuro-Symbolic AI Integration"]))
+        
+        result = gate.enforce(content, generator)
+        titles = AIConceptGenerator.extract_concept_titles(result)
+        
+        generator.regenerate_concepts.assert_called_once()
+        rejected, avoid = generator.regenerate_concepts.call_args[0]
+        self.assertEqual(rejected, ["Neuro-Symbolic AI Integration", "Sparse Mixtures of Experts"])
+        self.assertIn("Sparse Mixture of Experts", avoid)
+        self.assertEqual(titles, ["Liquid Neural Networks", "Sparse Mixture of Experts",
+                                  "Test-Time Compute Scaling"])
+        self.assertIn("## 3. Test-Time Compute Scaling", result)
+
+
+
+class TestHistoryCompactor(unittest.TestCase):
+    """Test HistoryCompactor class"""
+    
+    def test_small_history_is_verbatim_without_noise(self):
+        """Test that short histories keep titles and drop junk entries"""
+        compact = HistoryCompactor(token_budget=100).compact(
+            ["Neural Networks", "Relevant Example", "Concept Name Deep Learning", "Neural Networks"]
+        )
+        
+        self.assertEqual(compact.text, "Deep Learning, Neural Networks")
+        self.assertEqual(compact.dropped, 2)
+    
+    def test_long_history_fits_budget_with_groups(self):
+        """Test that long histories are summarized within the token budget"""
+        topics = ["Quantum", "Healthcare", "Robotics", "Climate", "Finance"]
+        history = [f"AI-Driven {topics[i % 5]} Optimization Variant {i}" for i in range(300)]
+        history += ["Relevant Example"] * 20
+        
+        compact = HistoryCompactor(token_budget=120).compact(history)
+        
+        self.assertLessEqual(compact.estimated_tokens, 120)
+        self.assertGreater(compact.raw_tokens, 1000)
+        self.assertIn("Themes already covered", compact.text)
+        self.assertIn("Variant 299", compact.text)
+        self.assertNotIn("Relevant Example", compact.text)
+        self.assertTrue(compact.groups)
+    
+    def test_prompt_reports_estimated_size(self):
+        """Test that the generator records the prompt size"""
+        generator = AIConceptGenerator(
+            api_key="test_key",
+            api_url="https://test.api",
+            model="test_model",
+            history_token_budget=50
+        )
+        prompt = generator._create_prompt([f"Topic {i} of Interest" for i in range(200)])
+        
+        self.assertEqual(generator.last_prompt_tokens, estimate_tokens(prompt))
+        self.assertLessEqual(generator.last_history.estimated_tokens, 50)
+
+
+
+class TestDocument(unittest.TestCase):
+    """Test the shared Markdown document parser"""
+    
+    CONTENT = """Intro line
+
+## 1. **Liquid Neural Networks**
+
+**Definition:** Networks with <adaptive> dynamics.
+
+### Key Points
+- Point **one**
+- Point two
+
+### Relevant Example
+Robots.
+
+2. Sparse Experts
+Body"""
+    
+    def test_section_labels_stay_inside_concepts(self):
+        """Test that labels like Key Points are not treated as concepts"""
+        doc = parse_markdown(self.CONTENT)
+        
+        self.assertEqual(doc.titles(), ["Liquid Neural Networks", "Sparse Experts"])
+        self.assertEqual(AIConceptGenerator.extract_concept_titles(self.CONTENT), doc.titles())
+        self.assertIn("Robots.", doc.concepts[0].source)
+    
+    def test_numbered_key_points_stay_inside_concepts(self):
+        """Test that numbered key points are ordered list items, not concepts"""
+        content = """1. Federated Learning
+Training across devices without pooling data.
+
+Key Points:
+1. Reduces cost at scale
+2. Keeps data private
+
+2. Diffusion Models
+Generating samples by reversing noise.
+
+Key Points:
+
+1. Stable training
+
+3. Mixture of Experts
+Routing tokens to specialised subnetworks.
+1. Reduces cost at scale"""
+        doc = parse_markdown(content)
+        
+        self.assertEqual(doc.titles(), ["Federated Learning", "Diffusion Models", "Mixture of Experts"])
+        lists = [block for block in doc.concepts[0].blocks if isinstance(block, BulletList)]
+        self.assertEqual(lists[0].items, ["Reduces cost at scale", "Keeps data private"])
+        self.assertTrue(lists[0].ordered)
+        self.assertIn("<ol>", render_html(doc))
+        self.assertIn("Stable training", doc.concepts[1].source)
+    
+    def test_render_html_escapes_and_bolds(self):
+        """Test HTML rendering escapes content and converts bold spans"""
+        html = render_html(parse_markdown(self.CONTENT))
+        
+        self.assertEqual(html.count('<div class="concept-card">'), 3)
+        self.assertIn("&lt;adaptive&gt;", html)
+        self.assertIn("<strong>Definition:</strong>", html)
+        self.assertIn("<li>Point <strong>one</strong></li>", html)
+        self.assertEqual(html, EmailTemplate._format_content(self.CONTENT))
+    
+    def test_unbalanced_bold_is_left_literal(self):
+        """Test that a stray ** does not open an unclosed tag"""
+        html = EmailTemplate._format_content("Costs ** nothing")
+        self.assertNotIn("<strong>", html)
+        self.assertIn("**", html)
+    
+    def test_incremental_parser_matches_full_parse(self):
+        """Test that chunked parsing yields each concept once it is complete"""
+        parser = IncrementalParser()
+        completed = []
+        # A numbered heading is confirmed by the line after it
+        content = self.CONTENT + "\n"
+        for i in range(0, len(content), 7):
+            completed.extend(concept.title for concept in parser.feed(content[i:i + 7]))
+            if i < self.CONTENT.index("2. Sparse"):
+                self.assertEqual(completed, [])
+        self.assertEqual(completed, ["Liquid Neural Networks"])
+        
+        completed.extend(concept.title for concept in parser.close())
+        self.assertEqual(completed, ["Liquid Neural Networks", "Sparse Experts"])
+        self.assertEqual(render_html(parser.doc), render_html(parse_markdown(self.CONTENT)))
+    
+    def test_rendered_cards_are_reused(self):
+        """Test that cards rendered during streaming are spliced in unchanged"""
+        doc = parse_markdown(self.CONTENT)
+        cards = {doc.concepts[0].source: "<div>cached</div>"}
+        
+        html = render_html(doc, cards)
+        self.assertIn("<div>cached</div>", html)
+        self.assertIn("<h3>2. Sparse Experts</h3>", html)
+    
+    def test_render_text(self):
+        """Test plain-text rendering"""
+        text = render_text(parse_markdown(self.CONTENT))
+        
+        self.assertIn("1. Liquid Neural Networks", text)
+        self.assertIn("  • Point one", text)
+        self.assertNotIn("**", text)
+
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for Metrics"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        import tempfile
+        self.metrics = Metrics()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_dir = self.tmp_dir.name
+    
+    def tearDown(self):
+        """Clean up test fixtures"""
+        self.tmp_dir.cleanup()
+    
+    def test_span_nesting_and_errors(self):
+        """Test that spans record their parent and failures"""
+        with self.metrics.span('stage.generate'):
+            with self.metrics.span('http.request', attempt=1) as attrs:
+                attrs['status_code'] = 200
+        with self.assertRaises(RuntimeError):
+            with self.metrics.span('stage.send'):
+                raise RuntimeError("boom")
+        
+        request = self.metrics.spans('http.request')[0]
+        self.assertEqual(request['parent'], 'stage.generate')
+        self.assertEqual(request['attrs'], {'attempt': 1, 'status_code': 200})
+        send = self.metrics.spans('stage.send')[0]
+        self.assertEqual(send['status'], 'error')
+        self.assertIn("boom", send['error'])
+    
+    def test_usage_and_exports(self):
+        """Test token counters, JSONL output and Prometheus output"""
+        import json
+        self.metrics.record_usage({'prompt_tokens': 100, 'completion_tokens': 40, 'total_tokens': 140}, model="sonar")
+        self.metrics.record_usage({'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}, model="sonar")
+        with self.metrics.span('stage.render'):
+            pass
+        
+        jsonl_file = os.path.join(self.test_dir, 'metrics.jsonl')
+        self.metrics.write_jsonl(jsonl_file)
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual({r['run_id'] for r in records}, {self.metrics.run_id})
+        counter = next(r for r in records if r['type'] == 'counter' and r['labels']['kind'] == 'prompt')
+        self.assertEqual(counter['value'], 110)
+        
+        prom_file = os.path.join(self.test_dir, 'metrics.prom')
+        self.metrics.write_prometheus(prom_file)
+        with open(prom_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+        self.assertIn('ai_insight_daily_tokens_total{kind="completion",model="sonar"} 45', text)
+        self.assertIn('ai_insight_daily_span_duration_seconds_count{span="stage.render",status="ok"} 1', text)
+
+
+class TestCheckpoints(unittest.TestCase):
+    """Test cases for stage checkpoints and resumed runs"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = CheckpointStore(os.path.join(self.tmp_dir.name, 'checkpoints'))
+    
+    def tearDown(self):
+        """Clean up test fixtures"""
+        self.tmp_dir.cleanup()
+    
+    def test_keys_and_get_or_compute(self):
+        """Test that outputs are keyed by their inputs and computed once"""
+        key = checkpoint_key('generate', '2026-01-01', ['A', 'B'])
+        self.assertEqual(key, checkpoint_key('generate', '2026-01-01', ['A', 'B']))
+        self.assertNotEqual(key, checkpoint_key('generate', '2026-01-01', ['A', 'C']))
+        
+        compute = Mock(return_value="## 1. Concept")
+        self.assertEqual(self.store.get_or_compute('generate', key, compute), ("## 1. Concept", False))
+        self.assertEqual(self.store.get_or_compute('generate', key, compute), ("## 1. Concept", True))
+        compute.assert_called_once()
+        
+        self.assertIsNone(self.store.sent_marker('issue'))
+        self.store.mark_sent('issue', key, ['Concept'])
+        self.assertFalse(self.store.sent_marker('issue')['stored'])
+        self.store.mark_sent('issue', key, ['Concept'], stored=True)
+        self.assertTrue(self.store.sent_marker('issue')['stored'])
+    
+    def test_failed_send_resumes_without_regenerating(self):
+        """Test that a rerun after a failed send reuses the content and never sends twice"""
+        import main
+        
+        overrides = {
+            'perplexity_api_key': 'key', 'from_email': 'from@example.com',
+            'to_email': 'to@example.com', 'app_password': 'pw',
+            'storage_file': os.path.join(self.tmp_dir.name, 'concepts.json'),
+            'storage_backend': 'json',
+            'checkpoint_dir': self.store.directory,
+            'archive_dir': os.path.join(self.tmp_dir.name, 'archive'),
+            'search_index_file': os.path.join(self.tmp_dir.name, 'search.db'),
+            'metrics_jsonl_file': os.path.join(self.tmp_dir.name, 'metrics.jsonl'),
+            'metrics_prometheus_file': os.path.join(self.tmp_dir.name, 'metrics.prom'),
+        }
+        content = "## 1. Liquid Neural Networks\n\nBody text."
+        sender = MagicMock()
+        sender.__enter__.return_value = sender
+        sender.send_html_email.side_effect = [Exception("Failed to send email: timeout"), True]
+        
+        with patch.multiple(main.config, **overrides), \
+                patch.object(main, 'generate_issue', return_value=content) as generate, \
+                patch.object(main, 'EmailSender', return_value=sender), \
+                patch('builtins.print'):
+            self.assertEqual(main.main(), 1)
+            self.assertEqual(main.main(), 0)
+            self.assertEqual(main.main(), 0)
+        
+        generate.assert_called_once()
+        self.assertEqual(sender.send_html_email.call_count, 2)
+        storage = ConceptStorage(overrides['storage_file'])
+        self.assertEqual(storage.load_concepts(), ["Liquid Neural Networks"])
+        self.assertEqual(IssueArchive(overrides['archive_dir']).find_concept(
+            "Liquid Neural Networks")['markdown'], content)
+    
+    def test_resumed_run_archives_an_issue_sent_before_a_crash(self):
+        """Test that a run stopped between send and archive still archives the issue on resume"""
+        import main
+        
+        overrides = {
+            'perplexity_api_key': 'key', 'from_email': 'from@example.com',
+            'to_email': 'to@example.com', 'app_password': 'pw',
+            'storage_file': os.path.join(self.tmp_dir.name, 'concepts.json'),
+            'storage_backend': 'json',
+            'checkpoint_dir': self.store.directory,
+            'archive_dir': os.path.join(self.tmp_dir.name, 'archive'),
+            'search_index_file': os.path.join(self.tmp_dir.name, 'search.db'),
+            'metrics_jsonl_file': os.path.join(self.tmp_dir.name, 'metrics.jsonl'),
+            'metrics_prometheus_file': os.path.join(self.tmp_dir.name, 'metrics.prom'),
+        }
+        content = "## 1. Liquid Neural Networks\n\nBody text."
+        sender = MagicMock()
+        sender.__enter__.return_value = sender
+        archive_issue = main.archive_issue
+        calls = []
+        
+        def crash_once(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise RuntimeError("killed")
+            return archive_issue(*args, **kwargs)
+        
+        with patch.multiple(main.config, **overrides), \
+                patch.object(main, 'generate_issue', return_value=content), \
+                patch.object(main, 'EmailSender', return_value=sender), \
+                patch.object(main, 'archive_issue', side_effect=crash_once), \
+                patch('builtins.print'):
+            self.assertEqual(main.main(), 1)
+            self.assertEqual(main.main(), 0)
+        
+        sender.send_html_email.assert_called_once()
+        self.assertEqual(len(calls), 2)
+        entry = IssueArchive(overrides['archive_dir']).get_issue(calls[1][0])
+        self.assertEqual(entry['response'], content)
+        self.assertIn("Liquid Neural Networks", entry['html'])
+    
+    def test_only_config_errors_are_reported_as_configuration_errors(self):
+        """Test that a ValueError from the run itself is reported as a run failure"""
+        import main
+        from src.config import ConfigError
+        
+        metrics_files = {'metrics_jsonl_file': os.path.join(self.tmp_dir.name, 'metrics.jsonl'),
+                         'metrics_prometheus_file': os.path.join(self.tmp_dir.name, 'metrics.prom')}
+        with patch.multiple(main.config, perplexity_api_key='', from_email='', to_email='', app_password='',
+                            **metrics_files), \
+                patch('builtins.print') as printed:
+            self.assertEqual(main.main(), 1)
+        self.assertTrue(any("Configuration Error" in str(c) for c in printed.call_args_list))
+        
+        with patch.multiple(main.config, validate=Mock(), **metrics_files), \
+                patch.object(main, 'ConceptStorage', side_effect=ValueError("corrupt history")), \
+                patch('traceback.print_exc'), \
+                patch('builtins.print') as printed:
+            self.assertEqual(main.main(), 1)
+        output = " ".join(str(c) for c in printed.call_args_list)
+        self.assertIn("Error occurred: corrupt history", output)
+        self.assertNotIn("Configuration Error", output)
+        self.assertTrue(issubclass(ConfigError, ValueError))
+
+
+class TestCLI(unittest.TestCase):
+    """Test cases for the command-line interface"""
+    
+    def test_import_time_budget(self):
+        """Test that a cold CLI start stays within budget and skips heavy modules"""
+        import subprocess
+        import cli
+        
+        src_dir = os.path.join(os.path.dirname(__file__), '..', 'src')
+        code = (
+            "import sys, time, json\n"
+            f"sys.path.insert(0, {src_dir!r})\n"
+            "start = time.perf_counter()\n"
+            "import cli\n"
+            "cli.build_parser()\n"
+            "elapsed = time.perf_counter() - start\n"
+            "print(json.dumps({'elapsed': elapsed, "
+            "'loaded': [m for m in cli.HEAVY_MODULES if m in sys.modules]}))\n"
+        )
+        import json
+        result = json.loads(subprocess.run([sys.executable, '-c', code], capture_output=True,
+                                           text=True, check=True).stdout)
+        
+        self.assertEqual(result['loaded'], [])
+        self.assertLess(result['elapsed'], cli.IMPORT_TIME_BUDGET)
+    
+    def test_package_exports_are_lazy(self):
+        """Test that package attributes resolve on first access"""
+        import src
+        
+        self.assertIs(src.ConceptStorage, ConceptStorage)
+        with self.assertRaises(AttributeError):
+            src.not_a_name
+    
+    def test_render_and_history(self):
+        """Test the render and history subcommands"""
+        import tempfile
+        import cli
+        import config as config_module
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, 'issue.md')
+            output_file = os.path.join(tmp_dir, 'issue.html')
+            storage_file = os.path.join(tmp_dir, 'concepts.json')
+            with open(input_file, 'w', encoding='utf-8') as f:
+                f.write("## 1. Liquid Neural Networks\n\nBody text.")
+            ConceptStorage(storage_file).save_concepts(["A", "B", "C"])
+            
+            with patch('builtins.print') as mock_print:
+                self.assertEqual(cli.main(['render', input_file, '-o', output_file, '--name', 'Ada Lovelace']), 0)
+                with patch.multiple(config_module.config, storage_file=storage_file, storage_backend='json'):
+                    self.assertEqual(cli.main(['history', '--limit', '2']), 0)
+            
+            with open(output_file, 'r', encoding='utf-8') as f:
+                html = f.read()
+            self.assertIn("Liquid Neural Networks", html)
+            self.assertIn("Ada", html)
+            printed = [c.args[0] for c in mock_print.call_args_list if c.args]
+            self.assertEqual(printed[-2:], ["B", "C"])
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for token buckets and provider rate limits"""
+    
+    def setUp(self):
+        """Set up a fake clock"""
+        self.now = [0.0]
+        self.clock = lambda: self.now[0]
+        self.sleep = lambda seconds: self.now.__setitem__(0, self.now[0] + seconds)
+    
+    def test_token_bucket(self):
+        """Test bursts up to capacity, then waiting at the refill rate"""
+        bucket = TokenBucket(2, capacity=2, clock=self.clock, sleep=self.sleep)
+        
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+        self.assertAlmostEqual(bucket.acquire(), 0.5)
+        self.assertEqual(TokenBucket(0).try_acquire(100), 0.0)
+    
+    def test_provider_limits(self):
+        """Test that recipients are limited per provider and globally"""
+        self.assertEqual(provider_for("a@GoogleMail.com"), "gmail")
+        self.assertEqual(provider_for("a@example.org"), "example.org")
+        limiter = RateLimiter(10, {'gmail': 1}, default_provider_rate=0,
+                              clock=self.clock, sleep=self.sleep)
+        
+        limiter.acquire("a@gmail.com")
+        limiter.acquire("b@example.org")
+        self.assertEqual(self.now[0], 0.0)
+        self.assertAlmostEqual(limiter.acquire("c@gmail.com"), 1.0)
+
+
+class TestApiResilience(unittest.TestCase):
+    """Test backoff, adaptive rate limiting and the circuit breaker"""
+    
+    def setUp(self):
+        """Set up a fake clock"""
+        self.now = [0.0]
+        self.clock = lambda: self.now[0]
+        self.sleep = lambda seconds: self.now.__setitem__(0, self.now[0] + seconds)
+    
+    def test_backoff_and_retry_after(self):
+        """Test jittered exponential backoff and Retry-After parsing"""
+        self.assertEqual(backoff_delay(3, 1.0, 60.0, rng=lambda: 0.0), 2.0)
+        self.assertLess(backoff_delay(3, 1.0, 60.0, rng=lambda: 0.999999), 4.0)
+        self.assertEqual(backoff_delay(10, 1.0, 8.0, rng=lambda: 0.0), 4.0)
+        self.assertEqual(backoff_delay(1, 1.0, 8.0, retry_after=30, rng=lambda: 0.0), 30)
+        self.assertEqual(parse_retry_after("12"), 12.0)
+        self.assertEqual(parse_retry_after("Thu, 01 Jan 1970 00:01:40 GMT", now=40), 60.0)
+        self.assertIsNone(parse_retry_after("soon"))
+    
+    def test_adaptive_bucket(self):
+        """Test that throttling halves the rate and pauses, and successes recover"""
+        bucket = AdaptiveTokenBucket(4, clock=self.clock, sleep=self.sleep)
+        bucket.throttle(retry_after=10)
+        
+        self.assertEqual(bucket.state()['rate'], 2)
+        self.assertEqual(bucket.try_acquire(), 10)
+        self.now[0] = 11
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        bucket.record_success()
+        self.assertAlmostEqual(bucket.state()['rate'], 2.2)
+    
+    def test_circuit_breaker(self):
+        """Test open, half-open probe and close transitions"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=self.clock)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        
+        self.assertEqual(breaker.state, 'open')
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        self.now[0] = 30
+        breaker.before_call()
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+    
+    @staticmethod
+    def _response(status_code, content="", headers=None):
+        response = Mock(status_code=status_code, text="error", headers=headers or {})
+        response.json.return_value = {"choices": [{"message": {"content": content}}]}
+        return response
+    
+    def _generator(self, **kwargs):
+        guard = ApiGuard(AdaptiveTokenBucket(0, clock=self.clock, sleep=self.sleep),
+                         CircuitBreaker(failure_threshold=2, reset_timeout=60, clock=self.clock))
+        generator = AIConceptGenerator("key", "https://api.test", "model", retry_delay=1,
+                                       guard=guard, **kwargs)
+        generator._session = Mock()
+        return generator
+    
+    def test_throttled_request_honours_retry_after(self):
+        """Test that a 429 waits for Retry-After and is then retried"""
+        generator = self._generator()
+        generator._session.post.side_effect = [
+            self._response(429, headers={"Retry-After": "7"}),
+            self._response(200, "# Concept"),
+        ]
+        
+        with patch('src.ai_generator.time.sleep') as mock_sleep, patch('builtins.print'):
+            self.assertEqual(generator.complete("prompt"), "# Concept")
+        
+        self.assertEqual(mock_sleep.call_args[0][0], 7)
+        self.assertEqual(generator.throttle_state()['throttled'], 1)
+        self.assertEqual(generator.throttle_state()['circuit'], 'closed')
+    
+    def test_client_errors_are_not_retried(self):
+        """Test that a 400 fails immediately"""
+        generator = self._generator()
+        generator._session.post.return_value = self._response(400)
+        
+        with self.assertRaises(APIError) as ctx:
+            generator.complete("prompt")
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(generator._session.post.call_count, 1)
+    
+    def test_circuit_opens_and_fails_fast(self):
+        """Test that repeated server errors open the circuit for later calls"""
+        generator = self._generator(max_retries=2)
+        generator._session.post.return_value = self._response(503)
+        
+        with patch('src.ai_generator.time.sleep'), patch('builtins.print'):
+            with self.assertRaises(Exception):
+                generator.complete("prompt")
+            with self.assertRaises(CircuitOpenError):
+                generator.complete("prompt")
+        
+        self.assertEqual(generator._session.post.call_count, 2)
+        self.assertEqual(generator.throttle_state()['circuit'], 'open')
+    
+    def test_probe_failing_unexpectedly_reopens_the_circuit(self):
+        """Test that a half-open probe raising outside the API error model does not wedge the breaker"""
+        generator = self._generator(max_retries=2)
+        generator._session.post.return_value = self._response(503)
+        with patch('src.ai_generator.time.sleep'), patch('builtins.print'):
+            with self.assertRaises(Exception):
+                generator.complete("prompt")
+        
+        self.now[0] = 60
+        generator._session.post.side_effect = RuntimeError("decoder crashed")
+        with self.assertRaises(RuntimeError):
+            generator.complete("prompt")
+        self.assertEqual(generator.throttle_state()['circuit'], 'open')
+        
+        self.now[0] = 1000
+        generator._session.post.side_effect = None
+        generator._session.post.return_value = self._response(200, "")
+        with self.assertRaises(APIError) as ctx:
+            generator.complete("prompt")
+        self.assertIn("No content generated", str(ctx.exception))
+        self.assertEqual(generator.throttle_state()['circuit'], 'closed')
+        
+        generator._session.post.return_value = self._response(200, "# Concept")
+        self.assertEqual(generator.complete("prompt"), "# Concept")
+
+
+class TestProviderRouter(unittest.TestCase):
+    """Test latency-aware provider routing and hedged requests"""
+    
+    def _router(self, **kwargs):
+        from src.providers import Provider, ProviderRouter
+        
+        providers = [Provider('primary', 'https://primary.test', 'model-a', 'key-a'),
+                     Provider('backup', 'https://backup.test', 'model-b', 'key-b')]
+        return ProviderRouter(providers, **kwargs), providers
+    
+    def test_ranking_follows_latency_and_error_rate(self):
+        """Test priority order until measured, then EWMA latency inflated by errors"""
+        from src.providers import parse_providers
+        
+        router, (primary, backup) = self._router(alpha=0.5)
+        self.assertEqual(router.ranked(), [primary, backup])
+        router.record(primary, 2.0)
+        router.record(backup, 1.0)
+        self.assertEqual(router.ranked(), [backup, primary])
+        router.record(backup, None, ok=False)
+        router.record(backup, None, ok=False)
+        self.assertEqual(router.ranked(), [primary, backup])
+        self.assertEqual(router.state()['backup']['error_rate'], 0.75)
+        
+        with patch.dict(os.environ, {'BACKUP_KEY': 'secret'}):
+            parsed = parse_providers("groq=https://groq.test/v1/chat/completions|llama|BACKUP_KEY, local=http://127.0.0.1:8000|m")
+        self.assertEqual([(p.name, p.model, p.api_key) for p in parsed],
+                         [('groq', 'llama', 'secret'), ('local', 'm', '')])
+        with self.assertRaises(ValueError):
+            parse_providers("broken=https://no-model.test")
+    
+    def test_slow_primary_is_hedged_and_backup_wins(self):
+        """Test that a request past the primary's p95 is sent to the backup too"""
+        import threading
+        import time
+        
+        router, (primary, backup) = self._router(hedge_min_samples=3, hedge_min_delay=0.0)
+        for _ in range(3):
+            router.record(primary, 0.05)
+        self.assertEqual(router.hedge_delay(primary), 0.05)
+        release = threading.Event()
+        
+        def attempt(provider):
+            if provider is primary:
+                release.wait(5)
+                return 'slow'
+            return 'fast'
+        
+        start = time.perf_counter()
+        self.assertEqual(router.call(attempt), 'fast')
+        self.assertLess(time.perf_counter() - start, 1)
+        release.set()
+        self.assertEqual(router.stats['backup'].samples, 1)
+    
+    def test_latency_excludes_waits_before_the_request(self):
+        """Test that rate-limiter waits inside an attempt are not recorded as provider latency"""
+        import time
+        from src.providers import start_request_clock
+        
+        router, (primary, backup) = self._router(alpha=1.0)
+        
+        def attempt(provider):
+            time.sleep(0.2)
+            start_request_clock()
+            return 'ok'
+        
+        self.assertEqual(router.call(attempt), 'ok')
+        self.assertLess(router.state()['primary']['latency'], 0.1)
+    
+    def test_each_failure_moves_on_to_the_next_backup(self):
+        """Test that the request reaches every ranked backup until one succeeds"""
+        from src.providers import Provider, ProviderRouter
+        
+        providers = [Provider(name, f'https://{name}.test', 'model', 'key') for name in ('a', 'b', 'c')]
+        router = ProviderRouter(providers)
+        tried = []
+        
+        def attempt(provider):
+            tried.append(provider.name)
+            if provider.name != 'c':
+                raise ConnectionError(provider.name)
+            return 'ok'
+        
+        self.assertEqual(router.call(attempt), 'ok')
+        self.assertEqual(tried, ['a', 'b', 'c'])
+        self.assertEqual(router.ranked()[0].name, 'c')
+    
+    def test_hedge_delay_is_kept_per_request_class(self):
+        """Test that short and long requests get hedge delays from their own latencies"""
+        router, (primary, backup) = self._router(hedge_min_samples=3, hedge_min_delay=0.0)
+        for _ in range(3):
+            router.record(primary, 0.05, request_class=200)
+            router.record(primary, 4.0, request_class=2000)
+        
+        self.assertEqual(router.hedge_delay(primary, 200), 0.05)
+        self.assertEqual(router.hedge_delay(primary, 2000), 4.0)
+        self.assertIsNone(router.hedge_delay(primary, 600))
+        self.assertEqual(router.stats['primary'].samples, 6)
+    
+    def test_backup_requests_pass_the_backup_guard(self):
+        """Test that a failover request is refused by the backup's open circuit and throttled by its 429s"""
+        router, (primary, backup) = self._router()
+        generator = AIConceptGenerator('key-a', 'https://primary.test', 'model-a', router=router,
+                                       max_retries=1)
+        backup_guard = ApiGuard(AdaptiveTokenBucket(0), CircuitBreaker(failure_threshold=1))
+        generator._provider_guards['backup'] = backup_guard
+        generator._session, generator._provider_sessions['backup'] = Mock(), Mock()
+        generator._session.post.return_value = Mock(status_code=503, text="overloaded", headers={})
+        generator._provider_sessions['backup'].post.return_value = Mock(
+            status_code=429, text="slow down", headers={"Retry-After": "30"})
+        
+        with self.assertRaises(Exception), patch('builtins.print'):
+            generator.complete("prompt")
+        self.assertEqual(backup_guard.state()['throttled'], 1)
+        self.assertEqual(generator.throttle_state()['circuit'], 'closed')
+        
+        backup_guard.breaker.record_failure()
+        generator._provider_sessions['backup'].post.reset_mock()
+        with self.assertRaises(Exception), patch('builtins.print'):
+            generator.complete("prompt")
+        generator._provider_sessions['backup'].post.assert_not_called()
+    
+    def test_failed_primary_fails_over_and_generator_uses_provider_model(self):
+        """Test failover on an error and that each provider gets its own URL, model and session"""
+        router, (primary, backup) = self._router()
+        generator = AIConceptGenerator('key-a', 'https://primary.test', 'model-a', router=router)
+        primary_session, backup_session = Mock(), Mock()
+        generator._session = primary_session
+        generator._provider_sessions['backup'] = backup_session
+        primary_session.post.return_value = Mock(status_code=503, text="overloaded", headers={})
+        ok = Mock(status_code=200)
+        ok.json.return_value = {"choices": [{"message": {"content": "# Concept"}}], "usage": {"total_tokens": 9}}
+        backup_session.post.return_value = ok
+        
+        self.assertEqual(generator.complete("prompt"), "# Concept")
+        self.assertEqual(generator.last_usage, {"total_tokens": 9})
+        self.assertEqual(backup_session.post.call_args.args[0], 'https://backup.test')
+        self.assertEqual(backup_session.post.call_args.kwargs['json']['model'], 'model-b')
+        self.assertEqual(router.ranked(), [backup, primary])
+        
+        # Every provider failing surfaces the best-ranked one's error for the retry logic
+        backup_session.post.return_value = Mock(status_code=500, text="down", headers={})
+        with self.assertRaises(APIError) as ctx:
+            router.call(lambda provider: generator._request_provider(provider, {"model": "model-a"}))
+        self.assertEqual(ctx.exception.status_code, 500)
+
+
+class TestFanOutScheduler(unittest.TestCase):
+    """Test cases for segment fan-out"""
+    
+    CONTENT = "## 1. Liquid Neural Networks\n\nBody text."
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        import tempfile
+        from datetime import datetime, timezone
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.registry = SubscriberRegistry(os.path.join(self.tmp_dir.name, 'subscribers.json'))
+        self.registry.save([
+            Subscriber("ada@example.com", "Ada Lovelace", timezone="Europe/London", send_hour=8),
+            Subscriber("alan@gmail.com", "Alan Turing", timezone="Europe/London", send_hour=8),
+            Subscriber("yann@example.fr", "Yann", language="fr", timezone="Europe/Paris", send_hour=9),
+            Subscriber("late@example.com", "Late", timezone="America/New_York", send_hour=8),
+            Subscriber("off@example.com", "Off", active=False),
+        ])
+        self.now = datetime(2026, 1, 15, 9, 30, tzinfo=timezone.utc)
+        self.generate = Mock(side_effect=lambda segment, date: self.CONTENT)
+        self.record = Mock()
+        self.sender = Mock()
+        self.sender.send_bulk.side_effect = lambda messages, **kwargs: [
+            SendResult(m['to_email'], True) for m in messages
+        ]
+        self.scheduler = FanOutScheduler(
+            self.generate, self.record, self.sender,
+            CheckpointStore(os.path.join(self.tmp_dir.name, 'checkpoints')),
+            subject="Daily"
+        )
+        # An earlier hourly run already delivered the New York subscriber's last issue
+        self.scheduler.checkpoints.mark_sent(issue_key("2026-01-14", "late@example.com", "Daily"),
+                                             "", [], stored=True)
+    
+    def tearDown(self):
+        """Clean up test fixtures"""
+        self.tmp_dir.cleanup()
+    
+    def test_plan_batches_due_subscribers_into_windows(self):
+        """Test that windows follow segment and local time"""
+        windows = self.scheduler.plan(self.registry.active(), self.now)
+        
+        self.assertEqual([(w.segment.slug, w.timezone, len(w.subscribers)) for w in windows],
+                         [("general-en", "Europe/London", 2), ("general-fr", "Europe/Paris", 1)])
+        self.assertEqual(windows[0].local_date, "2026-01-15")
+    
+    def test_run_generates_once_per_segment_and_never_resends(self):
+        """Test fan-out delivery, history updates and idempotent reruns"""
+        report = self.scheduler.run(self.registry.active(), self.now)
+        
+        self.assertEqual(report.sent, 3)
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertEqual(self.record.call_count, 2)
+        self.record.assert_any_call(Segment('general', 'fr'), ["Liquid Neural Networks"])
+        messages = self.sender.send_bulk.call_args[0][0]
+        ada = next(m for m in messages if m['to_email'] == "ada@example.com")
+        self.assertIn(b"Ada", ada['body'].message_bytes("from@example.com", ada['to_email'], "Daily",
+                                                        **ada['values']))
+        self.assertEqual(len({id(m['body']) for m in messages}), 2)
+        
+        rerun = self.scheduler.run(self.registry.active(), self.now)
+        self.assertEqual(rerun.results, [])
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertEqual(self.record.call_count, 2)
+    
+    def test_run_before_send_hour_catches_up_on_missed_issue(self):
+        """Test that a subscriber not reached by yesterday's run gets that issue"""
+        self.scheduler.checkpoints = CheckpointStore(os.path.join(self.tmp_dir.name, 'fresh'))
+        windows = {w.timezone: w.local_date for w in self.scheduler.plan(self.registry.active(), self.now)}
+        self.assertEqual(windows["America/New_York"], "2026-01-14")
+        self.assertEqual(windows["Europe/London"], "2026-01-15")
+        
+        report = self.scheduler.run(self.registry.active(), self.now)
+        self.assertEqual(report.sent, 4)
+        self.generate.assert_any_call(Segment('general', 'en'), "2026-01-14")
+        self.assertEqual(self.scheduler.plan(self.registry.active(), self.now), [])
+    
+    def test_open_circuit_defers_segments(self):
+        """Test that segments are deferred, unmarked, while the API circuit is open"""
+        self.scheduler.api_state = lambda: {'circuit': 'open', 'paused_for': 0}
+        report = self.scheduler.run(self.registry.active(), self.now)
+        
+        self.assertEqual(len(report.deferred), 2)
+        self.generate.assert_not_called()
+        self.assertEqual(len(self.scheduler.plan(self.registry.active(), self.now)), 2)
+    
+    def test_segment_prompt(self):
+        """Test that segment interest and language reach the prompt"""
+        generator = AIConceptGenerator("key", "https://api.test", "model",
+                                       interest="computer vision", language="fr")
+        prompt = generator._create_prompt([], count=5)
+        
+        self.assertIn("computer vision", prompt)
+        self.assertIn("French", prompt)
+        self.assertNotIn("French", AIConceptGenerator("key", "https://api.test", "model")._create_prompt([]))
+
+
+class TestBacklog(unittest.TestCase):
+    """Test cases for the prefetched issue backlog"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backlog = IssueBacklog(os.path.join(self.tmp_dir.name, 'backlog.db'))
+    
+    def tearDown(self):
+        """Clean up test fixtures"""
+        self.backlog.close()
+        self.tmp_dir.cleanup()
+    
+    @staticmethod
+    def batch(*titles):
+        """Concepts text with one section per title"""
+        return "\n\n".join(f"## {i}. {title}\n\nAbout {title}." for i, title in enumerate(titles, 1))
+    
+    def test_build_issues_skips_repeats_and_groups_sections(self):
+        """Test de-duplication against history and within the batch"""
+        texts = [self.batch("Attention", "Dropout", "Batch Normalization"),
+                 self.batch("Dropout", "Beam Search", "Knowledge Distillation")]
+        issues = build_issues(texts, ["attention"], concepts_per_issue=2)
+        
+        self.assertEqual([parse_markdown(i).titles(None) for i in issues],
+                         [["Dropout", "Batch Normalization"], ["Beam Search", "Knowledge Distillation"]])
+        self.assertIn("## 1. Beam Search", issues[1])
+    
+    def test_queue_order_and_sent_issue_cleanup(self):
+        """Test FIFO order, duplicate pushes and dropping already-sent issues"""
+        first, second = self.batch("Dropout", "Beam Search"), self.batch("Tokenization", "Pruning")
+        self.assertEqual(self.backlog.push('general-en', [first, second, first]), 2)
+        self.assertEqual(self.backlog.size('general-fr'), 0)
+        
+        self.assertEqual(self.backlog.peek('general-en').concepts_text, first)
+        entry = self.backlog.peek('general-en', sent_titles=["Dropout", "Beam Search"])
+        self.assertEqual(entry.titles, ["Tokenization", "Pruning"])
+        self.assertEqual(self.backlog.size('general-en'), 1)
+    
+    def test_fill_batches_requests_up_to_target(self):
+        """Test that one fill tops the queue up with a few batched requests"""
+        generator = MagicMock()
+        generator.__enter__.return_value = generator
+        generator.generate_batch.return_value = [
+            self.batch("Dropout", "Beam Search", "Pruning"),
+            self.batch("Tokenization", "Quantization", "Dropout"),
+        ]
+        filler = BacklogFiller(lambda: generator, self.backlog, concepts_per_issue=2,
+                               concepts_per_request=3)
+        
+        self.assertEqual(filler.fill('general-en', ["Pruning"], target=2), 2)
+        previous, request_count, per_request, focuses = generator.generate_batch.call_args[0]
+        self.assertEqual((previous, request_count, per_request), (["Pruning"], 2, 3))
+        self.assertEqual(self.backlog.titles('general-en'),
+                         ["Dropout", "Beam Search", "Tokenization", "Quantization"])
+        self.assertEqual(filler.fill('general-en', [], target=2), 0)
+        self.assertEqual(generator.generate_batch.call_count, 1)
+
+
+class TestOutbox(unittest.TestCase):
+    """Test the durable outbox and its delivery worker"""
+    
+    def setUp(self):
+        """Set up a temporary outbox"""
+        import tempfile
+        from src.outbox import Outbox
+        
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.outbox = Outbox(os.path.join(self.tmp_dir.name, 'outbox.db'))
+    
+    def tearDown(self):
+        """Clean up"""
+        self.outbox.close()
+        self.tmp_dir.cleanup()
+    
+    def test_enqueue_is_idempotent_and_claims_are_leased(self):
+        """Test keyed enqueueing, leases that expire, and dead-letter requeueing"""
+        import time
+        
+        message = ('issue-a', 'from@example.com', 'a@example.com', b'Subject: Hi\r\n\r\nBody')
+        self.assertEqual(self.outbox.enqueue([message]), 1)
+        self.assertEqual(self.outbox.enqueue([message]), 0)
+        
+        claimed = self.outbox.claim(10, lease=60)
+        self.assertEqual([(e.to_email, e.data) for e in claimed], [('a@example.com', message[3])])
+        self.assertEqual(self.outbox.claim(10, lease=60), [])
+        self.assertEqual(len(self.outbox.claim(10, now=time.time() + 61)), 1)
+        
+        self.outbox.dead_letter(claimed[0].id, "550 no such user")
+        self.assertEqual(self.outbox.counts()['dead'], 1)
+        self.assertEqual(self.outbox.dead_letters(), [('a@example.com', 1, "550 no such user")])
+        self.assertEqual(self.outbox.retry_dead(), 1)
+        entry = self.outbox.claim(10)[0]
+        self.outbox.mark_sent(entry.id)
+        self.assertEqual(self.outbox.counts(), {'pending': 0, 'sending': 0, 'sent': 1, 'dead': 0})
+        self.assertIsNone(self.outbox.next_due())
+    
+    def test_worker_defers_4xx_and_dead_letters_5xx(self):
+        """Test per-message retry state from SMTP replies"""
+        import smtplib
+        import time
+        from src.outbox import DeliveryWorker
+        
+        self.outbox.enqueue([(f"k{n}", 'from@example.com', f"{name}@example.com", b'data')
+                             for n, name in enumerate(('ok', 'later', 'bounce'))])
+        replies = {
+            'ok@example.com': {},
+            'later@example.com': smtplib.SMTPRecipientsRefused({'later@example.com': (451, b'Try later')}),
+            'bounce@example.com': smtplib.SMTPDataError(554, b'Rejected'),
+        }
+        
+        def sendmail(from_email, to_email, data):
+            reply = replies[to_email]
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+        
+        sender = Mock(pool_size=2)
+        sender.pool.sendmail.side_effect = sendmail
+        worker = DeliveryWorker(self.outbox, sender, retry_delay=30, max_attempts=2)
+        report = worker.drain()
+        
+        self.assertEqual(report.sent, 1)
+        self.assertEqual([to for to, _ in report.deferred], ['later@example.com'])
+        self.assertEqual([to for to, _ in report.dead], ['bounce@example.com'])
+        self.assertGreater(self.outbox.next_due(), time.time() + 10)
+        self.assertEqual(worker.drain().attempted, 0)
+        
+        # Without a deferral the retry comes in the same drain and exhausts max_attempts
+        self.outbox.enqueue([('k3', 'from@example.com', 'later@example.com', b'data')])
+        report = DeliveryWorker(self.outbox, sender, retry_delay=0, max_attempts=2).drain()
+        self.assertEqual(len(report.deferred), 1)
+        self.assertEqual([to for to, _ in report.dead], ['later@example.com'])
+        self.assertTrue(self.outbox.dead_letters()[0][2].startswith("Gave up after 2 attempts"))
+        self.assertEqual(self.outbox.counts(), {'pending': 1, 'sending': 0, 'sent': 1, 'dead': 2})
+    
+    def test_login_failure_stops_the_drain(self):
+        """Test that a server-level failure releases the batch without using up attempts"""
+        import smtplib
+        import time
+        from src.outbox import DeliveryWorker
+        
+        self.outbox.enqueue([(f"k{n}", 'from@example.com', f"r{n}@example.com", b'data') for n in range(3)])
+        sender = Mock(pool_size=1)
+        sender.pool.sendmail.side_effect = smtplib.SMTPAuthenticationError(535, b'Bad credentials')
+        report = DeliveryWorker(self.outbox, sender, batch_size=3, max_attempts=1).drain()
+        
+        self.assertEqual((report.sent, len(report.deferred), len(report.dead)), (0, 0, 0))
+        self.assertEqual(report.released, 3)
+        self.assertIn("Bad credentials", report.server_error)
+        self.assertEqual(sender.pool.sendmail.call_count, 1)
+        self.assertEqual(self.outbox.counts()['pending'], 3)
+        self.assertEqual([e.attempts for e in self.outbox.claim(10, now=time.time() + 120)], [0, 0, 0])
+    
+    def test_pipeline_records_history_before_delivery(self):
+        """Test that main() updates storage even when SMTP fails, and a rerun delivers"""
+        import smtplib
+        import main
+        from src.outbox import Outbox
+        
+        overrides = {
+            'perplexity_api_key': 'key', 'from_email': 'from@example.com',
+            'to_email': 'to@example.com', 'app_password': 'pw',
+            'storage_file': os.path.join(self.tmp_dir.name, 'concepts.json'),
+            'storage_backend': 'json',
+            'checkpoint_dir': os.path.join(self.tmp_dir.name, 'checkpoints'),
+            'archive_dir': os.path.join(self.tmp_dir.name, 'archive'),
+            'search_index_file': os.path.join(self.tmp_dir.name, 'search.db'),
+            'metrics_jsonl_file': os.path.join(self.tmp_dir.name, 'metrics.jsonl'),
+            'metrics_prometheus_file': os.path.join(self.tmp_dir.name, 'metrics.prom'),
+            'outbox_enabled': True, 'outbox_deliver_inline': True, 'outbox_retry_delay': 0.0,
+            'outbox_file': self.outbox.db_file,
+        }
+        sender = MagicMock(pool_size=1)
+        sender.__enter__.return_value = sender
+        sender.pool.sendmail.side_effect = [smtplib.SMTPServerDisconnected("timeout"), {}]
+        
+        with patch.multiple(main.config, **overrides), \
+                patch.object(main, 'generate_issue', return_value="## 1. Liquid Neural Networks\n\nBody.") as generate, \
+                patch.object(main, 'EmailSender', return_value=sender), \
+                patch('builtins.print'):
+            self.assertEqual(main.main(), 0)
+            self.assertEqual(self.outbox.counts()['pending'], 1)
+            self.assertEqual(ConceptStorage(overrides['storage_file']).load_concepts(), ["Liquid Neural Networks"])
+            self.assertEqual(main.main(), 0)
+        
+        generate.assert_called_once()
+        self.assertEqual(self.outbox.counts()['sent'], 1)
+        to_email, data = sender.pool.sendmail.call_args.args[1:]
+        self.assertEqual(to_email, 'to@example.com')
+        self.assertIn(b'Subject:', data)
+
+class TestIssueArchive(unittest.TestCase):
+    """Test cases for the compressed issue archive"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp_dir.name, 'archive')
+    
+    def tearDown(self):
+        """Clean up test fixtures"""
+        self.tmp_dir.cleanup()
+    
+    @staticmethod
+    def issue(day):
+        """Concepts text for a day"""
+        return (f"## 1. Concept {day}A\n\n" + "Explanation. " * 50
+                + f"\n\n## 2. Concept {day}B\n\n**Example**: something.")
+    
+    def test_round_trip_and_concept_lookup(self):
+        """Test that issues and concepts load back after reopening"""
+        archive = IssueArchive(self.directory)
+        archive.append("2026-01-01", self.issue(1), "<html>1</html>")
+        archive.append("2026-01-02", self.issue(2), "<html>2</html>", segment="general-fr")
+        
+        reopened = IssueArchive(self.directory)
+        self.assertEqual(len(reopened), 2)
+        issue = reopened.get_issue("2026-01-01")
+        self.assertEqual(issue['response'], self.issue(1))
+        self.assertEqual(issue['html'], "<html>1</html>")
+        self.assertEqual([c['title'] for c in issue['concepts']], ["Concept 1A", "Concept 1B"])
+        self.assertIsNone(reopened.get_issue("2026-01-02"))
+        
+        concept = reopened.find_concept("concept 2b")
+        self.assertEqual((concept['date'], concept['segment']), ("2026-01-02", "general-fr"))
+        self.assertIn("**Example**", concept['markdown'])
+    
+    def test_appends_are_compressed_idempotent_and_touch_the_newest_segment(self):
+        """Test segment rollover, compression and re-archiving the same issue"""
+        archive = IssueArchive(self.directory, max_segment_bytes=400)
+        first = archive.append("2026-01-01", self.issue(1))
+        self.assertLess(first.length, len(self.issue(1)))
+        self.assertEqual(archive.append("2026-01-01", self.issue(1)), first)
+        
+        second = archive.append("2026-01-02", self.issue(2))
+        self.assertNotEqual(first.file, second.file)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ["issues-000001.idx", "issues-000001.seg",
+                          "issues-000002.idx", "issues-000002.seg"])
+        self.assertEqual(IssueArchive(self.directory).get_issue("2026-01-01")['response'], self.issue(1))
+    
+    def test_recovers_from_a_torn_write(self):
+        """Test that bytes after the last indexed record are discarded"""
+        archive = IssueArchive(self.directory)
+        archive.append("2026-01-01", self.issue(1))
+        with open(os.path.join(self.directory, "issues-000001.seg"), 'ab') as f:
+            f.write(b"partial record")
+        with open(os.path.join(self.directory, "issues-000001.idx"), 'a', encoding='utf-8') as f:
+            f.write('{"id": 2, "da')
+        
+        reopened = IssueArchive(self.directory)
+        self.assertEqual(len(reopened), 1)
+        reopened.append("2026-01-02", self.issue(2))
+        self.assertEqual(IssueArchive(self.directory).get_issue("2026-01-02")['response'], self.issue(2))
+
+
+class TestConceptSearch(unittest.TestCase):
+    """Test cases for the full-text concept index"""
+    
+    ISSUE = (
+        "## 1. Retrieval-Augmented Generation\n\nGrounds answers in retrieved documents.\n\n"
+        "## 2. Dropout\n\nRandomly zeroes activations to regularize networks.\n\n"
+        "## 3. Vector Databases\n\nStore embeddings for fast retrieval of similar documents."
+    )
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index = ConceptIndex(os.path.join(self.tmp_dir.name, 'search.db'))
+    
+    def tearDown(self):
+        """Clean up test fixtures"""
+        self.index.close()
+        self.tmp_dir.cleanup()
+    
+    def test_tokenize_stems_and_drops_stopwords(self):
+        """Test that inflections share a term"""
+        self.assertEqual(tokenize("The retrieved Networks"), ["retriev", "network"])
+        self.assertEqual({stem(w) for w in ("retrieval", "retrieve", "retrieving")}, {"retriev"})
+    
+    def test_bm25_ranks_title_matches_first(self):
+        """Test ranking, snippets and segment filtering"""
+        self.assertEqual(self.index.add_issue("2026-01-01", self.ISSUE), 3)
+        self.index.add_issue("2026-01-02", "## 1. Attention\n\nWeights tokens.", segment="general-fr")
+        
+        hits = self.index.search("have we covered retrieval augmented generation?")
+        self.assertEqual([h.title for h in hits], ["Retrieval-Augmented Generation", "Vector Databases"])
+        self.assertEqual(hits[0].date, "2026-01-01")
+        self.assertEqual(hits[0].snippet, "Grounds answers in retrieved documents.")
+        self.assertEqual(self.index.search("attention", segment="general-en"), [])
+        self.assertEqual(self.index.search("quantum"), [])
+    
+    def test_sync_indexes_only_new_archive_entries(self):
+        """Test incremental updates from the archive"""
+        archive = IssueArchive(os.path.join(self.tmp_dir.name, 'archive'))
+        archive.append("2026-01-01", self.ISSUE)
+        self.assertEqual(self.index.sync(archive), 3)
+        
+        archive.append("2026-01-02", "## 1. Attention\n\nWeights tokens by relevance.")
+        with patch.object(archive, 'read', wraps=archive.read) as read:
+            self.assertEqual(self.index.sync(archive), 1)
+        read.assert_called_once()
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.search("attention")[0].date, "2026-01-02")
+
+
+class TestDaemon(unittest.TestCase):
+    """Test the cron schedule, catch-up, warm-up and reloads of the daemon"""
+    
+    def _clock(self, start):
+        """Fake clock whose sleep advances time"""
+        from datetime import timedelta
+        now = [start]
+        
+        def sleep(seconds):
+            now[0] += timedelta(seconds=seconds)
+        
+        return (lambda: now[0]), sleep
+    
+    def test_cron_schedule(self):
+        """Test next and previous fire times, ranges, steps, names and timezones"""
+        from datetime import datetime, timezone
+        from src.daemon import CronSchedule
+        
+        utc = timezone.utc
+        schedule = CronSchedule('*/15 9-17 * * mon-fri')
+        friday = datetime(2024, 3, 1, 17, 50, tzinfo=utc)
+        self.assertEqual(schedule.next_after(friday), datetime(2024, 3, 4, 9, 0, tzinfo=utc))
+        self.assertEqual(schedule.previous(friday), datetime(2024, 3, 1, 17, 45, tzinfo=utc))
+        self.assertEqual(schedule.next_after(datetime(2024, 3, 4, 9, 0, tzinfo=utc)),
+                         datetime(2024, 3, 4, 9, 15, tzinfo=utc))
+        
+        # Restricted day and weekday match when either does
+        either = CronSchedule('0 0 13 * 5')
+        self.assertEqual(either.next_after(datetime(2024, 3, 1, 0, 0, tzinfo=utc)).day, 8)
+        
+        algiers = CronSchedule('@daily', 'Africa/Algiers')
+        self.assertEqual(algiers.next_after(datetime(2024, 3, 1, 12, 0, tzinfo=utc)),
+                         datetime(2024, 3, 1, 23, 0, tzinfo=utc))
+        for bad in ('0 8 * *', '61 * * * *', '0 8 * * *x', '*/0 * * * *'):
+            with self.assertRaises(ValueError):
+                CronSchedule(bad)
+        with self.assertRaises(ValueError):
+            CronSchedule('0 8 * * *', 'Mars/Olympus')
+    
+    def test_missed_run_is_caught_up_once(self):
+        """Test that a run missed while down is made up at startup and recorded"""
+        import json
+        import tempfile
+        from datetime import datetime, timedelta, timezone
+        from src.daemon import CronSchedule, Daemon, check_health
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            health_file = os.path.join(temp_dir, 'health.json')
+            clock, sleep = self._clock(datetime(2024, 3, 1, 10, 30, tzinfo=timezone.utc))
+            runs = []
+            
+            def job():
+                runs.append(clock())
+                daemon.stop()
+                return 0
+            
+            daemon = Daemon(job, CronSchedule('0 8 * * *'), health_file, clock=clock, sleep=sleep)
+            daemon.run_forever()
+            self.assertEqual(runs, [datetime(2024, 3, 1, 10, 30, tzinfo=timezone.utc)])
+            with open(health_file) as f:
+                health = json.load(f)
+            self.assertEqual(health['status'], 'stopped')
+            self.assertEqual(health['last_run']['scheduled'], '2024-03-01T08:00:00+00:00')
+            self.assertEqual(health['last_run']['exit_code'], 0)
+            self.assertFalse(check_health(health_file)[0])
+            
+            # After a restart the recorded run is not repeated; the next one fires on time
+            runs.clear()
+            daemon = Daemon(job, CronSchedule('0 8 * * *'), health_file, poll_interval=3600,
+                            clock=clock, sleep=sleep)
+            self.assertIsNone(daemon.missed_run(clock()))
+            daemon.run_forever()
+            self.assertEqual(runs, [datetime(2024, 3, 2, 8, 0, tzinfo=timezone.utc)])
+            
+            # Too long ago to catch up
+            daemon = Daemon(job, CronSchedule('0 8 * * *'), os.path.join(temp_dir, 'new.json'),
+                            catchup=timedelta(hours=1), clock=clock, sleep=sleep)
+            self.assertIsNone(daemon.missed_run(clock() + timedelta(hours=3)))
+    
+    def test_connections_are_warmed_before_each_run_and_reload_applies(self):
+        """Test warm-up timing, jitter bounds, health readiness and reloads on file changes"""
+        import json
+        import tempfile
+        from datetime import datetime, timezone
+        from src.daemon import CronSchedule, Daemon, check_health
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            health_file = os.path.join(temp_dir, 'health.json')
+            env_path = os.path.join(temp_dir, '.env')
+            clock, sleep = self._clock(datetime(2024, 3, 1, 7, 58, tzinfo=timezone.utc))
+            events = []
+            
+            def warm():
+                events.append(('warm', clock()))
+                return {'smtp': '2 connections'}
+            
+            def job():
+                events.append(('run', clock()))
+                with open(health_file) as f:
+                    self.assertTrue(check_health(health_file, now=json.load(f)['heartbeat'])[0])
+                with open(env_path, 'w') as f:
+                    f.write("DAEMON_SCHEDULE=30 8 * * *\n")
+                stamp = len(events)
+                os.utime(env_path, (stamp, stamp))
+                return 0
+            
+            def reload():
+                events.append(('reload', clock()))
+                if len([e for e in events if e[0] == 'run']) == 2:
+                    daemon.stop()
+                return CronSchedule('30 8 * * *')
+            
+            daemon = Daemon(job, CronSchedule('0 8 * * *'), health_file, jitter=20, warmup=30,
+                            warm=warm, reload=reload, watched_files=lambda: [env_path],
+                            poll_interval=15, clock=clock, sleep=sleep)
+            daemon.run_forever()
+        
+        kinds = [kind for kind, _ in events]
+        self.assertEqual(kinds, ['warm', 'run', 'reload', 'warm', 'run', 'reload'])
+        warm_at, run_at = events[0][1], events[1][1]
+        start = datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)
+        self.assertTrue(start <= run_at <= start.replace(second=20))
+        self.assertTrue(0 < (run_at - warm_at).total_seconds() <= 30)
+        # The reloaded schedule fires at 08:30
+        self.assertEqual(events[4][1].replace(second=0, microsecond=0), start.replace(minute=30))
+    
+    def test_heartbeat_continues_during_a_long_run(self):
+        """Test that the health file stays fresh while a run takes longer than max_age"""
+        import tempfile
+        import time
+        from datetime import datetime, timezone
+        from src.daemon import CronSchedule, Daemon, check_health, read_health
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            health_file = os.path.join(temp_dir, 'health.json')
+            observed = []
+            
+            def job():
+                started = read_health(health_file)['heartbeat']
+                for _ in range(3):
+                    time.sleep(0.1)
+                    observed.append(check_health(health_file, max_age=0.08))
+                observed.append(read_health(health_file)['heartbeat'] > started)
+                return 0
+            
+            daemon = Daemon(job, CronSchedule('0 8 * * *'), health_file, poll_interval=0.02)
+            daemon.write_health(status='idle', ready=True)
+            self.assertEqual(daemon.run_once(datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)), 0)
+        
+        self.assertEqual([healthy for healthy, _ in observed[:3]], [True] * 3)
+        self.assertTrue(observed[0][1].startswith('running'))
+        self.assertTrue(observed[3])
+    
+    def test_env_file_is_applied_and_restored(self):
+        """Test that removed keys fall back to the original environment"""
+        import tempfile
+        from src.daemon import EnvFile
+        
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch.dict(os.environ, {'DAEMON_TEST_A': 'original'}):
+            path = os.path.join(temp_dir, '.env')
+            with open(path, 'w') as f:
+                f.write("# settings\nexport DAEMON_TEST_A='from file'\nDAEMON_TEST_B=2\n")
+            env_file = EnvFile(path)
+            env_file.apply()
+            self.assertEqual(os.environ['DAEMON_TEST_A'], 'from file')
+            self.assertEqual(os.environ['DAEMON_TEST_B'], '2')
+            
+            with open(path, 'w') as f:
+                f.write("DAEMON_TEST_C=3\n")
+            env_file.apply()
+            self.assertEqual(os.environ['DAEMON_TEST_A'], 'original')
+            self.assertNotIn('DAEMON_TEST_B', os.environ)
+            self.assertEqual(os.environ['DAEMON_TEST_C'], '3')
+    
+    def test_smtp_pool_warm_up_is_reused_by_sends(self):
+        """Test that warmed SMTP connections serve the next sends without new logins"""
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+        from loadtest.fakes import FakeSMTPServer, SmtpFaults
+        
+        with FakeSMTPServer(SmtpFaults(latency=0)) as server:
+            sender = EmailSender('127.0.0.1', server.port, 'from@example.com', 'pw',
+                                 pool_size=2, use_ssl=False)
+            with sender:
+                self.assertEqual(sender.warm(), 2)
+                self.assertEqual(sender.warm(), 2)
+                sender.send_html_email('a@example.com', 'Hi', '<p>Hello</p>')
+                self.assertEqual(server.stats['connections'], 2)
+                self.assertEqual(server.stats['messages'], 1)
+
+
+class TestProfiling(unittest.TestCase):
+    """Test the stage profiler behind --profile"""
+    
+    def test_spans_get_collapsed_stacks_and_allocation_reports(self):
+        """Test that CPU samples and allocations are attributed to the open span"""
+        import tempfile
+        import time
+        from src.metrics import Metrics
+        from src.profiling import StageProfiler
+        
+        recorder = Metrics()
+        profiler = StageProfiler(interval=0.001, top=3, recorder=recorder)
+        
+        def busy(seconds):
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                pass
+        
+        with profiler:
+            self.assertIs(recorder.profiler, profiler)
+            with recorder.span('stage.render'):
+                with recorder.span('render.format'):
+                    kept = [str(n) * 10 for n in range(20000)]
+                    busy(0.05)
+        self.assertIsNone(recorder.profiler)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            profiler.write(tmp_dir)
+            with open(os.path.join(tmp_dir, 'render.format.collapsed')) as f:
+                lines = f.read().splitlines()
+            with open(os.path.join(tmp_dir, 'allocations.txt')) as f:
+                report = f.read()
+        
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(stack.startswith('stage.render;render.format;'))
+        self.assertIn('busy (test_all.py:', ''.join(lines))
+        self.assertGreater(int(count), 0)
+        self.assertIn('== render.format: net +', report)
+        self.assertIn('test_all.py:', report)
+        self.assertGreater(profiler.net_bytes['stage.render'], 200 * 1024)
+        self.assertEqual(len(kept), 20000)
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Test the benchmark harness on tiny inputs"""
+    
+    def test_suite_runs_and_detects_regressions(self):
+        """Test that every case runs offline and regressions are reported"""
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+        from benchmarks.run import build_cases, compare, run_suite
+        
+        cases = build_cases(sizes=(100,), response_concepts=5, search_issues=3)
+        results = run_suite(cases, repeat=1, min_time=0)
+        
+        self.assertEqual(len(results), len(cases))
+        self.assertIn("storage.sqlite.add_concepts[100]", results)
+        name = "format_content[5]"
+        slow = {name: results[name]["median"] / 10}
+        self.assertEqual([r[0] for r in compare(results, slow, threshold=1.5)], [name])
+        self.assertEqual(compare(results, {name: results[name]["median"]}, threshold=1.5), [])
+
+
+class TestLoadTest(unittest.TestCase):
+    """Test the load-test harness against its fakes"""
+    
+    def test_faults_are_recovered_without_duplicates(self):
+        """Test that deferred and dropped messages are delivered exactly once on later runs"""
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+        from loadtest.fakes import ApiFaults, SmtpFaults
+        from loadtest.run import run_load_test
+        
+        report = run_load_test(
+            recipients=40, segments=2, max_runs=6, rerun_delay=0.05,
+            api_faults=ApiFaults(latency=0.005, rate_429=0.3, retry_after=0.05),
+            smtp_faults=SmtpFaults(latency=0.001, rate_deferral=0.1, rate_421=0.05,
+                                   rate_disconnect=0.05),
+            seed=1
+        )
+        
+        self.assertTrue(report['recovered'], report['missing'])
+        self.assertEqual(report['delivered'], 40)
+        self.assertEqual(report['duplicates'], 0)
+        self.assertGreater(report['smtp_faults_injected'].get('deferred', 0), 0)
+        self.assertIn('p99', report['smtp_send_ms'])
 
 
 if __name__ == '__main__':